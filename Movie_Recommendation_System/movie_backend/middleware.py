@@ -0,0 +1,99 @@
+import logging
+import random
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+from movies.instrumentation import RequestMetrics, measure
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWhiteNoiseMiddleware:
+    """
+    WhiteNoise that can also run natively under ASGI.
+
+    Django runs a sync-only middleware in a single shared thread, so one of
+    them in the stack serializes every request and async views lose their
+    concurrency. Here only requests under STATIC_URL go through the stock
+    (sync) WhiteNoiseMiddleware; everything else is simply awaited.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.whitenoise = WhiteNoiseMiddleware(async_to_sync(get_response))
+        else:
+            self.whitenoise = WhiteNoiseMiddleware(get_response)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.whitenoise(request)
+
+    async def __acall__(self, request):
+        if request.path_info.startswith(settings.STATIC_URL):
+            return await sync_to_async(self.whitenoise)(request)
+        return await self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures a sample of requests (REQUEST_METRICS_SAMPLE_RATE): query count
+    and SQL time, cache hits, misses and time, and TMDb time (see
+    movies.instrumentation).
+
+    Results go out as a Server-Timing header and one log line per request,
+    with the figures also in the record's `request_metrics` attribute for
+    structured handlers. A request that runs the same SQL template
+    REQUEST_METRICS_N_PLUS_ONE_THRESHOLD times or more is also logged as a
+    warning naming the query, which is almost always an N+1 loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def sampled():
+        rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        with measure(RequestMetrics()) as metrics:
+            response = self.get_response(request)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        with measure(RequestMetrics()) as metrics:
+            response = await self.get_response(request)
+        return self.report(request, response, metrics)
+
+    @staticmethod
+    def report(request, response, metrics):
+        response["Server-Timing"] = metrics.server_timing()
+        summary = {"method": request.method, "path": request.path,
+                   "status": response.status_code, **metrics.summary()}
+        logger.info(
+            "%(method)s %(path)s %(status)s %(duration_ms)sms: %(queries)s queries %(sql_ms)sms, "
+            "cache %(cache_hits)s hits %(cache_misses)s misses %(cache_ms)sms, "
+            "tmdb %(tmdb_calls)s calls %(tmdb_ms)sms", summary,
+            extra={"request_metrics": summary},
+        )
+        for sql, count in metrics.repeated_queries():
+            logger.warning("Possible N+1 in %s %s: %s runs of %s", request.method, request.path, count, sql,
+                           extra={"request_metrics": summary})
+        return response
@@ -59,7 +59,8 @@ INSTALLED_APPS = [
 # Middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'movie_backend.middleware.AsyncWhiteNoiseMiddleware',
+    'movie_backend.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -168,9 +169,13 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
-# Redis cache
+# Redis cache; "default" times calls for request metrics and hands them to "redis"
 CACHES = {
     "default": {
+        "BACKEND": "movies.instrumentation.InstrumentedCache",
+        "LOCATION": "redis",
+    },
+    "redis": {
         "BACKEND": "django_redis.cache.RedisCache",
         "LOCATION": os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
         "OPTIONS": {
@@ -179,6 +184,65 @@ CACHES = {
     }
 }
 
+# TMDb HTTP client (pooled keep-alive session per worker process)
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+TMDB_POOL_SIZE = int(os.getenv("TMDB_POOL_SIZE", 10))
+TMDB_CONNECT_TIMEOUT = float(os.getenv("TMDB_CONNECT_TIMEOUT", 3.05))
+TMDB_READ_TIMEOUT = float(os.getenv("TMDB_READ_TIMEOUT", 10))
+TMDB_MAX_RETRIES = int(os.getenv("TMDB_MAX_RETRIES", 2))
+TMDB_BACKOFF_FACTOR = float(os.getenv("TMDB_BACKOFF_FACTOR", 0.3))
+TMDB_NOT_FOUND_CACHE_TIMEOUT = int(os.getenv("TMDB_NOT_FOUND_CACHE_TIMEOUT", 600))  # 404s, per URL
+TMDB_ERROR_CACHE_TIMEOUT = int(os.getenv("TMDB_ERROR_CACHE_TIMEOUT", 10))  # other failures, per URL
+TMDB_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("TMDB_CIRCUIT_FAILURE_THRESHOLD", 5))  # failures that open the circuit
+TMDB_CIRCUIT_FAILURE_WINDOW = int(os.getenv("TMDB_CIRCUIT_FAILURE_WINDOW", 60))  # seconds a streak is remembered
+TMDB_CIRCUIT_COOLDOWN = int(os.getenv("TMDB_CIRCUIT_COOLDOWN", 30))  # seconds to fail fast before a probe
+
+# Cluster-wide TMDb request budget (token bucket in Redis, see movies/ratelimit.py)
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", 40))  # tokens per second, whole cluster
+TMDB_RATE_BURST = float(os.getenv("TMDB_RATE_BURST", 40))  # bucket capacity
+TMDB_RATE_BACKGROUND_RESERVE = float(os.getenv("TMDB_RATE_BACKGROUND_RESERVE", 0.5))  # share background may not use
+TMDB_RATE_INTERACTIVE_MAX_WAIT = float(os.getenv("TMDB_RATE_INTERACTIVE_MAX_WAIT", 1))  # seconds a user may queue
+TMDB_RATE_BACKGROUND_MAX_WAIT = float(os.getenv("TMDB_RATE_BACKGROUND_MAX_WAIT", 30))
+
+# Background TMDb enrichment of Movie rows (see movies/enrichment.py)
+TMDB_ENRICHMENT_ENABLED = os.getenv("TMDB_ENRICHMENT_ENABLED", "True").lower() == "true"
+TMDB_ENRICHMENT_WORKERS = int(os.getenv("TMDB_ENRICHMENT_WORKERS", 2))
+TMDB_ENRICHMENT_BATCH_SIZE = int(os.getenv("TMDB_ENRICHMENT_BATCH_SIZE", 20))
+TMDB_ENRICHMENT_RATE = float(os.getenv("TMDB_ENRICHMENT_RATE", 20))  # TMDb calls per second, per process
+TMDB_ENRICHMENT_MAX_ATTEMPTS = int(os.getenv("TMDB_ENRICHMENT_MAX_ATTEMPTS", 5))
+TMDB_ENRICHMENT_RETRY_DELAY = float(os.getenv("TMDB_ENRICHMENT_RETRY_DELAY", 2))  # seconds, doubled per attempt
+
+# Per-process autocomplete index (see movies/autocomplete.py)
+AUTOCOMPLETE_REFRESH_INTERVAL = int(os.getenv("AUTOCOMPLETE_REFRESH_INTERVAL", 30))  # seconds between refreshes
+AUTOCOMPLETE_REBUILD_INTERVAL = int(os.getenv("AUTOCOMPLETE_REBUILD_INTERVAL", 60 * 60))  # full rebuilds
+AUTOCOMPLETE_PENDING_RECHECK = int(os.getenv("AUTOCOMPLETE_PENDING_RECHECK", 500))  # pending rows re-read per refresh
+
+# Write-behind FavoriteActivity logging (see users/activity.py)
+FAVORITE_ACTIVITY_BATCH_SIZE = int(os.getenv("FAVORITE_ACTIVITY_BATCH_SIZE", 100))
+FAVORITE_ACTIVITY_FLUSH_INTERVAL = float(os.getenv("FAVORITE_ACTIVITY_FLUSH_INTERVAL", 2))  # seconds an event may wait
+
+# Library delta sync (see users/sync.py)
+LIBRARY_SYNC_OVERLAP = int(os.getenv("LIBRARY_SYNC_OVERLAP", 5))  # seconds re-sent on the next sync
+LIBRARY_TOMBSTONE_RETENTION_DAYS = int(os.getenv("LIBRARY_TOMBSTONE_RETENTION_DAYS", 90))  # older tokens resync
+
+# Sampled per-request SQL/cache/TMDb metrics (see movies/instrumentation.py)
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv("REQUEST_METRICS_SAMPLE_RATE", 0.05))  # share of requests, 0 to 1
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv("REQUEST_METRICS_N_PLUS_ONE_THRESHOLD", 5))  # N+1 repeats
+
+# Runs the suite with request metrics off (see movie_backend/test_runner.py)
+TEST_RUNNER = "movie_backend.test_runner.TestRunner"
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'movie_backend.middleware': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Swagger settings
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
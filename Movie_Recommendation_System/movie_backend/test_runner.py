@@ -0,0 +1,19 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the suite with request metrics off, whatever the environment sets,
+    so sampled requests don't log from unrelated tests. Tests that want
+    metrics turn them on with override_settings.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._metrics_off = override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+        self._metrics_off.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._metrics_off.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,5 +1,4 @@
 from django.contrib import admin
-from django.db.models import Avg, Count
 from users.models import MovieRating
 from .models import Movie
 
@@ -9,20 +8,10 @@ class MovieAdmin(admin.ModelAdmin):
     search_fields = ('title', 'tmdb_id')
     list_filter = ('release_date',)
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(
-            avg_rating=Avg('ratings__rating'),
-            rating_count=Count('ratings')
-        )
-
     def average_rating(self, obj):
-        return round(obj.avg_rating or 0, 2)
+        return round(obj.average_rating or 0, 2)
     average_rating.short_description = 'Average Rating'
-
-    def ratings_count(self, obj):
-        return obj.rating_count
-    ratings_count.short_description = 'Ratings Count'
+    average_rating.admin_order_field = 'average_rating'
 
 
 @admin.register(MovieRating)
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class MoviesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'movies'
+
+    def ready(self):
+        import movies.signals  # noqa
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from .instrumentation import install_sql_wrapper
+        from .search import ensure_search_index
+        post_migrate.connect(ensure_search_index, sender=self)
+        connection_created.connect(install_sql_wrapper)
+        for connection in connections.all(initialized_only=True):
+            install_sql_wrapper(connection=connection)
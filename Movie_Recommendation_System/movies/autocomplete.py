@@ -0,0 +1,257 @@
+"""
+Per-process in-memory title prefix index for /api/movies/autocomplete/,
+refreshed and rebuilt from the database in a background thread.
+"""
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+MAX_OFFSET = 255          # word offsets are packed into the low 8 bits of a code
+MEMO_PREFIX_LENGTH = 3    # prefixes up to this length are precomputed
+MEMO_SCAN_THRESHOLD = 200  # longer prefixes matching more entries are memoized too
+MEMO_SIZE = 50            # results kept per memoized prefix (the maximum limit)
+
+
+def normalize(text):
+    """Lowercase, accents stripped, punctuation collapsed: "Amélie!" -> "amelie"."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def word_offsets(normalized):
+    return [m.start() for m in re.finditer(r"\w+", normalized) if m.start() <= MAX_OFFSET]
+
+
+class PrefixIndex:
+    def __init__(self, movies=()):
+        self._lock = threading.Lock()
+        self._titles = {}   # movie pk -> normalized title
+        self._rows = {}     # movie pk -> (rank key, result dict)
+        self._codes = array("q")
+        self._memo = {}
+        self._pending = set()  # movie pks indexed while pending enrichment
+        self.max_id = 0
+        self.build(movies)
+
+    def _suffix(self, code):
+        return self._titles[code >> 8][code & MAX_OFFSET:]
+
+    @staticmethod
+    def _row(movie):
+        result = {
+            "id": movie.id,
+            "tmdb_id": movie.tmdb_id,
+            "title": movie.title,
+            "year": movie.year,
+            "poster_url": movie.poster_url,
+            "ratings_count": movie.ratings_count,
+        }
+        return (-movie.ratings_count, movie.title.lower(), movie.id), result
+
+    @staticmethod
+    def _is_pending(movie):
+        from .models import Movie
+        return movie.enrichment_status == Movie.ENRICHMENT_PENDING
+
+    def build(self, movies):
+        titles, rows, codes, pending = {}, {}, [], set()
+        for movie in movies:
+            normalized = normalize(movie.title)
+            titles[movie.id] = normalized
+            rows[movie.id] = self._row(movie)
+            if self._is_pending(movie):
+                pending.add(movie.id)
+            codes.extend(movie.id << 8 | offset for offset in word_offsets(normalized))
+        codes.sort(key=lambda code: titles[code >> 8][code & MAX_OFFSET:])
+
+        memo = {}
+        for movie_id in sorted(rows, key=lambda pk: rows[pk][0]):
+            for offset in word_offsets(titles[movie_id]):
+                word = titles[movie_id][offset:]
+                for length in range(1, MEMO_PREFIX_LENGTH + 1):
+                    bucket = memo.setdefault(word[:length], [])
+                    if len(bucket) < MEMO_SIZE and (not bucket or bucket[-1] != movie_id):
+                        bucket.append(movie_id)
+
+        with self._lock:
+            self._titles, self._rows, self._memo, self._pending = titles, rows, memo, pending
+            self._codes = array("q", codes)
+            self.max_id = max(rows, default=0)
+
+    def _forget_prefixes(self, normalized, offset):
+        for end in range(offset + 1, len(normalized) + 1):
+            self._memo.pop(normalized[offset:end], None)
+
+    def _remove_locked(self, movie_id):
+        normalized = self._titles.get(movie_id)
+        if normalized is None:
+            return
+        for offset in word_offsets(normalized):
+            code = movie_id << 8 | offset
+            i = bisect.bisect_left(self._codes, normalized[offset:], key=self._suffix)
+            while i < len(self._codes) and self._codes[i] != code:
+                i += 1
+            if i < len(self._codes):
+                del self._codes[i]
+            # Memoized prefixes of this title are recomputed on their next lookup
+            self._forget_prefixes(normalized, offset)
+        del self._titles[movie_id]
+        del self._rows[movie_id]
+        self._pending.discard(movie_id)
+
+    def update(self, movie):
+        """Adds a movie, or re-indexes it after its title or ratings changed."""
+        normalized = normalize(movie.title)
+        with self._lock:
+            self._remove_locked(movie.id)
+            self._titles[movie.id] = normalized
+            self._rows[movie.id] = self._row(movie)
+            if self._is_pending(movie):
+                self._pending.add(movie.id)
+            for offset in word_offsets(normalized):
+                bisect.insort(self._codes, movie.id << 8 | offset, key=self._suffix)
+                self._forget_prefixes(normalized, offset)
+            self.max_id = max(self.max_id, movie.id)
+
+    def remove(self, movie_id):
+        with self._lock:
+            self._remove_locked(movie_id)
+
+    def pending_ids(self, limit):
+        """The `limit` highest pks of movies indexed while pending enrichment."""
+        with self._lock:
+            return heapq.nlargest(limit, self._pending)
+
+    def _scan(self, prefix, limit):
+        """Returns (top `limit` movie ids, number of index entries scanned)."""
+        lo = bisect.bisect_left(self._codes, prefix, key=self._suffix)
+        seen = set()
+        hi = lo
+        while hi < len(self._codes) and self._suffix(self._codes[hi]).startswith(prefix):
+            seen.add(self._codes[hi] >> 8)
+            hi += 1
+        return heapq.nsmallest(limit, seen, key=lambda pk: self._rows[pk][0]), hi - lo
+
+    def search(self, query, limit=10):
+        """Top `limit` movies with a title word starting with `query`, most rated first."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = min(limit, MEMO_SIZE)
+        with self._lock:
+            ids = self._memo.get(prefix)
+            if ids is None:
+                ids, scanned = self._scan(prefix, MEMO_SIZE)
+                if len(prefix) <= MEMO_PREFIX_LENGTH or scanned > MEMO_SCAN_THRESHOLD:
+                    self._memo[prefix] = ids
+            return [self._rows[pk][1] for pk in ids[:limit]]
+
+    def exact(self, title):
+        """The most rated movie whose normalized title is that of `title`, or None."""
+        normalized = normalize(title)
+        if not normalized:
+            return None
+        with self._lock:
+            # Equal suffixes are adjacent; one of them is the whole title
+            i = bisect.bisect_left(self._codes, normalized, key=self._suffix)
+            matches = []
+            while i < len(self._codes) and self._suffix(self._codes[i]) == normalized:
+                if self._codes[i] & MAX_OFFSET == 0:
+                    matches.append(self._codes[i] >> 8)
+                i += 1
+            best = min(matches, key=lambda pk: self._rows[pk][0], default=None)
+            return None if best is None else self._rows[best][1]
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class AutocompleteIndex:
+    """The per-process PrefixIndex plus its background refresh schedule."""
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refreshed_at = self._built_at = 0.0
+
+    @staticmethod
+    def _queryset():
+        from .models import Movie
+        return Movie.objects.only("id", "tmdb_id", "title", "year", "poster_url", "ratings_count",
+                                  "enrichment_status")
+
+    def get(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = PrefixIndex(self._queryset().iterator(chunk_size=5000))
+                    self._refreshed_at = self._built_at = time.monotonic()
+        else:
+            self._maybe_refresh()
+        return self._index
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._refreshed_at < settings.AUTOCOMPLETE_REFRESH_INTERVAL:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._refreshed_at = now
+        rebuild = now - self._built_at >= settings.AUTOCOMPLETE_REBUILD_INTERVAL
+        threading.Thread(target=self._refresh, args=(rebuild,), name="autocomplete-refresh", daemon=True).start()
+
+    def _refresh(self, rebuild):
+        try:
+            close_old_connections()
+            if rebuild:
+                self._index.build(self._queryset().iterator(chunk_size=5000))
+                self._built_at = time.monotonic()
+            else:
+                from .models import Movie
+                pending = self._index.pending_ids(settings.AUTOCOMPLETE_PENDING_RECHECK)
+                enriched = Q(id__in=pending) & ~Q(enrichment_status=Movie.ENRICHMENT_PENDING)
+                for movie in self._queryset().filter(Q(id__gt=self._index.max_id) | enriched).order_by("id"):
+                    self._index.update(movie)
+        except Exception:
+            logger.exception("Refreshing the autocomplete index failed")
+        finally:
+            close_old_connections()
+            self._refreshing = False
+
+    def movie_saved(self, movie):
+        if self._index is not None:
+            self._index.update(movie)
+
+    def movies_saved(self, movies):
+        """movie_saved() for rows written without signals (bulk_update)."""
+        if self._index is not None:
+            for movie in movies:
+                self._index.update(movie)
+
+    def movie_deleted(self, movie_id):
+        if self._index is not None:
+            self._index.remove(movie_id)
+
+    def reset(self):
+        self._index = None
+
+
+autocomplete_index = AutocompleteIndex()
+
+
+def autocomplete(query, limit=10):
+    return autocomplete_index.get().search(query, limit)
@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+from typing import Any, NamedTuple
+from urllib.parse import urlencode
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 30         # seconds a refill lock is held at most
+LOCK_WAIT = 5             # seconds a waiter polls for another worker's refill
+LOCK_POLL_INTERVAL = 0.05
+EARLY_REFRESH_BETA = 1.0  # >1 refreshes earlier, <1 later
+
+
+class CachedResult(NamedTuple):
+    value: Any
+    age: int       # seconds since the value was fetched
+    status: str    # "hit", "stale" or "miss"
+
+    @property
+    def stale(self):
+        return self.status == "stale"
+
+
+def _should_refresh_early(entry, beta=EARLY_REFRESH_BETA):
+    """
+    Probabilistic early expiration ("XFetch"): the closer an entry is to its
+    soft expiry, and the longer it took to compute, the likelier a reader is
+    to refresh it early. Spreads refreshes of hot keys across workers instead
+    of having all of them expire at the same instant.
+    """
+    gap = entry["delta"] * beta * math.log(random.random() or 1e-12)
+    return time.time() - gap >= entry["soft_expires_at"]
+
+
+def _is_entry(value):
+    return isinstance(value, dict) and "value" in value and "soft_expires_at" in value
+
+
+def _entry(value, started, soft_timeout):
+    now = time.time()
+    return {
+        "value": value,
+        "delta": now - started,
+        "fetched_at": now,
+        "soft_expires_at": now + soft_timeout,
+    }
+
+
+def _store(key, loader, soft_timeout, hard_timeout):
+    start = time.time()
+    value = loader()
+    cache.set(key, _entry(value, start, soft_timeout), hard_timeout)
+    return value
+
+
+async def _astore(key, aloader, soft_timeout, hard_timeout):
+    start = time.time()
+    value = await aloader()
+    await cache.aset(key, _entry(value, start, soft_timeout), hard_timeout)
+    return value
+
+
+def _refresh_in_background(key, lock_key, loader, soft_timeout, hard_timeout):
+    def run():
+        try:
+            _store(key, loader, soft_timeout, hard_timeout)
+        except Exception:
+            logger.warning("Background refresh of %s failed; serving stale data", key, exc_info=True)
+        finally:
+            cache.delete(lock_key)
+
+    threading.Thread(target=run, name=f"refresh:{key}", daemon=True).start()
+
+
+def _result(entry, status):
+    return CachedResult(entry["value"], max(0, int(time.time() - entry["fetched_at"])), status)
+
+
+def cached_fetch(key, loader, soft_timeout, hard_timeout=None):
+    """
+    Returns a CachedResult for `key`, calling `loader()` to fill it on a miss.
+
+    Entries are fresh for `soft_timeout` seconds and kept for `hard_timeout`.
+    Between the two the stale value is returned immediately and one worker
+    refreshes it in the background, so upstream slowness or errors never reach
+    the request path while a stale copy exists.
+
+    Only one worker refills a key at a time (a cache.add() lock, which is an
+    atomic SET NX on Redis); on a cold miss the others wait briefly for its
+    result instead of all calling upstream at once.
+    """
+    hard_timeout = hard_timeout or soft_timeout
+    lock_key = f"lock:{key}"
+    entry = cache.get(key)
+
+    if _is_entry(entry):
+        if time.time() < entry["soft_expires_at"]:
+            if _should_refresh_early(entry) and cache.add(lock_key, 1, LOCK_TIMEOUT):
+                _refresh_in_background(key, lock_key, loader, soft_timeout, hard_timeout)
+            return _result(entry, "hit")
+
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            _refresh_in_background(key, lock_key, loader, soft_timeout, hard_timeout)
+        return _result(entry, "stale")
+
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return CachedResult(_store(key, loader, soft_timeout, hard_timeout), 0, "miss")
+        finally:
+            cache.delete(lock_key)
+
+    # Another worker is filling this key: wait for its result.
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if _is_entry(entry):
+            return _result(entry, "hit")
+        if cache.get(lock_key) is None:
+            break
+
+    # The filling worker failed or is too slow; fetch ourselves.
+    return CachedResult(_store(key, loader, soft_timeout, hard_timeout), 0, "miss")
+
+
+async def acached_fetch(key, aloader, loader, soft_timeout, hard_timeout=None):
+    """
+    cached_fetch() for async views, using the async cache API.
+
+    A cold miss awaits `aloader()` in the request. Early and stale refreshes
+    run `loader()` (its sync twin) in a background thread, as in
+    cached_fetch(), so they outlive the request's event loop under WSGI.
+    """
+    hard_timeout = hard_timeout or soft_timeout
+    lock_key = f"lock:{key}"
+    entry = await cache.aget(key)
+
+    if _is_entry(entry):
+        if time.time() < entry["soft_expires_at"]:
+            if _should_refresh_early(entry) and await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+                _refresh_in_background(key, lock_key, loader, soft_timeout, hard_timeout)
+            return _result(entry, "hit")
+
+        if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+            _refresh_in_background(key, lock_key, loader, soft_timeout, hard_timeout)
+        return _result(entry, "stale")
+
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return CachedResult(await _astore(key, aloader, soft_timeout, hard_timeout), 0, "miss")
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if _is_entry(entry):
+            return _result(entry, "hit")
+        if await cache.aget(lock_key) is None:
+            break
+
+    return CachedResult(await _astore(key, aloader, soft_timeout, hard_timeout), 0, "miss")
+
+
+STATUS_ORDER = ("hit", "stale", "miss")
+
+
+def merge_cached_results(results, value):
+    """
+    One CachedResult standing for several (e.g. the pages of a list): the
+    oldest age and the least fresh status ("miss" > "stale" > "hit").
+    """
+    return CachedResult(
+        value,
+        max((r.age for r in results), default=0),
+        max((r.status for r in results), key=STATUS_ORDER.index, default="hit"),
+    )
+
+
+def add_cache_headers(response, result):
+    """Exposes the age and freshness of a CachedResult on an HTTP response."""
+    response["Age"] = str(result.age)
+    response["X-Cache"] = result.status.upper()
+    return response
+
+
+# Versioned cache namespaces ------------------------------------------------
+#
+# Every cached value that must be invalidated on writes lives under a
+# namespace with a generation counter ("ns:<namespace>"). Keys embed the
+# current generation, so invalidation is a single INCR instead of a SCAN
+# for matching keys; superseded keys simply expire.
+
+MOVIES_NAMESPACE = "movies"              # movie rows and their rating aggregates
+SIMILARITIES_NAMESPACE = "similarities"  # anything derived from MovieSimilarity
+
+
+def namespace_version(namespace):
+    """Current generation of a cache namespace (e.g. "favorites:42")."""
+    return cache.get_or_set(f"ns:{namespace}", 1, None)
+
+
+def bump_namespace(namespace):
+    """
+    Invalidates every key built from `namespace` with one INCR: old keys are
+    never read again and simply age out of the cache.
+    """
+    key = f"ns:{namespace}"
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Not set yet (or evicted): start a new generation above the default
+        if cache.add(key, 2, None):
+            return 2
+        return cache.incr(key)
+
+
+def bump_namespace_on_commit(namespace):
+    """
+    bump_namespace() once the current transaction commits (at once outside
+    a transaction). Bumping before the commit would let a concurrent reader
+    cache pre-commit data under the new version, where it stays until it
+    expires.
+    """
+    transaction.on_commit(lambda: bump_namespace(namespace))
+
+
+def versioned_key(namespace, *parts):
+    return ":".join([namespace, f"v{namespace_version(namespace)}", *map(str, parts)])
+
+
+def query_fingerprint(query_params, list_params=(), defaults=None):
+    """
+    Stable hash of a QueryDict: parameter and value order do not matter.
+
+    Values of `list_params` are treated as comma-separated sets, so
+    ?year=2023,2022 and ?year=2022,2023 hash alike. Empty values and values
+    equal to `defaults` (e.g. {"page": "1"}) are dropped.
+    """
+    defaults = defaults or {}
+    items = []
+    for key, values in query_params.lists():
+        if key in list_params:
+            values = {part.strip() for value in values for part in value.split(",")}
+        values = sorted({v.strip() for v in values} - {""})
+        if values and values != [defaults.get(key)]:
+            items.append((key, values))
+    return hashlib.md5(urlencode(sorted(items), doseq=True).encode()).hexdigest()
+
+
+class CachedUserListMixin:
+    """
+    Caches the rendered JSON of a per-user list endpoint, keyed by user,
+    normalized query string (which includes the page) and the user's
+    namespace version. Writers call bump_namespace(f"{cache_namespace}:{user_id}")
+    instead of scanning for keys to delete.
+    """
+    cache_namespace = None
+    cache_timeout = 60 * 5
+
+    @classmethod
+    def user_namespace(cls, user_id):
+        return f"{cls.cache_namespace}:{user_id}"
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return super().list(request, *args, **kwargs)
+
+        key = versioned_key(
+            self.user_namespace(request.user.id), type(self).__name__, query_fingerprint(request.query_params)
+        )
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=request.accepted_media_type)
+            response["X-Cache"] = "HIT"
+            return response
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            response["X-Cache"] = "MISS"
+            response.add_post_render_callback(
+                lambda r: cache.set(key, r.content, self.cache_timeout)
+            )
+        return response
@@ -0,0 +1,141 @@
+"""
+Background TMDb enrichment of pending Movie rows; `manage.py enrich_movies`
+picks up what a restarted process left behind.
+"""
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from .autocomplete import autocomplete_index
+from .caching import MOVIES_NAMESPACE, bump_namespace
+from .ratelimit import BACKGROUND
+from .tmdb import TMDBError
+from .utils import load_tmdb_movie_details
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all worker threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def enrich_batch(tmdb_ids, rate_limiter=None):
+    """
+    Fetches TMDb details for `tmdb_ids` and writes them with one bulk_update.
+    Returns the tmdb_ids that failed with a transient error and may be retried.
+    """
+    from .models import Movie
+
+    movies = {m.tmdb_id: m for m in Movie.objects.filter(tmdb_id__in=tmdb_ids)}
+    retry, changed = [], []
+
+    for tmdb_id, movie in movies.items():
+        if rate_limiter:
+            rate_limiter.wait()
+        try:
+            details = load_tmdb_movie_details(tmdb_id, BACKGROUND)
+        except TMDBError as e:
+            if e.status_code == 404:
+                movie.enrichment_status = Movie.ENRICHMENT_FAILED
+                changed.append(movie)
+            else:
+                retry.append(tmdb_id)
+            continue
+
+        movie.apply_tmdb_details(details)
+        changed.append(movie)
+
+    if changed:
+        Movie.objects.bulk_update(
+            changed, ["title", "release_date", "year", "poster_url", "enrichment_status"]
+        )
+        bump_namespace(MOVIES_NAMESPACE)
+        # bulk_update sends no post_save, so movies.signals never sees these
+        autocomplete_index.movies_saved(changed)
+    return retry
+
+
+class EnrichmentQueue:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self._rate_limiter = RateLimiter(settings.TMDB_ENRICHMENT_RATE)
+
+    def enqueue(self, tmdb_id, attempt=1):
+        with self._lock:
+            if tmdb_id in self._queued:
+                return
+            self._queued.add(tmdb_id)
+            self._ensure_workers()
+        self._queue.put((tmdb_id, attempt))
+
+    def _ensure_workers(self):
+        if self._started:
+            return
+        for i in range(settings.TMDB_ENRICHMENT_WORKERS):
+            threading.Thread(target=self._run, name=f"tmdb-enrichment-{i}", daemon=True).start()
+        self._started = True
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        size = settings.TMDB_ENRICHMENT_BATCH_SIZE
+        while len(batch) < size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            for tmdb_id, _ in batch:
+                self._queued.discard(tmdb_id)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            attempts = dict(batch)
+            try:
+                close_old_connections()
+                retry = enrich_batch(list(attempts), self._rate_limiter)
+            except Exception:
+                logger.exception("TMDb enrichment batch failed")
+                retry = list(attempts)
+            finally:
+                close_old_connections()
+
+            for tmdb_id in retry:
+                self._retry(tmdb_id, attempts[tmdb_id])
+
+    def _retry(self, tmdb_id, attempt):
+        if attempt >= settings.TMDB_ENRICHMENT_MAX_ATTEMPTS:
+            logger.warning("Giving up enriching movie %s after %s attempts", tmdb_id, attempt)
+            return
+        delay = settings.TMDB_ENRICHMENT_RETRY_DELAY * 2 ** (attempt - 1)
+        timer = threading.Timer(delay, self.enqueue, args=(tmdb_id, attempt + 1))
+        timer.daemon = True
+        timer.start()
+
+
+_queue = EnrichmentQueue()
+
+
+def enqueue_enrichment(tmdb_id):
+    """Queues a Movie for background TMDb enrichment (no-op when disabled)."""
+    if settings.TMDB_ENRICHMENT_ENABLED:
+        _queue.enqueue(tmdb_id)
@@ -1,8 +1,11 @@
 import django_filters
+from rest_framework.filters import OrderingFilter, SearchFilter
 from .models import Movie
+from .search import search_movies
 
 class MovieFilter(django_filters.FilterSet):
     year = django_filters.CharFilter(method='filter_year')
+    title = django_filters.CharFilter(method='filter_title')
 
     def filter_year(self, queryset, name, value):
         """
@@ -11,6 +14,35 @@ class MovieFilter(django_filters.FilterSet):
         years = [y.strip() for y in value.split(',') if y.strip().isdigit()]
         return queryset.filter(year__in=years)
 
+    def filter_title(self, queryset, name, value):
+        """
+        Indexed title search: every word must match (as a prefix), results
+        are annotated with search_rank.
+        """
+        return search_movies(queryset, value)
+
     class Meta:
         model = Movie
-        fields = ['year']
\ No newline at end of file
+        fields = ['year', 'title']
+
+
+class MovieSearchFilter(SearchFilter):
+    """?search= backed by the title search index instead of icontains."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        return search_movies(queryset, " ".join(terms))
+
+
+class RankedOrderingFilter(OrderingFilter):
+    """
+    Orders search results by relevance unless the client asked for an
+    explicit ?ordering=.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param) and 'search_rank' in queryset.query.annotations:
+            return ['-search_rank', 'id']
+        return super().get_ordering(request, queryset, view)
@@ -0,0 +1,74 @@
+"""
+Batch hydration of movie lists with local data and the requesting user's
+library state, one query per table for the whole page.
+"""
+from users.models import FavoriteMovie, MovieRating, Watchlist
+from .models import Movie
+
+
+def user_library(user, movie_ids):
+    """
+    Returns (ratings, favorites, watchlist) for the given Movie primary keys:
+    {movie_id: stars}, and two sets of movie ids. Empty for anonymous users.
+    """
+    if not movie_ids or not getattr(user, "is_authenticated", False):
+        return {}, set(), set()
+    movie_ids = list(movie_ids)
+    ratings = dict(MovieRating.objects.filter(user=user, movie_id__in=movie_ids)
+                   .order_by().values_list("movie_id", "rating"))
+    favorites = set(FavoriteMovie.objects.filter(user=user, movie_id__in=movie_ids)
+                    .order_by().values_list("movie_id", flat=True))
+    watchlist = set(Watchlist.objects.filter(user=user, movie_id__in=movie_ids)
+                    .order_by().values_list("movie_id", flat=True))
+    return ratings, favorites, watchlist
+
+
+def hydrate_tmdb_results(results, user):
+    """
+    Returns copies of TMDb result dicts (keyed by TMDb "id") with our own
+    rating aggregates and the user's state added:
+
+        local_id, average_rating, ratings_count      (movies we know)
+        user_rating, is_favorite, in_watchlist       (authenticated users)
+
+    At most four queries whatever the length of `results`.
+    """
+    tmdb_ids = {movie["id"] for movie in results if movie.get("id") is not None}
+    local = {
+        row["tmdb_id"]: row
+        for row in Movie.objects.filter(tmdb_id__in=tmdb_ids).order_by()
+        .values("id", "tmdb_id", "average_rating", "ratings_count")
+    } if tmdb_ids else {}
+    ratings, favorites, watchlist = user_library(user, [row["id"] for row in local.values()])
+    authenticated = getattr(user, "is_authenticated", False)
+
+    hydrated = []
+    for movie in results:
+        movie = dict(movie)
+        row = local.get(movie.get("id"))
+        if row is not None:
+            movie["local_id"] = row["id"]
+            movie["average_rating"] = (round(row["average_rating"], 2)
+                                       if row["average_rating"] is not None else None)
+            movie["ratings_count"] = row["ratings_count"]
+        if authenticated:
+            movie_id = row["id"] if row is not None else None
+            movie["user_rating"] = ratings.get(movie_id)
+            movie["is_favorite"] = movie_id in favorites
+            movie["in_watchlist"] = movie_id in watchlist
+        hydrated.append(movie)
+    return hydrated
+
+
+def apply_favorite_state(rows, user):
+    """
+    Sets `is_favorite` on serialized Movie rows (keyed by local "id") in
+    place, with one query for the whole page.
+    """
+    if not getattr(user, "is_authenticated", False):
+        return rows
+    favorites = set(FavoriteMovie.objects.filter(user=user, movie_id__in=[row["id"] for row in rows])
+                    .order_by().values_list("movie_id", flat=True))
+    for row in rows:
+        row["is_favorite"] = row["id"] in favorites
+    return rows
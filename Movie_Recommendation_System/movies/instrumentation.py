@@ -0,0 +1,194 @@
+"""
+Per-request SQL, cache and TMDb metrics for a sample of requests, collected
+through a context variable set by RequestMetricsMiddleware.
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = Counter()  # SQL template -> executions
+        self.sql_time = 0.0
+        self.cache_calls = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        self.tmdb_calls = 0
+        self.tmdb_time = 0.0  # summed, so concurrent calls can exceed the wall time
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def repeated_queries(self, threshold=None):
+        """[(sql, executions)] for the templates run `threshold` times or more."""
+        threshold = threshold or settings.REQUEST_METRICS_N_PLUS_ONE_THRESHOLD
+        return [(sql, count) for sql, count in self.queries.most_common() if count >= threshold]
+
+    def summary(self):
+        return {
+            "duration_ms": round(self.elapsed * 1000, 1),
+            "queries": self.query_count,
+            "sql_ms": round(self.sql_time * 1000, 1),
+            "repeated_queries": len(self.repeated_queries()),
+            "cache_calls": self.cache_calls,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_ms": round(self.cache_time * 1000, 1),
+            "tmdb_calls": self.tmdb_calls,
+            "tmdb_ms": round(self.tmdb_time * 1000, 1),
+        }
+
+    def server_timing(self):
+        """Value of a Server-Timing header (durations in milliseconds)."""
+        summary = self.summary()
+        db = f'{summary["queries"]} queries'
+        if summary["repeated_queries"]:
+            db += f', {summary["repeated_queries"]} repeated'
+        return ", ".join([
+            f'db;dur={summary["sql_ms"]};desc="{db}"',
+            f'cache;dur={summary["cache_ms"]};desc="{summary["cache_hits"]} hits, {summary["cache_misses"]} misses"',
+            f'tmdb;dur={summary["tmdb_ms"]};desc="{summary["tmdb_calls"]} calls"',
+            f'total;dur={summary["duration_ms"]}',
+        ])
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def measure(metrics):
+    """Makes `metrics` the current RequestMetrics for the enclosed code."""
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed_tmdb_call():
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.tmdb_calls += 1
+        metrics.tmdb_time += time.perf_counter() - start
+
+
+# SQL -----------------------------------------------------------------------
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_time += time.perf_counter() - start
+        metrics.queries[sql] += 1
+
+
+def install_sql_wrapper(sender=None, connection=None, **kwargs):
+    """connection_created receiver; the wrapper is added once per connection."""
+    if sql_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_execute_wrapper)
+
+
+# Cache ---------------------------------------------------------------------
+
+def _count_read(metrics, name, args, kwargs, result):
+    if name in ("get", "aget"):
+        default = args[1] if len(args) > 1 else kwargs.get("default")
+        if result is None or result is default:
+            metrics.cache_misses += 1
+        else:
+            metrics.cache_hits += 1
+    elif name in ("get_many", "aget_many"):
+        keys = list(args[0] if args else kwargs["keys"])
+        metrics.cache_hits += len(result)
+        metrics.cache_misses += len(keys) - len(result)
+
+
+class InstrumentedCache(BaseCache):
+    """
+    Cache backend that passes every call on to the cache alias named in its
+    LOCATION, timing the ones made during a measured request:
+
+        "default": {"BACKEND": "movies.instrumentation.InstrumentedCache", "LOCATION": "redis"},
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.alias = location
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def __getattr__(self, name):
+        # Backend extras such as django-redis's `client`.
+        if name.startswith("_") or name == "alias":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+
+def _timed(name, is_async=False):
+    def call(self, *args, **kwargs):
+        method = getattr(self.backend, name)
+        metrics = _current.get()
+        if metrics is None:
+            return method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        finally:
+            metrics.cache_calls += 1
+            metrics.cache_time += time.perf_counter() - start
+        _count_read(metrics, name, args, kwargs, result)
+        return result
+
+    async def acall(self, *args, **kwargs):
+        method = getattr(self.backend, name)
+        metrics = _current.get()
+        if metrics is None:
+            return await method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            result = await method(*args, **kwargs)
+        finally:
+            metrics.cache_calls += 1
+            metrics.cache_time += time.perf_counter() - start
+        _count_read(metrics, name, args, kwargs, result)
+        return result
+
+    wrapper = acall if is_async else call
+    wrapper.__name__ = name
+    return wrapper
+
+
+CACHE_METHODS = ("add", "get", "set", "touch", "delete", "get_many", "set_many", "delete_many",
+                 "has_key", "incr", "decr", "get_or_set", "clear")
+
+for _name in CACHE_METHODS:
+    setattr(InstrumentedCache, _name, _timed(_name))
+    setattr(InstrumentedCache, "a" + _name, _timed("a" + _name, is_async=True))
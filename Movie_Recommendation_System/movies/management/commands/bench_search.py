@@ -0,0 +1,82 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from movies.models import Movie
+from movies.search import search_movies
+
+WORDS = (
+    "dark knight star wars return empire lord rings fellowship king lion night day "
+    "love story lost city river mountain shadow ghost blade runner alien planet "
+    "space odyssey fire ice storm silent hill green mile red dragon black swan "
+    "golden eye iron man spider web winter summer last first great escape"
+).split()
+QUERIES = ["dark knight", "star", "lost city", "ghost", "iron man", "summer love", "planet", "swan"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ("Benchmark title search (icontains vs the search index) on N synthetic movies. "
+            "The rows are inserted inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="Timed runs per query.")
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Database: {connection.vendor}")
+        with transaction.atomic():
+            self.populate(options["rows"], options["batch_size"])
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE movies_movie")
+
+            size = options["page_size"]
+            self.report("icontains", lambda q: self.run(
+                Movie.objects.filter(title__icontains=q).order_by("-year", "id"), size), options["repeat"])
+            self.report("search index", lambda q: self.run(
+                search_movies(Movie.objects.all(), q).order_by("-search_rank", "id"), size), options["repeat"])
+
+            transaction.set_rollback(True)
+
+    def populate(self, rows, batch_size):
+        rng = random.Random(42)
+        start = time.monotonic()
+        base = (Movie.objects.order_by("-tmdb_id").values_list("tmdb_id", flat=True).first() or 0) + 1
+        for offset in range(0, rows, batch_size):
+            Movie.objects.bulk_create([
+                Movie(
+                    tmdb_id=base + i,
+                    title=" ".join(rng.sample(WORDS, rng.randint(1, 4))).title(),
+                    year=rng.randint(1950, 2025),
+                )
+                for i in range(offset, min(offset + batch_size, rows))
+            ], batch_size=batch_size)
+        self.stdout.write(f"Inserted {rows} rows in {time.monotonic() - start:.1f}s")
+
+    @staticmethod
+    def run(queryset, size):
+        """What the list endpoint runs per request: a COUNT and the first page."""
+        queryset.count()
+        list(queryset[:size])
+
+    def report(self, label, run, repeat):
+        samples = []
+        for query in QUERIES:
+            run(query)  # warm up
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run(query)
+                samples.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f"{label:>14}: median {statistics.median(samples):8.1f} ms   "
+            f"p95 {percentile(samples, 95):8.1f} ms   ({len(samples)} queries)"
+        )
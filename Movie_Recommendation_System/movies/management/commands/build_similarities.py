@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from movies.recommender import DEFAULT_K, build_similarities
+
+
+class Command(BaseCommand):
+    help = "Recompute item-item movie neighbours from user ratings and favorites."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--k", type=int, default=DEFAULT_K,
+                            help="Neighbours to keep per movie.")
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                            help="Movies per similarity block (bounds memory use).")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        rows = build_similarities(k=options["k"], chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {rows} movie similarities in {time.monotonic() - start:.1f}s."
+        ))
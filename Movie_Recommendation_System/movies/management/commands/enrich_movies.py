@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from movies.enrichment import RateLimiter, enrich_batch
+from movies.models import Movie
+
+
+class Command(BaseCommand):
+    help = "Fetch TMDb details for movies still pending enrichment."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int,
+                            default=settings.TMDB_ENRICHMENT_BATCH_SIZE)
+        parser.add_argument("--limit", type=int, default=None,
+                            help="Stop after this many movies.")
+        parser.add_argument("--missing", action="store_true",
+                            help="Also retry movies missing a release date or poster.")
+
+    def handle(self, *args, **options):
+        qs = Movie.objects.filter(enrichment_status=Movie.ENRICHMENT_PENDING)
+        if options["missing"]:
+            qs = Movie.objects.exclude(enrichment_status=Movie.ENRICHMENT_FAILED).filter(
+                Q(release_date__isnull=True) | Q(poster_url__isnull=True) | Q(poster_url="")
+            )
+        tmdb_ids = list(qs.order_by("id").values_list("tmdb_id", flat=True)[:options["limit"]])
+
+        rate_limiter = RateLimiter(settings.TMDB_ENRICHMENT_RATE)
+        size = options["batch_size"]
+        failed = 0
+        for i in range(0, len(tmdb_ids), size):
+            failed += len(enrich_batch(tmdb_ids[i:i + size], rate_limiter))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Enriched {len(tmdb_ids) - failed} movies ({failed} left pending)."
+        ))
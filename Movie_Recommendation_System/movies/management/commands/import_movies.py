@@ -0,0 +1,201 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from movies.caching import MOVIES_NAMESPACE, bump_namespace
+from movies.enrichment import RateLimiter
+from movies.models import Movie
+from movies.ratelimit import BACKGROUND
+from movies.tmdb import TMDBError, poster_url
+from movies.utils import load_tmdb_movie_details
+
+UPDATE_FIELDS = ["title", "poster_url", "release_date", "year", "enrichment_status"]
+DUMP_FIELDS = ["title", "poster_url", "release_date"]  # what a record may supply
+
+
+def read_records(path, fmt):
+    """
+    Streams dict records from a newline-delimited JSON or CSV file. A line
+    that is not valid JSON is yielded as None so it still counts towards
+    the checkpoint.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+
+
+def build_movie(record):
+    """
+    Unsaved Movie for a dump record, None if it has no id. Fields the record
+    does not supply are left empty. Raises ValueError on malformed values.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("not an object")
+    tmdb_id = record.get("tmdb_id") or record.get("id")
+    if not tmdb_id:
+        return None
+    try:
+        tmdb_id = int(tmdb_id)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid tmdb_id {tmdb_id!r}")
+    release_date = record.get("release_date") or None
+    if release_date is not None:
+        # parse_date() returns None for a bad format and raises for bad values
+        release_date = parse_date(str(release_date))
+        if release_date is None:
+            raise ValueError(f"invalid release_date {record['release_date']!r}")
+    return Movie(
+        tmdb_id=tmdb_id,
+        title=record.get("title") or "",
+        release_date=release_date,
+        poster_url=record.get("poster_url") or poster_url(record.get("poster_path")),
+        enrichment_status=Movie.ENRICHMENT_PENDING,
+    )
+
+
+def row_values(movie):
+    return tuple(getattr(movie, field) for field in UPDATE_FIELDS)
+
+
+class Command(BaseCommand):
+    help = "Bulk import movies from a TMDb ID dump (NDJSON or CSV), fetching missing details concurrently."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="NDJSON (one object per line) or CSV file with a tmdb_id/id column.")
+        parser.add_argument("--format", choices=["json", "csv"], default=None,
+                            help="Input format (default: from the file extension).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=8,
+                            help="Concurrent TMDb detail fetches.")
+        parser.add_argument("--rate", type=float, default=40,
+                            help="Maximum TMDb calls per second.")
+        parser.add_argument("--no-fetch", action="store_true",
+                            help="Do not call TMDb; leave incomplete rows pending enrichment.")
+        parser.add_argument("--checkpoint", default=None,
+                            help="Checkpoint file (default: <path>.checkpoint).")
+        parser.add_argument("--restart", action="store_true",
+                            help="Ignore an existing checkpoint and start from the top.")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"{path} does not exist.")
+        fmt = options["format"] or ("csv" if path.suffix.lower() == ".csv" else "json")
+        checkpoint = Path(options["checkpoint"] or f"{path}.checkpoint")
+        batch_size = options["batch_size"]
+
+        done = 0
+        if checkpoint.exists() and not options["restart"]:
+            done = int(checkpoint.read_text().strip() or 0)
+            self.stdout.write(f"Resuming after {done} records.")
+
+        records = islice(read_records(path, fmt), done, None)
+        rate_limiter = RateLimiter(options["rate"])
+        imported = skipped = 0
+        start = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            while batch := list(islice(records, batch_size)):
+                created, updated, bad = self.enrich(pool, rate_limiter, batch, fetch=not options["no_fetch"])
+                with transaction.atomic():
+                    # Not one bulk_create(update_conflicts=True): the upsert would
+                    # write every supplied column of every row, while enrich() has
+                    # already merged existing rows field by field and kept only the
+                    # ones that changed. ignore_conflicts covers a row inserted
+                    # since enrich() read the batch; that row keeps its data.
+                    Movie.objects.bulk_create(created, batch_size=batch_size, ignore_conflicts=True)
+                    Movie.objects.bulk_update(updated, UPDATE_FIELDS, batch_size=batch_size)
+                done += len(batch)
+                imported += len(created) + len(updated)
+                skipped += bad
+                checkpoint.write_text(str(done))
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"{done} records processed")
+
+        elapsed = time.monotonic() - start
+        checkpoint.unlink(missing_ok=True)
+        bump_namespace(MOVIES_NAMESPACE)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} movies in {elapsed:.1f}s "
+            f"({imported / elapsed if elapsed else imported:.0f} rows/s)."
+        ))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped} malformed records."))
+        pending = Movie.objects.filter(enrichment_status=Movie.ENRICHMENT_PENDING).count()
+        if pending:
+            self.stdout.write(f"{pending} movies are pending enrichment; run `manage.py enrich_movies`.")
+
+    def enrich(self, pool, rate_limiter, batch, fetch=True):
+        """
+        Returns (new Movies, changed existing Movies, malformed record count).
+
+        Existing rows only take the fields a record supplies, so re-importing
+        an ID-only dump or a failed fetch never blanks an enriched movie, and
+        enriched rows are not sent back to pending. Movies TMDb answers 404
+        for are marked failed.
+        """
+        # Last record wins if the dump repeats a tmdb_id within one batch
+        movies, bad = {}, 0
+        for record in batch:
+            try:
+                movie = build_movie(record)
+            except ValueError:
+                bad += 1
+                continue
+            if movie is not None:
+                movies[movie.tmdb_id] = movie
+
+        existing = Movie.objects.in_bulk(list(movies), field_name="tmdb_id")
+        before = {tmdb_id: row_values(movie) for tmdb_id, movie in existing.items()}
+        rows = []
+        for tmdb_id, movie in movies.items():
+            row = existing.get(tmdb_id)
+            if row is None:
+                rows.append(movie)
+                continue
+            for field in DUMP_FIELDS:
+                if value := getattr(movie, field):
+                    setattr(row, field, value)
+            rows.append(row)
+
+        incomplete = [m for m in rows if m.enrichment_status != Movie.ENRICHMENT_DONE
+                      and (not m.release_date or not m.poster_url or not m.title)]
+        if fetch and incomplete:
+            def fetch_details(movie):
+                rate_limiter.wait()
+                try:
+                    return load_tmdb_movie_details(movie.tmdb_id, BACKGROUND)
+                except TMDBError as e:
+                    return e
+
+            for movie, details in zip(incomplete, pool.map(fetch_details, incomplete)):
+                if not isinstance(details, TMDBError):
+                    movie.apply_tmdb_details(details)
+                elif details.status_code == 404:
+                    # as enrich_batch() does; other errors stay pending for enrich_movies
+                    movie.enrichment_status = Movie.ENRICHMENT_FAILED
+
+        created, updated = [], []
+        for movie in rows:
+            if movie.enrichment_status == Movie.ENRICHMENT_PENDING and movie.title and movie.release_date \
+                    and movie.poster_url:
+                movie.enrichment_status = Movie.ENRICHMENT_DONE  # the dump had everything
+            if movie.release_date:
+                movie.year = movie.release_date.year
+            if movie.pk is None:
+                created.append(movie)
+            elif row_values(movie) != before[movie.tmdb_id]:
+                updated.append(movie)
+        return created, updated, bad
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from movies.ratings import reconcile_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized rating aggregates on Movie and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("movie_ids", nargs="*", type=int,
+                            help="Only reconcile these Movie IDs (default: all movies).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_rating_aggregates(options["movie_ids"] or None, options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled rating aggregates ({fixed} movies corrected)."))
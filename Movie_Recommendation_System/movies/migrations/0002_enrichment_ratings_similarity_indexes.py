@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:54
+
+import django.db.models.deletion
+import movies.models
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    Movie = apps.get_model('movies', 'Movie')
+    MovieRating = apps.get_model('users', 'MovieRating')
+    stats = (MovieRating.objects.values('movie')
+             .annotate(total=Sum('rating'), count=Count('id')).order_by())
+    movies = []
+    for row in stats:
+        movies.append(Movie(
+            pk=row['movie'],
+            ratings_sum=row['total'],
+            ratings_count=row['count'],
+            average_rating=row['total'] / row['count'],
+        ))
+    Movie.objects.bulk_update(movies, ['ratings_sum', 'ratings_count', 'average_rating'], batch_size=1000)
+
+
+def install_search_index(apps, schema_editor):
+    # Vendor-specific title search index (FTS5 on SQLite, tsvector + pg_trgm
+    # on PostgreSQL); see movies/search.py. No-op on other databases.
+    from movies.search import install_search_index
+    install_search_index(schema_editor)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from movies.search import uninstall_search_index
+    uninstall_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+        ('users', '0002_remove_favoritemovie_poster_path_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+            ],
+            options={
+                'ordering': ['movie', '-score'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='average_rating',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='enrichment_status',
+            field=models.CharField(choices=[('pending', 'Pending TMDb enrichment'), ('done', 'Enriched from TMDb'), ('failed', 'Not found on TMDb')], default='done', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='ratings_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='ratings_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+        migrations.AddIndex(
+            model_name='movie',
+            index=movies.models.NullsLastIndex(fields=['-year', 'id'], name='movie_year_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['title', 'id'], name='movie_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-ratings_count', '-average_rating'], name='movie_popularity_idx'),
+        ),
+        migrations.AddField(
+            model_name='moviesimilarity',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='movies.movie'),
+        ),
+        migrations.AddField(
+            model_name='moviesimilarity',
+            name='neighbor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie'),
+        ),
+        migrations.AddIndex(
+            model_name='moviesimilarity',
+            index=models.Index(fields=['movie', '-score'], name='moviesim_movie_score_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='moviesimilarity',
+            unique_together={('movie', 'neighbor')},
+        ),
+    ]
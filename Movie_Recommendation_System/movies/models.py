@@ -1,29 +1,180 @@
-from django.db import models
-from .utils import fetch_tmdb_movie_details
+from django.db import models, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from django.db.models.functions import Cast, NullIf
+from .caching import MOVIES_NAMESPACE, bump_namespace_on_commit
+from .enrichment import enqueue_enrichment
+
+class NullsLastIndex(models.Index):
+    """
+    Index on `fields` in the order KeysetPagination reads them, with NULLs
+    last in nullable columns. PostgreSQL puts NULLs first in a DESC index
+    unless told otherwise. SQLite rejects NULLS LAST in an index, but it
+    already sorts NULLs lowest, which is last when descending.
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        expressions = []
+        for name, order in self.fields_orders:
+            nulls_last = True if model._meta.get_field(name).null else None
+            expressions.append(F(name).desc(nulls_last=nulls_last) if order == "DESC" else F(name).asc())
+        index = models.Index(*expressions, name=self.name, db_tablespace=self.db_tablespace)
+        return index.create_sql(model, schema_editor, using, **kwargs)
+
 
 class Movie(models.Model):
+    ENRICHMENT_PENDING = 'pending'
+    ENRICHMENT_DONE = 'done'
+    ENRICHMENT_FAILED = 'failed'
+    ENRICHMENT_CHOICES = [
+        (ENRICHMENT_PENDING, 'Pending TMDb enrichment'),
+        (ENRICHMENT_DONE, 'Enriched from TMDb'),
+        (ENRICHMENT_FAILED, 'Not found on TMDb'),
+    ]
+
     tmdb_id = models.IntegerField(unique=True)
     title = models.CharField(max_length=255)
     poster_url = models.URLField(blank=True, null=True)
     release_date = models.DateField(null=True, blank=True)
     year = models.IntegerField(null=True, blank=True)
+    enrichment_status = models.CharField(
+        max_length=10, choices=ENRICHMENT_CHOICES, default=ENRICHMENT_DONE)
+
+    # Rating aggregates, maintained incrementally by users.signals
+    AGGREGATE_FIELDS = ['ratings_sum', 'ratings_count', 'average_rating']
+    ratings_sum = models.PositiveIntegerField(default=0)
+    ratings_count = models.PositiveIntegerField(default=0)
+    average_rating = models.FloatField(null=True, blank=True)
 
     def save(self, *args, **kwargs):
-        # Auto-fetch details from TMDb if missing
-        if not self.release_date or not self.poster_url:
-            details = fetch_tmdb_movie_details(self.tmdb_id)
-            if details:
-                if not self.release_date and details["release_date"]:
-                    self.release_date = details["release_date"]
-                if not self.poster_url and details["poster_url"]:
-                    self.poster_url = details["poster_url"]
+        # Missing details are fetched from TMDb in the background after commit
+        if self._state.adding and (not self.release_date or not self.poster_url):
+            self.enrichment_status = self.ENRICHMENT_PENDING
 
         # Auto-set year based on release_date
         if self.release_date:
             self.year = self.release_date.year
-        super().save(*args, **kwargs)
-        class Meta:
-            unique_together = ('tmdb_id', 'title')
-            ordering = ['-year']
-        def __str__(self):
-            return self.title
\ No newline at end of file
+
+        # The aggregates are only ever changed in SQL (apply_rating_delta());
+        # writing back the values loaded with this instance would undo the
+        # ratings saved since
+        kwargs.update(zip(['force_insert', 'force_update', 'using', 'update_fields'], args))
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and not kwargs.get('force_insert'):
+            if update_fields is None:
+                skip = {*self.AGGREGATE_FIELDS, *self.get_deferred_fields()}
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in skip
+                ]
+            else:
+                kwargs['update_fields'] = [name for name in update_fields if name not in self.AGGREGATE_FIELDS]
+        super().save(**kwargs)
+
+        if self.enrichment_status == self.ENRICHMENT_PENDING:
+            tmdb_id = self.tmdb_id
+            transaction.on_commit(lambda: enqueue_enrichment(tmdb_id))
+
+    class Meta:
+        # One per ordering the list endpoints use: default/keyset (-year, id),
+        # ?ordering=title, and most-rated first (for-you fallback, ?ordering=).
+        # year is nullable: its NULLs sort last, as in MovieListCreateView
+        # and KeysetPagination
+        indexes = [
+            NullsLastIndex(fields=['-year', 'id'], name='movie_year_id_idx'),
+            models.Index(fields=['title', 'id'], name='movie_title_idx'),
+            models.Index(fields=['-ratings_count', '-average_rating'], name='movie_popularity_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def apply_tmdb_details(self, details):
+        """Fills missing fields from a load_tmdb_movie_details() result."""
+        if not self.title and details["title"]:
+            self.title = details["title"]
+        if not self.release_date and details["release_date"]:
+            self.release_date = details["release_date"]
+        if not self.poster_url and details["poster_url"]:
+            self.poster_url = details["poster_url"]
+        if self.release_date:
+            self.year = self.release_date.year
+        self.enrichment_status = self.ENRICHMENT_DONE
+
+    @classmethod
+    def bulk_get_or_create(cls, tmdb_ids):
+        """
+        Returns {tmdb_id: Movie} for `tmdb_ids`: one IN query, plus one
+        bulk_create (and a re-read) for the ones we don't have yet. New rows
+        are pending TMDb enrichment, queued once the transaction commits.
+        """
+        movies = {m.tmdb_id: m for m in cls.objects.filter(tmdb_id__in=tmdb_ids)}
+        missing = [tmdb_id for tmdb_id in dict.fromkeys(tmdb_ids) if tmdb_id not in movies]
+        if missing:
+            cls.objects.bulk_create(
+                [cls(tmdb_id=tmdb_id, title="", enrichment_status=cls.ENRICHMENT_PENDING) for tmdb_id in missing],
+                ignore_conflicts=True,
+            )
+            movies.update((m.tmdb_id, m) for m in cls.objects.filter(tmdb_id__in=missing))
+            transaction.on_commit(lambda: [enqueue_enrichment(tmdb_id) for tmdb_id in missing])
+            bump_namespace_on_commit(MOVIES_NAMESPACE)
+        return movies
+
+    @classmethod
+    def apply_rating_delta(cls, movie_id, sum_delta, count_delta):
+        """
+        Atomically shifts a movie's rating aggregates in a single UPDATE.
+        The right-hand sides all read the pre-update column values.
+        """
+        new_sum = F('ratings_sum') + sum_delta
+        new_count = F('ratings_count') + count_delta
+        cls.objects.filter(pk=movie_id).update(
+            ratings_sum=new_sum,
+            ratings_count=new_count,
+            average_rating=Cast(new_sum, FloatField()) / NullIf(new_count, 0),
+        )
+
+    @classmethod
+    def apply_rating_deltas(cls, deltas):
+        """
+        apply_rating_delta() for many movies in a single UPDATE.
+        `deltas` maps movie_id -> (sum_delta, count_delta).
+        """
+        if not deltas:
+            return
+        if len(deltas) == 1:
+            [(movie_id, (sum_delta, count_delta))] = deltas.items()
+            return cls.apply_rating_delta(movie_id, sum_delta, count_delta)
+
+        def per_movie(position):
+            return Case(
+                *(When(pk=movie_id, then=Value(delta[position])) for movie_id, delta in deltas.items()),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+
+        new_sum = F('ratings_sum') + per_movie(0)
+        new_count = F('ratings_count') + per_movie(1)
+        cls.objects.filter(pk__in=list(deltas)).update(
+            ratings_sum=new_sum,
+            ratings_count=new_count,
+            average_rating=Cast(new_sum, FloatField()) / NullIf(new_count, 0),
+        )
+
+class MovieSimilarity(models.Model):
+    """
+    Precomputed item-item neighbours (top-k cosine similarity over user
+    ratings and favorites). Rebuilt offline by `manage.py build_similarities`.
+    """
+    movie = models.ForeignKey(Movie, related_name='similarities', on_delete=models.CASCADE)
+    neighbor = models.ForeignKey(Movie, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('movie', 'neighbor')
+        ordering = ['movie', '-score']
+        indexes = [models.Index(fields=['movie', '-score'], name='moviesim_movie_score_idx')]
+
+    def __str__(self):
+        return f"{self.movie_id} ~ {self.neighbor_id} ({self.score:.3f})"
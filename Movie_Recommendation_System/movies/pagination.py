@@ -1,11 +1,184 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import datetime
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, OrderBy, Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-class LargeResultsSetPagination(PageNumberPagination):
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on a composite key instead of OFFSET, and
+    never runs COUNT(*), so every page costs the same regardless of depth.
+
+    `ordering` lists model fields, "-" for descending; the last one must be
+    unique (normally "id"). NULLs sort last in both directions.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering, page_size, max_page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, values):
+        # DjangoJSONEncoder cuts datetimes to milliseconds, which would skip
+        # rows stamped later within the same millisecond
+        values = [value.isoformat() if isinstance(value, (datetime.date, datetime.time)) else value
+                  for value in values]
+        raw = json.dumps(values, cls=DjangoJSONEncoder).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, model, token):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                None if value is None else model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def order_by(self, model):
+        # NULLS LAST only where a column can hold NULL: on NOT NULL columns
+        # the modifier is a no-op that can stop the database from reading
+        # the order straight from an index
+        order = []
+        for name in self.ordering:
+            field = name.lstrip('-')
+            nulls_last = True if model._meta.get_field(field).null else None
+            expression = F(field)
+            order.append(expression.desc(nulls_last=nulls_last) if name.startswith('-')
+                         else expression.asc(nulls_last=nulls_last))
+        return order
+
+    def seek(self, values):
+        """Q for rows strictly after `values` in `ordering` (lexicographic)."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            if value is None:
+                # NULLs sort last: nothing comes after NULL in this column
+                equal &= Q(**{f'{field}__isnull': True})
+                continue
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            after = Q(**{f'{field}__{lookup}': value}) | Q(**{f'{field}__isnull': True})
+            condition |= equal & after
+            equal &= Q(**{field: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        queryset = queryset.order_by(*self.order_by(queryset.model))
+
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            queryset = queryset.filter(self.seek(self.decode_cursor(queryset.model, token)))
+
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [getattr(last, name.lstrip('-')) for name in self.ordering]
+        url = remove_query_param(self.request.build_absolute_uri(), OptionalKeysetPagination.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class OptionalKeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination by default; clients opt in to keyset pagination
+    with ?pagination=cursor (and then follow the returned `next` links, which
+    carry ?cursor=...). Subclasses set `keyset_ordering`.
+    """
+    mode_query_param = 'pagination'
+    keyset_ordering = None
+
+    def use_keyset(self, request):
+        return bool(self.keyset_ordering) and (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def get_keyset_ordering(self, queryset, request):
+        """
+        `keyset_ordering`, or the ?ordering= the view's OrderingFilter has
+        applied, with "id" added to make it unique. Raises ValidationError
+        for orderings a cursor cannot seek on (related fields, expressions).
+        """
+        if api_settings.ORDERING_PARAM not in request.query_params or not queryset.query.order_by:
+            return self.keyset_ordering
+        ordering = []
+        for term in queryset.query.order_by:
+            if isinstance(term, OrderBy) and isinstance(term.expression, F):
+                term = ('-' if term.descending else '') + term.expression.name
+            name = term.lstrip('-') if isinstance(term, str) else None
+            try:
+                field = queryset.model._meta.get_field('id' if name == 'pk' else name)
+            except (FieldDoesNotExist, TypeError):
+                field = None
+            if field is None or not field.concrete or field.is_relation:
+                raise ValidationError({api_settings.ORDERING_PARAM: 'This ordering is not supported with cursor pagination.'})
+            ordering.append(term[:-2] + 'id' if name == 'pk' else term)
+        if not any(term.lstrip('-') == 'id' for term in ordering):
+            ordering.append('id')
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            ordering = self.get_keyset_ordering(queryset, request)
+            self.keyset = KeysetPagination(ordering, self.page_size, self.max_page_size)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class LargeResultsSetPagination(OptionalKeysetPagination):
     page_size = 50
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class FavoriteActivityPagination(PageNumberPagination):
+class MoviePagination(LargeResultsSetPagination):
+    keyset_ordering = ('-year', 'id')
+
+class FavoriteMoviePagination(LargeResultsSetPagination):
+    keyset_ordering = ('-updated_at', 'id')
+
+class FavoriteActivityPagination(OptionalKeysetPagination):
     page_size = 10
     page_size_query_param = 'page_size'
-    max_page_size = 50
\ No newline at end of file
+    max_page_size = 50
+    keyset_ordering = ('-timestamp', 'id')
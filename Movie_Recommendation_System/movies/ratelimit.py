@@ -0,0 +1,170 @@
+"""
+Cluster-wide TMDb token bucket in Redis (per-process fallback), with a share
+reserved for user-facing calls.
+"""
+import asyncio
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+BUCKET_KEY = "tmdb:ratelimit"
+
+# Returns 0 if a token was taken, else the seconds until one is available
+# above `floor`. Bucket state: {tokens, ts} refilled at `rate` per second.
+ACQUIRE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= floor + 1 then
+    tokens = tokens - 1
+else
+    wait = (floor + 1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+# Empties the bucket for ARGV[1] seconds (TMDb answered 429 Retry-After).
+PAUSE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local tokens = -tonumber(ARGV[1]) * tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])) + 60)
+return 1
+"""
+
+
+class LocalBucket:
+    """In-process equivalent of the Redis scripts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._ts = None
+
+    def take(self, capacity, rate, floor):
+        with self._lock:
+            now = time.monotonic()
+            tokens = capacity if self._tokens is None else self._tokens
+            tokens = min(capacity, tokens + max(0.0, now - (self._ts or now)) * rate)
+            wait = 0.0
+            if tokens >= floor + 1:
+                tokens -= 1
+            else:
+                wait = (floor + 1 - tokens) / rate
+            self._tokens, self._ts = tokens, now
+            return wait
+
+    def pause(self, seconds, rate):
+        with self._lock:
+            self._tokens, self._ts = -seconds * rate, time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._tokens = self._ts = None
+
+
+class RedisBucket:
+    def __init__(self, client):
+        self._acquire = client.register_script(ACQUIRE_SCRIPT)
+        self._pause = client.register_script(PAUSE_SCRIPT)
+
+    def take(self, capacity, rate, floor):
+        return float(self._acquire(keys=[BUCKET_KEY], args=[capacity, rate, floor]))
+
+    def pause(self, seconds, rate):
+        self._pause(keys=[BUCKET_KEY], args=[seconds, rate])
+
+
+_local_bucket = LocalBucket()
+_redis_buckets = {}
+
+
+def get_bucket():
+    try:
+        from django_redis import get_redis_connection
+        client = get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        return _local_bucket
+    bucket = _redis_buckets.get(id(client))
+    if bucket is None:
+        bucket = _redis_buckets[id(client)] = RedisBucket(client)
+    return bucket
+
+
+def _limits(priority):
+    """(capacity, rate, floor, max_wait) for a priority."""
+    capacity = settings.TMDB_RATE_BURST
+    rate = settings.TMDB_RATE_LIMIT
+    if priority == BACKGROUND:
+        return (capacity, rate, capacity * settings.TMDB_RATE_BACKGROUND_RESERVE,
+                settings.TMDB_RATE_BACKGROUND_MAX_WAIT)
+    return capacity, rate, 0, settings.TMDB_RATE_INTERACTIVE_MAX_WAIT
+
+
+def _take(bucket, capacity, rate, floor):
+    try:
+        return bucket.take(capacity, rate, floor)
+    except Exception:
+        logger.warning("TMDb rate limiter unavailable; letting the call through", exc_info=True)
+        return 0
+
+
+def acquire(priority=INTERACTIVE):
+    """
+    Takes one token, queueing up to the priority's max wait. Returns 0 on
+    success, or the seconds until a token would be available if that is
+    longer than the caller may wait.
+    """
+    capacity, rate, floor, max_wait = _limits(priority)
+    bucket = get_bucket()
+    deadline = time.monotonic() + max_wait
+    while True:
+        wait = _take(bucket, capacity, rate, floor)
+        if wait <= 0:
+            return 0
+        if wait > deadline - time.monotonic():
+            return wait
+        time.sleep(wait)
+
+
+async def aacquire(priority=INTERACTIVE):
+    """acquire() for async code: queues with asyncio.sleep() instead of blocking."""
+    capacity, rate, floor, max_wait = _limits(priority)
+    bucket = get_bucket()
+    deadline = time.monotonic() + max_wait
+    while True:
+        if isinstance(bucket, RedisBucket):
+            # redis-py is thread-safe, so this need not queue behind the ORM's thread
+            wait = await sync_to_async(_take, thread_sensitive=False)(bucket, capacity, rate, floor)
+        else:
+            wait = _take(bucket, capacity, rate, floor)
+        if wait <= 0:
+            return 0
+        if wait > deadline - time.monotonic():
+            return wait
+        await asyncio.sleep(wait)
+
+
+def pause(seconds):
+    """Stops all workers from calling TMDb for `seconds` (e.g. after a 429)."""
+    try:
+        get_bucket().pause(seconds, settings.TMDB_RATE_LIMIT)
+    except Exception:
+        logger.warning("Could not pause the TMDb rate limiter", exc_info=True)
@@ -0,0 +1,53 @@
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf
+from users.models import MovieRating
+from .caching import MOVIES_NAMESPACE, bump_namespace_on_commit
+from .models import Movie
+
+AGGREGATE_FIELDS = Movie.AGGREGATE_FIELDS
+
+
+def rating_aggregate(aggregate):
+    """Correlated subquery: `aggregate` over the ratings of the outer Movie, 0 if it has none."""
+    ratings = (MovieRating.objects.filter(movie=OuterRef('pk')).order_by()
+               .values('movie').annotate(value=aggregate).values('value'))
+    return Coalesce(Subquery(ratings), 0)
+
+
+def reconcile_rating_aggregates(movie_ids=None, batch_size=1000):
+    """
+    Recomputes Movie rating aggregates from MovieRating and writes back only
+    the rows that drifted. Returns the number of movies corrected.
+
+    The drifted rows are found with a plain read, but the new values are
+    computed inside the UPDATE itself, so a rating delta applied between
+    the two is never overwritten with a stale total.
+    """
+    ratings = MovieRating.objects.all()
+    movies = Movie.objects.only('id', *AGGREGATE_FIELDS)
+    if movie_ids is not None:
+        ratings = ratings.filter(movie_id__in=movie_ids)
+        movies = movies.filter(id__in=movie_ids)
+
+    actual = {
+        row['movie']: (row['total'], row['count'])
+        for row in ratings.values('movie').annotate(total=Sum('rating'), count=Count('id')).order_by()
+    }
+
+    drifted = []
+    for movie in movies.order_by().iterator(chunk_size=batch_size):
+        total, count = actual.get(movie.id, (0, 0))
+        average = total / count if count else None
+        if (movie.ratings_sum, movie.ratings_count, movie.average_rating) != (total, count, average):
+            drifted.append(movie.id)
+
+    total, count = rating_aggregate(Sum('rating')), rating_aggregate(Count('id'))
+    for start in range(0, len(drifted), batch_size):
+        Movie.objects.filter(id__in=drifted[start:start + batch_size]).update(
+            ratings_sum=total,
+            ratings_count=count,
+            average_rating=Cast(total, FloatField()) / NullIf(count, 0),
+        )
+    if drifted:
+        bump_namespace_on_commit(MOVIES_NAMESPACE)
+    return len(drifted)
@@ -0,0 +1,203 @@
+"""
+Item-item collaborative filtering: neighbours are built offline by
+`manage.py build_similarities` and per-user lists cached until the library changes.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from .caching import SIMILARITIES_NAMESPACE, bump_namespace, bump_namespace_on_commit, namespace_version, versioned_key
+from .models import Movie, MovieSimilarity
+from .tmdb import poster_path
+
+DEFAULT_K = 20
+FAVORITE_WEIGHT = 3.0  # a favorite counts like a 3-star rating
+MIN_SCORE = 0.05
+
+
+def build_interaction_matrix():
+    """
+    Returns (matrix, movie_ids): a scipy CSR matrix of users x movies and the
+    Movie primary key for each column. A cell holds the user's rating plus
+    FAVORITE_WEIGHT if the movie is one of their favorites.
+    """
+    import numpy as np
+    from scipy import sparse
+    from users.models import FavoriteMovie, MovieRating
+
+    ratings = list(MovieRating.objects.order_by().values_list('user_id', 'movie_id', 'rating'))
+    favorites = list(FavoriteMovie.objects.order_by().values_list('user_id', 'movie_id'))
+
+    user_ids = sorted({u for u, _, _ in ratings} | {u for u, _ in favorites})
+    movie_ids = sorted({m for _, m, _ in ratings} | {m for _, m in favorites})
+    user_index = {u: i for i, u in enumerate(user_ids)}
+    movie_index = {m: i for i, m in enumerate(movie_ids)}
+
+    rows = [user_index[u] for u, _, _ in ratings] + [user_index[u] for u, _ in favorites]
+    cols = [movie_index[m] for _, m, _ in ratings] + [movie_index[m] for _, m in favorites]
+    data = [float(r) for _, _, r in ratings] + [FAVORITE_WEIGHT] * len(favorites)
+
+    # Duplicate (user, movie) pairs are summed on conversion to CSR
+    matrix = sparse.coo_matrix(
+        (np.array(data, dtype=np.float32), (rows, cols)),
+        shape=(len(user_ids), len(movie_ids)),
+    ).tocsr()
+    return matrix, movie_ids
+
+
+def top_k_neighbors(matrix, k=DEFAULT_K, chunk_size=1000, min_score=MIN_SCORE):
+    """
+    Yields (movie_col, neighbor_col, score) for the top-k cosine neighbours of
+    every column of a users x movies matrix. Similarities are computed one
+    chunk of movies at a time so memory stays bounded.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    items = matrix.T.tocsr()
+    norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    items = sparse.diags(1.0 / norms) @ items
+    items_t = items.T.tocsc()
+
+    for start in range(0, items.shape[0], chunk_size):
+        sims = (items[start:start + chunk_size] @ items_t).tocsr()
+        for offset in range(sims.shape[0]):
+            movie = start + offset
+            row = sims.getrow(offset)
+            cols, scores = row.indices, row.data
+            keep = (cols != movie) & (scores >= min_score)
+            cols, scores = cols[keep], scores[keep]
+            if len(cols) > k:
+                best = np.argpartition(-scores, k)[:k]
+                cols, scores = cols[best], scores[best]
+            for col, score in zip(cols, scores):
+                yield movie, int(col), float(score)
+
+
+def build_similarities(k=DEFAULT_K, chunk_size=1000, batch_size=5000):
+    """Recomputes the MovieSimilarity table. Returns the number of rows written."""
+    matrix, movie_ids = build_interaction_matrix()
+    if not movie_ids:
+        MovieSimilarity.objects.all().delete()
+        bump_namespace(SIMILARITIES_NAMESPACE)
+        return 0
+
+    rows = [
+        MovieSimilarity(movie_id=movie_ids[m], neighbor_id=movie_ids[n], score=score)
+        for m, n, score in top_k_neighbors(matrix, k, chunk_size)
+    ]
+    with transaction.atomic():
+        MovieSimilarity.objects.all().delete()
+        MovieSimilarity.objects.bulk_create(rows, batch_size=batch_size)
+    # Every user's "for you" list was derived from the old neighbours
+    bump_namespace(SIMILARITIES_NAMESPACE)
+    return len(rows)
+
+
+def similar_movies(tmdb_id, k=DEFAULT_K):
+    """
+    Returns up to k precomputed neighbours of a movie as TMDb-style dicts, or
+    an empty list if the movie has none yet (cold start).
+    """
+    neighbors = (MovieSimilarity.objects
+                 .filter(movie__tmdb_id=tmdb_id)
+                 .select_related('neighbor')
+                 .order_by('-score')[:k])
+    return [movie_to_tmdb_dict(s.neighbor) for s in neighbors]
+
+
+def movie_to_tmdb_dict(movie):
+    """Shapes a local Movie like a TMDb result so TMDbMovieSerializer can render it."""
+    return {
+        "id": movie.tmdb_id,
+        "title": movie.title,
+        "overview": "",
+        "popularity": None,
+        "vote_average": None,
+        "release_date": movie.release_date.isoformat() if movie.release_date else "",
+        "poster_path": poster_path(movie.poster_url),
+    }
+
+
+# Personalised "for you" candidates -----------------------------------------
+
+FOR_YOU_SIZE = 100
+FOR_YOU_CACHE_TIMEOUT = 60 * 60 * 6
+SEED_WEIGHTS = {"favorite": 1.0, "watchlist": 0.5}
+
+
+def for_you_namespace(user_id):
+    return f"for_you:{user_id}"
+
+
+def for_you_cache_key(user_id):
+    return versioned_key(for_you_namespace(user_id), f"sim{namespace_version(SIMILARITIES_NAMESPACE)}")
+
+
+def user_seed_weights(user_id):
+    """
+    Returns {movie_id: weight} for everything the user has interacted with.
+    Ratings are centred on 3 stars so disliked movies push neighbours down.
+    """
+    from users.models import FavoriteMovie, MovieRating, Watchlist
+
+    seeds = {}
+    for movie_id, rating in MovieRating.objects.filter(user_id=user_id).values_list('movie_id', 'rating'):
+        seeds[movie_id] = seeds.get(movie_id, 0.0) + (rating - 3) / 2
+    for movie_id in FavoriteMovie.objects.filter(user_id=user_id).values_list('movie_id', flat=True):
+        seeds[movie_id] = seeds.get(movie_id, 0.0) + SEED_WEIGHTS["favorite"]
+    for movie_id in Watchlist.objects.filter(user_id=user_id).values_list('movie_id', flat=True):
+        seeds[movie_id] = seeds.get(movie_id, 0.0) + SEED_WEIGHTS["watchlist"]
+    return seeds
+
+
+def compute_user_candidates(user_id, size=FOR_YOU_SIZE):
+    """
+    Ranks unseen movies for a user by summing neighbour similarity weighted by
+    how the user felt about each seed movie. Falls back to the most-rated
+    movies for users without usable history.
+    """
+    from .serializers import MovieSerializer
+
+    seeds = user_seed_weights(user_id)
+    scores = {}
+    if seeds:
+        neighbours = (MovieSimilarity.objects
+                      .filter(movie_id__in=list(seeds))
+                      .exclude(neighbor_id__in=list(seeds))
+                      .values_list('movie_id', 'neighbor_id', 'score'))
+        for movie_id, neighbor_id, score in neighbours:
+            scores[neighbor_id] = scores.get(neighbor_id, 0.0) + seeds[movie_id] * score
+
+    ranked = sorted(((s, m) for m, s in scores.items() if s > 0), reverse=True)[:size]
+    movies = Movie.objects.in_bulk([m for _, m in ranked])
+    candidates = [(movies[m], s) for s, m in ranked if m in movies]
+
+    if len(candidates) < size:
+        seen = set(seeds) | set(movies)
+        popular = (Movie.objects.exclude(id__in=seen)
+                   .filter(ratings_count__gt=0)
+                   .order_by('-ratings_count', '-average_rating')[:size - len(candidates)])
+        candidates += [(movie, 0.0) for movie in popular]
+
+    results = []
+    for (movie, score), data in zip(candidates, MovieSerializer([m for m, _ in candidates], many=True).data):
+        results.append({**data, "score": round(score, 4)})
+    return results
+
+
+def user_recommendations(user_id):
+    """
+    Returns the precomputed candidate list for a user: a single cache read,
+    recomputed only after the user's favorites, watchlist or ratings change
+    or the neighbour table is rebuilt.
+    """
+    key = for_you_cache_key(user_id)
+    candidates = cache.get(key)
+    if candidates is None:
+        candidates = compute_user_candidates(user_id)
+        cache.set(key, candidates, FOR_YOU_CACHE_TIMEOUT)
+    return candidates
+
+
+def invalidate_user_recommendations(user_id):
+    bump_namespace_on_commit(for_you_namespace(user_id))
@@ -0,0 +1,130 @@
+"""
+Ranked title search: tsvector and pg_trgm on PostgreSQL, FTS5 on SQLite,
+icontains elsewhere. Matches are annotated with `search_rank`.
+"""
+import re
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+MAX_TERMS = 10
+FTS_TABLE = "movies_movie_fts"
+
+SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, content='movies_movie', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title) VALUES (new.id, new.title);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title ON movies_movie BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO {FTS_TABLE}(rowid, title) VALUES (new.id, new.title);
+    END""",
+]
+SQLITE_TEARDOWN = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """ALTER TABLE movies_movie ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(title, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS movies_movie_search_vector_idx ON movies_movie USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS movies_movie_title_trgm_idx ON movies_movie USING gin (title gin_trgm_ops)",
+]
+POSTGRES_TEARDOWN = [
+    "DROP INDEX IF EXISTS movies_movie_title_trgm_idx",
+    "DROP INDEX IF EXISTS movies_movie_search_vector_idx",
+    "ALTER TABLE movies_movie DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def install_search_index(schema_editor):
+    """Creates the vendor's search structures (idempotent)."""
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"SELECT 1 FROM sqlite_master WHERE name = '{FTS_TABLE}_ai'")
+            had_triggers = cursor.fetchone() is not None
+        for sql in SQLITE_SETUP:
+            schema_editor.execute(sql)
+        if not had_triggers:
+            # First install, or the triggers were dropped by a table rebuild
+            schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif vendor == "postgresql":
+        for sql in POSTGRES_SETUP:
+            schema_editor.execute(sql)
+
+
+def uninstall_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_TEARDOWN, "postgresql": POSTGRES_TEARDOWN}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def ensure_search_index(sender, using="default", **kwargs):
+    """
+    post_migrate hook. SQLite rebuilds movies_movie (dropping its triggers)
+    on some schema changes, so re-install them after every migrate.
+    """
+    from django.db import connections
+    with connections[using].schema_editor() as schema_editor:
+        install_search_index(schema_editor)
+
+
+def search_terms(query):
+    return re.findall(r"\w+", (query or "").lower())[:MAX_TERMS]
+
+
+def search_movies(queryset, query):
+    """
+    Filters a Movie queryset to titles matching every term of `query`
+    (terms match as prefixes, so it also serves type-ahead) and annotates
+    `search_rank`.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        text = " ".join(terms)
+        matches = RawSQL(
+            "(search_vector @@ to_tsquery('simple', %s) OR title %% %s)",
+            (tsquery, text), output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            "ts_rank(search_vector, to_tsquery('simple', %s)) + similarity(title, %s)",
+            (tsquery, text), output_field=FloatField(),
+        )
+        return queryset.filter(matches).annotate(search_rank=rank)
+
+    if vendor == "sqlite":
+        # The IN subquery runs the MATCH once and drives the query through
+        # the primary key; FTS5's hidden `rank` column (bm25, lower is
+        # better) is then read per matching row by rowid.
+        match = " ".join(f'"{term}"*' for term in terms)
+        table = queryset.model._meta.db_table
+        matches = RawSQL(
+            f'"{table}"."id" IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)',
+            (match,), output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f'(SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id")',
+            (match,), output_field=FloatField(),
+        )
+        return queryset.filter(matches).annotate(search_rank=rank)
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term)
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -1,4 +1,3 @@
-from django.db.models import Avg, Count
 from rest_framework import serializers
 from users.models import FavoriteMovie,MovieRating
 from .models import Movie
@@ -13,6 +12,14 @@ class TMDbMovieSerializer(serializers.Serializer):
     release_date = serializers.CharField(required=False)
     poster_path = serializers.CharField(required=False, allow_null=True)
 
+    # Added by movies.hydration.hydrate_tmdb_results
+    local_id = serializers.IntegerField(required=False)
+    average_rating = serializers.FloatField(required=False, allow_null=True)
+    ratings_count = serializers.IntegerField(required=False)
+    user_rating = serializers.IntegerField(required=False, allow_null=True)
+    is_favorite = serializers.BooleanField(required=False)
+    in_watchlist = serializers.BooleanField(required=False)
+
     swagger_schema_fields = {
         "example": {
             "id": 550,
@@ -21,14 +28,24 @@ class TMDbMovieSerializer(serializers.Serializer):
             "popularity": 50.123,
             "vote_average": 8.4,
             "release_date": "1999-10-15",
-            "poster_path": "/bptfVGEQuv6vDTIMVCHjJ9Dz8PX.jpg"
+            "poster_path": "/bptfVGEQuv6vDTIMVCHjJ9Dz8PX.jpg",
+            "local_id": 1,
+            "average_rating": 4.5,
+            "ratings_count": 123,
+            "user_rating": 5,
+            "is_favorite": True,
+            "in_watchlist": False
         }
     }
 
 class MovieSerializer(serializers.ModelSerializer):
-    # is_favorite = serializers.SerializerMethodField()
+    # Per-user state, never read from the Movie: list pages are cached for
+    # all users, so MovieListCreateView fills it afterwards with
+    # movies.hydration.apply_favorite_state. New movies (POST) and for-you
+    # candidates, which exclude the user's favorites, are never favorites.
+    is_favorite = serializers.BooleanField(read_only=True, default=False)
     average_rating = serializers.SerializerMethodField()
-    ratings_count = serializers.SerializerMethodField()
+    ratings_count = serializers.IntegerField(read_only=True)
     tmdb_id = serializers.IntegerField(required=False)
 
     class Meta:
@@ -42,13 +59,11 @@ class MovieSerializer(serializers.ModelSerializer):
             "year",
             'average_rating',
             'ratings_count',
+            'is_favorite',
         ]
     def get_average_rating(self, obj):
-        return getattr(obj, "average_rating", None)
+        return round(obj.average_rating, 2) if obj.average_rating is not None else None
 
-    def get_ratings_count(self, obj):
-        return getattr(obj, "ratings_count", 0)
-    
     def to_internal_value(self, data):
         """
         Override to:
@@ -81,7 +96,8 @@ class MovieSerializer(serializers.ModelSerializer):
             "release_date": "1999-10-15",
             "year": 1999,
             "average_rating": 4.5,
-            "ratings_count": 123
+            "ratings_count": 123,
+            "is_favorite": False
         }
     }
         
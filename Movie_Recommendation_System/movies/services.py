@@ -1,47 +1,120 @@
-import os
-import requests
-from django.conf import settings
+import asyncio
+import hashlib
+import logging
+import math
+from asgiref.sync import sync_to_async
 from django.core.cache import cache
+from .autocomplete import autocomplete_index, normalize
+from .caching import acached_fetch, merge_cached_results
+from .tmdb import asearch_movie, atmdb_get, tmdb_get
 
-TMDB_API_KEY = settings.TMDB_API_KEY
-TMDB_BASE_URL = 'https://api.themoviedb.org/3'
-CACHE_TIMEOUT = 60 * 60  # 1 hour
+logger = logging.getLogger(__name__)
 
-class TMDBError(Exception):
-    pass
+CACHE_TIMEOUT = 60 * 60  # 1 hour: served as fresh
+STALE_CACHE_TIMEOUT = 60 * 60 * 24  # 24 hours: served stale while refreshing
+TMDB_PAGE_SIZE = 20  # results per TMDb list page
+TITLE_CACHE_TIMEOUT = 60 * 60 * 24  # title -> TMDb ID rarely changes
+TITLE_NOT_FOUND_TIMEOUT = 60 * 10   # "not found" is re-checked sooner
+TITLE_NOT_FOUND = 0                 # cached marker for a title with no match
 
-def fetch_trending_movies(media_type='movie', time_window='week'):
-    cache_key = f"trending_{media_type}_{time_window}"
-    if cached := cache.get(cache_key):
-        print(f"[CACHE HIT] {cache_key}")  # <-- demo log
-        return cached
+async def _afetch_results(cache_key, path, params=None):
+    """
+    CachedResult of a TMDb list's results. The request awaits the async
+    loader; background refreshes run the sync one in a thread, which
+    outlives the request's event loop under WSGI.
+    """
+    def load():
+        logger.info("Fetching %s from TMDb", cache_key)
+        return tmdb_get(path, params).get('results', [])
 
-    print(f"[API CALL] Fetching {cache_key} from TMDb...")  # <-- demo log
-    url = f"{TMDB_BASE_URL}/trending/{media_type}/{time_window}"
-    params = {"api_key": TMDB_API_KEY}
-    resp = requests.get(url, params=params, timeout=10)
+    async def aload():
+        logger.info("Fetching %s from TMDb", cache_key)
+        return (await atmdb_get(path, params)).get('results', [])
 
-    if resp.status_code != 200:
-        raise TMDBError(f"TMDb returned status {resp.status_code}")
+    return await acached_fetch(cache_key, aload, load, CACHE_TIMEOUT, STALE_CACHE_TIMEOUT)
 
-    data = resp.json().get('results', [])
-    cache.set(cache_key, data, CACHE_TIMEOUT)
-    return data
+async def afetch_trending_movies(media_type='movie', time_window='week'):
+    """
+    Returns a CachedResult whose value is the list of trending TMDb movies.
+    """
+    return await _afetch_results(f"trending_{media_type}_{time_window}", f"/trending/{media_type}/{time_window}")
 
-def fetch_recommendations(movie_id, page=1):
-    cache_key = f"recommendations_{movie_id}_{page}"
-    if cached := cache.get(cache_key):
-        print(f"[CACHE HIT] {cache_key}")  # <-- demo log
-        return cached
+async def afetch_recommendations(movie_id, page=1):
+    """
+    Returns a CachedResult whose value is one page of TMDb recommendations.
+    """
+    return await _afetch_results(f"recommendations_{movie_id}_{page}", f"/movie/{movie_id}/recommendations",
+                                 {"page": page})
 
-    print(f"[API CALL] Fetching {cache_key} from TMDb...")  # <-- demo log
-    url = f"{TMDB_BASE_URL}/movie/{movie_id}/recommendations"
-    params = {"api_key": TMDB_API_KEY, "page": page}
-    resp = requests.get(url, params=params, timeout=10)
+async def afetch_recommendation_list(movie_id, limit=TMDB_PAGE_SIZE):
+    """
+    Returns a CachedResult with up to `limit` TMDb recommendations.
 
-    if resp.status_code != 200:
-        raise TMDBError(f"TMDb returned status {resp.status_code}")
+    The pages needed are fetched concurrently (each cached on its own by
+    afetch_recommendations) and merged in page order without duplicates,
+    so a deep list costs one upstream round trip of latency. Only if the
+    pages overlap too much for `limit` is another round fetched. If a
+    later page fails the list is cut short there; only a failing first
+    page raises.
+    """
+    results, movies, seen = [], [], set()
+    next_page, exhausted = 1, False
+    while len(movies) < limit and not exhausted:
+        pages = range(next_page, next_page + math.ceil((limit - len(movies)) / TMDB_PAGE_SIZE))
+        next_page = pages.stop
+        outcomes = await asyncio.gather(
+            *(afetch_recommendations(movie_id, page) for page in pages), return_exceptions=True
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                if not results:
+                    raise outcome
+                logger.warning("Recommendations for %s cut short: %s", movie_id, outcome)
+                exhausted = True
+                break
+            results.append(outcome)
+            for movie in outcome.value:
+                if movie.get("id") not in seen:
+                    seen.add(movie.get("id"))
+                    movies.append(movie)
+            if len(outcome.value) < TMDB_PAGE_SIZE:
+                exhausted = True  # last page
+                break
+    return merge_cached_results(results, movies[:limit])
 
-    data = resp.json().get('results', [])
-    cache.set(cache_key, data, CACHE_TIMEOUT)
-    return data
\ No newline at end of file
+def _title_cache_key(normalized):
+    return f"title_tmdb_id_{hashlib.md5(normalized.encode()).hexdigest()}"
+
+def _local_tmdb_id(title):
+    # The autocomplete index is keyed by the same normalized titles as the
+    # cache, so "the matrix!" finds "The Matrix" without a table scan
+    movie = autocomplete_index.get().exact(title)
+    return movie["tmdb_id"] if movie else None
+
+def _remember_title(cache_key, tmdb_id):
+    if tmdb_id:
+        return cache_key, tmdb_id, TITLE_CACHE_TIMEOUT
+    return cache_key, TITLE_NOT_FOUND, TITLE_NOT_FOUND_TIMEOUT
+
+async def aresolve_tmdb_id(title):
+    """
+    Returns the TMDb ID for a movie title, or None if nothing matches.
+
+    Lookups are cached under the normalized title ("The Matrix " and
+    "the matrix" share a key), misses included. On a cache miss the local
+    Movie table is checked before falling back to TMDb search.
+    """
+    normalized = normalize(title)
+    if not normalized:
+        return None
+    cache_key = _title_cache_key(normalized)
+    tmdb_id = await cache.aget(cache_key)
+    if tmdb_id is not None:
+        return tmdb_id or None
+
+    tmdb_id = await sync_to_async(_local_tmdb_id)(title)
+    if tmdb_id is None:
+        logger.info("Resolving title %r on TMDb", normalized)
+        tmdb_id = await asearch_movie(title)
+    await cache.aset(*_remember_title(cache_key, tmdb_id))
+    return tmdb_id or None
@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .autocomplete import autocomplete_index
+from .views import MovieListCreateView
+from .models import Movie
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def clear_movie_list_cache(sender, instance, **kwargs):
+    MovieListCreateView.invalidate_cache()
+
+@receiver(post_save, sender=Movie)
+def index_movie_title(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete_index.movie_saved(instance))
+
+@receiver(post_delete, sender=Movie)
+def unindex_movie_title(sender, instance, **kwargs):
+    movie_id = instance.id
+    transaction.on_commit(lambda: autocomplete_index.movie_deleted(movie_id))
@@ -1,3 +1,1090 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+import httpx
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import FavoriteActivity, FavoriteMovie, MovieRating, Watchlist
+from . import caching, enrichment, ratelimit, recommender, search, services, tmdb
+from .autocomplete import AutocompleteIndex, PrefixIndex, autocomplete_index
+from .hydration import hydrate_tmdb_results
+from .instrumentation import RequestMetrics, measure
+from .models import Movie, MovieSimilarity
+from .utils import load_tmdb_movie_details
+from .pagination import FavoriteMoviePagination
 
-# Create your tests here.
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+INSTRUMENTED_CACHES = {
+    "default": {"BACKEND": "movies.instrumentation.InstrumentedCache", "LOCATION": "locmem"},
+    "locmem": LOCMEM_CACHES["default"],
+}
+FIGHT_CLUB = {
+    "id": 550, "title": "Fight Club", "overview": "", "popularity": 61.4,
+    "vote_average": 8.4, "release_date": "1999-10-15", "poster_path": "/pB8BM7pdSp6B6Ih7QZ4DrQ3PmJK.jpg",
+}
+
+
+class StubTMDbHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive TMDb stand-in; counts TCP connections it accepts."""
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests += 1
+        status_code = 404 if self.path.startswith("/missing") else 200
+        body = json.dumps({"results": [FIGHT_CLUB]}).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SlowTMDbHandler(StubTMDbHandler):
+    """Answers every request after `delay` seconds, like a slow upstream."""
+    delay = 0.25
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        super().do_GET()
+
+
+class PagedTMDbHandler(SlowTMDbHandler):
+    """Slow list endpoint: page N holds ids 15N..15N+19, so neighbouring pages overlap by 5."""
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.server.requests += 1
+        page = int(parse_qs(urlparse(self.path).query).get("page", ["1"])[0])
+        results = [{**FIGHT_CLUB, "id": 15 * page + i} for i in range(20)]
+        body = json.dumps({"page": page, "results": results}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class DetailsTMDbHandler(StubTMDbHandler):
+    """/movie/<id>: Fight Club for 550, 404 for 404, 503 for anything else."""
+
+    def do_GET(self):
+        self.server.requests += 1
+        tmdb_id = int(urlparse(self.path).path.rsplit("/", 1)[-1])
+        status_code = 200 if tmdb_id == 550 else 404 if tmdb_id == 404 else 503
+        body = json.dumps(FIGHT_CLUB if status_code == 200 else {}).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FlakyTMDbHandler(StubTMDbHandler):
+    """Answers 503 to the first `failures` requests, then like StubTMDbHandler."""
+    failures = 2
+
+    def do_GET(self):
+        if self.server.requests >= self.failures:
+            return super().do_GET()
+        self.server.requests += 1
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 drops bursts of connects
+
+
+class StubTMDbServer:
+    def __init__(self, handler=StubTMDbHandler):
+        self.httpd = StubHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.connections = 0
+        self.httpd.requests = 0
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self.httpd
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TMDbClientTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit._local_bucket.reset()
+        tmdb.reset_session()
+        self.addCleanup(tmdb.reset_session)
+
+    def test_session_reuses_connection(self):
+        server = StubTMDbServer()
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            for _ in range(5):
+                self.assertEqual(tmdb.tmdb_get("/trending/movie/week")["results"][0]["id"], 550)
+
+        self.assertEqual(httpd.requests, 5)
+        self.assertEqual(httpd.connections, 1)
+
+    def test_non_200_raises_tmdb_error(self):
+        server = StubTMDbServer()
+        with server, override_settings(TMDB_BASE_URL=server.url):
+            with self.assertRaises(tmdb.TMDBError) as ctx:
+                tmdb.tmdb_get("/missing")
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_connection_error_raises_tmdb_error(self):
+        with override_settings(TMDB_BASE_URL="http://127.0.0.1:9", TMDB_MAX_RETRIES=0):
+            with self.assertRaises(tmdb.TMDBError):
+                tmdb.tmdb_get("/trending/movie/week")
+
+    @override_settings(TMDB_MAX_RETRIES=2, TMDB_BACKOFF_FACTOR=0)
+    def test_sync_and_async_calls_retry_5xx_alike(self):
+        for get in (tmdb.tmdb_get, async_to_sync(tmdb.atmdb_get)):
+            server = StubTMDbServer(FlakyTMDbHandler)
+            with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+                self.assertEqual(get("/trending/movie/week")["results"][0]["id"], 550)
+            self.assertEqual(httpd.requests, 3)
+
+        server = StubTMDbServer(FlakyTMDbHandler)
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url, TMDB_MAX_RETRIES=1):
+            with self.assertRaises(tmdb.TMDBError) as ctx:
+                tmdb.tmdb_get("/trending/movie/day")
+        self.assertEqual((ctx.exception.status_code, httpd.requests), (503, 2))
+
+    def test_not_found_is_negative_cached(self):
+        server = StubTMDbServer()
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            for _ in range(3):
+                with self.assertRaises(tmdb.TMDBError) as ctx:
+                    tmdb.tmdb_get("/missing/1")
+                self.assertEqual(ctx.exception.status_code, 404)
+
+        self.assertEqual(httpd.requests, 1)
+        self.assertEqual(tmdb.circuit_state()["state"], "closed")
+
+    @override_settings(TMDB_BASE_URL="http://127.0.0.1:9", TMDB_MAX_RETRIES=0,
+                       TMDB_CIRCUIT_FAILURE_THRESHOLD=3, TMDB_ERROR_CACHE_TIMEOUT=0)
+    def test_circuit_opens_after_repeated_failures(self):
+        for page in range(3):
+            with self.assertRaises(tmdb.TMDBError):
+                tmdb.tmdb_get("/trending/movie/week", {"page": page})
+        self.assertEqual(tmdb.circuit_state()["state"], "open")
+
+        with self.assertRaises(tmdb.CircuitOpenError):
+            tmdb.tmdb_get("/trending/movie/day")
+
+    def test_half_open_probe_closes_circuit(self):
+        server = StubTMDbServer()
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            tmdb._open_circuit(5)
+            cache.delete(tmdb.CIRCUIT_OPEN_KEY)  # cooldown elapsed
+            self.assertEqual(tmdb.circuit_state()["state"], "half-open")
+
+            self.assertEqual(tmdb.tmdb_get("/trending/movie/week")["results"][0]["id"], 550)
+
+        self.assertEqual(httpd.requests, 1)
+        self.assertEqual(tmdb.circuit_state()["state"], "closed")
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_RATE_LIMIT=0.01, TMDB_RATE_BURST=4,
+                   TMDB_RATE_BACKGROUND_RESERVE=0.5, TMDB_RATE_INTERACTIVE_MAX_WAIT=0,
+                   TMDB_RATE_BACKGROUND_MAX_WAIT=0)
+class TMDbRateLimitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit._local_bucket.reset()
+        self.addCleanup(ratelimit._local_bucket.reset)
+
+    def test_background_calls_leave_a_reserve_for_interactive_ones(self):
+        self.assertEqual(ratelimit.acquire(ratelimit.BACKGROUND), 0)
+        self.assertEqual(ratelimit.acquire(ratelimit.BACKGROUND), 0)
+        self.assertGreater(ratelimit.acquire(ratelimit.BACKGROUND), 0)
+
+        self.assertEqual(ratelimit.acquire(ratelimit.INTERACTIVE), 0)
+        self.assertEqual(ratelimit.acquire(ratelimit.INTERACTIVE), 0)
+        self.assertGreater(ratelimit.acquire(ratelimit.INTERACTIVE), 0)
+
+    def test_exhausted_budget_fails_without_calling_tmdb(self):
+        server = StubTMDbServer()
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            for _ in range(4):
+                tmdb.tmdb_get("/trending/movie/week")
+            with self.assertRaises(tmdb.RateLimitedError):
+                tmdb.tmdb_get("/trending/movie/week")
+
+        self.assertEqual(httpd.requests, 4)
+        self.assertEqual(tmdb.circuit_state()["state"], "closed")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CachedFetchTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def loader(self, value="fresh", delay=0):
+        """A loader counting its calls in self.calls."""
+        self.calls = 0
+
+        def load():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return load
+
+    def wait_for_refresh(self, key, timeout=5):
+        """Waits for a background refresh to release the key's lock."""
+        deadline = time.monotonic() + timeout
+        while cache.get(f"lock:{key}") is not None:
+            self.assertLess(time.monotonic(), deadline, "background refresh did not finish")
+            time.sleep(0.01)
+
+    def test_concurrent_misses_call_upstream_once(self):
+        load = self.loader(delay=0.25)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: caching.cached_fetch("key", load, 60), range(8)))
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({r.value for r in results}, {"fresh"})
+        self.assertEqual(sorted(r.status for r in results), ["hit"] * 7 + ["miss"])
+        self.assertIsNone(cache.get("lock:key"))
+
+    def test_entries_near_expiry_are_refreshed_early(self):
+        caching.cached_fetch("key", lambda: "old", 60)
+        entry = cache.get("key")
+        cache.set("key", {**entry, "delta": 1, "soft_expires_at": time.time() + 5})
+        load = self.loader()
+
+        # random() near 1: the gap is tiny, so nothing happens 5s before expiry
+        with mock.patch.object(caching.random, "random", return_value=0.999):
+            self.assertEqual(caching.cached_fetch("key", load, 60), ("old", 0, "hit"))
+        self.assertEqual(self.calls, 0)
+
+        # random() near 0: -log(random()) is large, so this reader refreshes
+        with mock.patch.object(caching.random, "random", return_value=1e-6):
+            self.assertEqual(caching.cached_fetch("key", load, 60).value, "old")
+        self.wait_for_refresh("key")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.get("key")["value"], "fresh")
+
+    def expire(self, key):
+        """Moves an entry past its soft expiry (it stays until the hard timeout)."""
+        entry = cache.get(key)
+        cache.set(key, {**entry, "fetched_at": time.time() - 120, "soft_expires_at": time.time() - 60}, 3600)
+
+    def test_stale_entries_are_served_while_refreshing_in_background(self):
+        caching.cached_fetch("key", lambda: "old", 60, 3600)
+        self.expire("key")
+        load = self.loader(delay=0.25)
+
+        start = time.monotonic()
+        result = caching.cached_fetch("key", load, 60, 3600)
+        self.assertLess(time.monotonic() - start, 0.25)  # did not wait for the loader
+        self.assertEqual((result.value, result.status, result.age), ("old", "stale", 120))
+        # A second reader does not start another refresh
+        self.assertEqual(caching.cached_fetch("key", load, 60, 3600).status, "stale")
+
+        self.wait_for_refresh("key")
+        self.assertEqual(self.calls, 1)
+        result = caching.cached_fetch("key", load, 60, 3600)
+        self.assertEqual((result.value, result.status), ("fresh", "hit"))
+
+    def test_failed_background_refresh_keeps_serving_stale(self):
+        caching.cached_fetch("key", lambda: "old", 60, 3600)
+        self.expire("key")
+
+        def fail():
+            raise tmdb.TMDBError("TMDb returned status 503", status_code=503)
+
+        with self.assertLogs("movies.caching", "WARNING"):
+            result = caching.cached_fetch("key", fail, 60, 3600)
+            self.assertEqual((result.value, result.status), ("old", "stale"))
+            self.wait_for_refresh("key")
+
+        # The entry is untouched and the next reader retries the refresh
+        self.assertEqual(cache.get("key")["value"], "old")
+        self.assertEqual(caching.cached_fetch("key", self.loader(), 60, 3600).status, "stale")
+        self.wait_for_refresh("key")
+        self.assertEqual(self.calls, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheNamespaceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bumping_a_missing_or_evicted_counter_starts_above_the_default(self):
+        self.assertEqual(caching.bump_namespace("favorites:1"), 2)
+
+        key = caching.versioned_key("favorites:2", "page")
+        cache.delete("ns:favorites:2")  # evicted
+        self.assertEqual(caching.bump_namespace("favorites:2"), 2)
+        self.assertNotEqual(caching.versioned_key("favorites:2", "page"), key)
+
+    def test_concurrent_first_bumps_both_count(self):
+        # Another worker adds the counter between our failed incr() and add()
+        def add_first(key, value, timeout):
+            cache.set(key, value, timeout)
+            return False
+
+        with mock.patch.object(cache, "add", side_effect=add_first):
+            self.assertEqual(caching.bump_namespace("favorites:1"), 3)
+
+    def test_bumps_in_rolled_back_transactions_are_dropped(self):
+        version = caching.namespace_version("favorites:1")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                caching.bump_namespace_on_commit("favorites:1")
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(caching.namespace_version("favorites:1"), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            caching.bump_namespace_on_commit("favorites:1")
+        self.assertEqual(caching.namespace_version("favorites:1"), version + 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_MAX_RETRIES=0, TMDB_POOL_SIZE=20, TMDB_ENRICHMENT_ENABLED=False)
+class AsyncTMDbViewLoadTests(TransactionTestCase):
+    """
+    Load test: N concurrent recommendation requests against a TMDb stub that
+    takes SlowTMDbHandler.delay per call. Sync workers serve one request at
+    a time each; a single async worker overlaps all the upstream waits.
+    """
+    requests_count = 12
+    sync_workers = 3
+
+    def setUp(self):
+        cache.clear()
+        tmdb.reset_session()
+        self.addCleanup(tmdb.reset_session)
+
+    def urls(self, first_id):
+        return [f"/api/movies/recommended/{movie_id}/"
+                for movie_id in range(first_id, first_id + self.requests_count)]
+
+    def test_one_async_worker_outpaces_sync_workers(self):
+        server = StubTMDbServer(SlowTMDbHandler)
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            start = time.monotonic()
+            with ThreadPoolExecutor(self.sync_workers) as workers:
+                sync_statuses = list(workers.map(lambda url: Client().get(url).status_code, self.urls(1)))
+            sync_elapsed = time.monotonic() - start
+
+            async def one_async_worker():
+                client = AsyncClient()
+                return await asyncio.gather(*(client.get(url) for url in self.urls(1000)))
+
+            start = time.monotonic()
+            async_responses = async_to_sync(one_async_worker)()
+            async_elapsed = time.monotonic() - start
+
+        self.assertEqual(sync_statuses, [200] * self.requests_count)
+        self.assertEqual([r.status_code for r in async_responses], [200] * self.requests_count)
+        self.assertEqual(httpd.requests, 2 * self.requests_count)
+
+        # Sync: requests_count / sync_workers sequential upstream waits (~1s).
+        # Async: the waits overlap, so close to a single delay (~0.25s).
+        self.assertGreaterEqual(sync_elapsed, SlowTMDbHandler.delay * self.requests_count / self.sync_workers)
+        self.assertLess(async_elapsed, sync_elapsed / 2,
+                        f"async {async_elapsed:.2f}s vs {self.sync_workers} sync workers {sync_elapsed:.2f}s")
+
+    def test_wsgi_requests_close_their_async_client(self):
+        server = StubTMDbServer()
+        close_spy = mock.patch.object(httpx.AsyncClient, "aclose", autospec=True, side_effect=httpx.AsyncClient.aclose)
+        with server, override_settings(TMDB_BASE_URL=server.url), close_spy as aclose:
+            self.assertEqual(Client().get("/api/movies/recommended/550/").status_code, 200)
+            self.assertEqual(aclose.call_count, 1)
+
+            # Under ASGI the worker's loop, and its pooled client, outlive the request
+            async_to_sync(AsyncClient().get)("/api/movies/recommended/551/")
+            self.assertEqual(aclose.call_count, 1)
+
+    def test_deep_recommendation_list_fetches_pages_concurrently(self):
+        server = StubTMDbServer(PagedTMDbHandler)
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            Client().get("/api/movies/recommended/1/?limit=1")  # warm up the client and URLconf
+            httpd.requests = 0
+            start = time.monotonic()
+            response = Client().get("/api/movies/recommended/550/?limit=60")
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(response.status_code, 200)
+        ids = [movie["id"] for movie in response.json()]
+        self.assertEqual(len(ids), 60)
+        self.assertEqual(len(set(ids)), 60)
+        self.assertEqual(ids[:3], [15, 16, 17])
+        # Pages 1-3 together, then page 4 to make up for the overlap: two
+        # upstream waits instead of four
+        self.assertEqual(httpd.requests, 4)
+        self.assertLess(elapsed, 4 * PagedTMDbHandler.delay)
+
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class HydrationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("alice", password="x")
+        self.movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(1999, 10, 15),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(550, 560)
+        ]
+        MovieRating.objects.create(user=self.user, movie=self.movies[0], rating=4)
+        FavoriteMovie.objects.create(user=self.user, movie=self.movies[0])
+        Watchlist.objects.create(user=self.user, movie=self.movies[1])
+        # Ten local movies plus ten TMDb-only ones
+        self.results = [{**FIGHT_CLUB, "id": tmdb_id} for tmdb_id in range(550, 570)]
+
+    def test_tmdb_results_are_hydrated_with_one_query_per_table(self):
+        with self.assertNumQueries(4):
+            movies = hydrate_tmdb_results(self.results, self.user)
+
+        first, second, unknown = movies[0], movies[1], movies[-1]
+        self.assertEqual(first["local_id"], self.movies[0].id)
+        self.assertEqual((first["average_rating"], first["ratings_count"]), (4.0, 1))
+        self.assertEqual((first["user_rating"], first["is_favorite"], first["in_watchlist"]), (4, True, False))
+        self.assertEqual((second["user_rating"], second["is_favorite"], second["in_watchlist"]), (None, False, True))
+        self.assertNotIn("local_id", unknown)
+        self.assertFalse(unknown["is_favorite"])
+        self.assertNotIn("local_id", self.results[0])  # inputs (cached values) are left alone
+
+    def test_anonymous_users_only_get_local_ratings(self):
+        with self.assertNumQueries(1):
+            movies = hydrate_tmdb_results(self.results, AnonymousUser())
+        self.assertEqual(movies[0]["ratings_count"], 1)
+        self.assertNotIn("is_favorite", movies[0])
+
+    def test_cached_movie_list_pages_carry_each_users_favorites(self):
+        def get_as(user):
+            return self.client.get("/api/movies/?page_size=20",
+                                   HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+        other = get_user_model().objects.create_user("bob", password="x")
+        self.assertEqual(get_as(other)["X-Cache"], "MISS")
+        response = get_as(self.user)
+        self.assertEqual(response["X-Cache"], "HIT")
+        favorites = {row["tmdb_id"] for row in response.json()["results"] if row["is_favorite"]}
+        self.assertEqual(favorites, {550})
+
+    def test_every_movie_serializer_path_renders_is_favorite(self):
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+        created = self.client.post("/api/movies/", {"tmdb_id": 600, "title": "New"},
+                                   content_type="application/json", **auth)
+        self.assertEqual(created.status_code, 201)
+        self.assertIs(created.json()["is_favorite"], False)
+
+        other = get_user_model().objects.create_user("bob", password="x")
+        MovieRating.objects.create(user=other, movie=self.movies[2], rating=5)
+        for_you = self.client.get("/api/movies/for-you/", **auth).json()
+        self.assertTrue(for_you)
+        self.assertEqual({row["is_favorite"] for row in for_you}, {False})
+
+
+def server_timing(response):
+    """{metric: (milliseconds, description)} from a Server-Timing header."""
+    return {name: (float(duration), description)
+            for name, duration, description in re.findall(r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?',
+                                                           response["Server-Timing"])}
+
+
+@override_settings(CACHES=INSTRUMENTED_CACHES, TMDB_MAX_RETRIES=0, TMDB_ENRICHMENT_ENABLED=False,
+                   REQUEST_METRICS_SAMPLE_RATE=1)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmdb.reset_session()
+        self.addCleanup(tmdb.reset_session)
+        self.movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(1999, 10, 15),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(1, 11)
+        ]
+
+    def test_sampled_requests_report_sql_and_cache(self):
+        with self.assertLogs("movie_backend.middleware", "INFO") as logs:
+            miss = server_timing(self.client.get("/api/movies/"))
+            hit = server_timing(self.client.get("/api/movies/"))
+
+        self.assertEqual(miss["cache"][1], "0 hits, 1 misses")
+        self.assertEqual(hit["cache"][1], "1 hits, 0 misses")
+        first, second = (record.request_metrics for record in logs.records)
+        self.assertEqual((first["path"], first["status"]), ("/api/movies/", 200))
+        self.assertGreater(first["queries"], second["queries"])
+        self.assertEqual(miss["db"][1], f'{first["queries"]} queries')
+
+    def test_unsampled_requests_are_left_alone(self):
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=0):
+            self.assertNotIn("Server-Timing", self.client.get("/api/movies/"))
+
+    def test_cache_backend_counts_calls_and_passes_them_on(self):
+        cache.set("answer", 42)
+        with measure(RequestMetrics()) as metrics:
+            self.assertEqual(cache.get("answer"), 42)
+            self.assertIsNone(async_to_sync(cache.aget)("question"))
+
+        self.assertEqual((metrics.cache_calls, metrics.cache_hits, metrics.cache_misses), (2, 1, 1))
+        self.assertEqual(caches["locmem"].get("answer"), 42)
+
+    def test_repeated_query_templates_are_flagged(self):
+        with measure(RequestMetrics()) as metrics:
+            Movie.objects.count()
+            for movie in self.movies:
+                Movie.objects.get(pk=movie.pk)
+
+        self.assertEqual(metrics.query_count, 11)
+        [(sql, count)] = metrics.repeated_queries()
+        self.assertEqual(count, 10)
+        self.assertIn("WHERE", sql)
+
+    def test_tmdb_calls_are_timed(self):
+        server = StubTMDbServer(SlowTMDbHandler)
+        with server, override_settings(TMDB_BASE_URL=server.url), self.assertLogs("movie_backend.middleware"):
+            timing = server_timing(self.client.get("/api/movies/trending/"))
+        self.assertEqual(timing["tmdb"][1], "1 calls")
+        self.assertGreaterEqual(timing["tmdb"][0], SlowTMDbHandler.delay * 1000)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class MovieListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("alice", password="x")
+        self.movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(2020 + tmdb_id % 4, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(1, 9)
+        ]
+
+    def test_equivalent_query_strings_share_one_entry(self):
+        first = self.client.get("/api/movies/?year=2022,2023&ordering=title")
+        self.assertEqual(first["X-Cache"], "MISS")
+
+        for query in ("ordering=title&year=2023,2022", "year=2023,+2022&ordering=title&page=1",
+                      "year=2022&year=2023&ordering=title&search="):
+            with self.subTest(query=query), self.assertNumQueries(0):
+                response = self.client.get(f"/api/movies/?{query}")
+                self.assertEqual(response["X-Cache"], "HIT")
+                self.assertEqual(response.json(), first.json())
+
+        self.assertEqual(self.client.get("/api/movies/?year=2022&ordering=title")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/movies/?year=2022,2023&ordering=-title")["X-Cache"], "MISS")
+
+    def test_rating_and_movie_writes_invalidate_pages(self):
+        self.assertEqual(self.client.get("/api/movies/")["X-Cache"], "MISS")
+        self.assertEqual(self.client.get("/api/movies/")["X-Cache"], "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MovieRating.objects.create(user=self.user, movie=self.movies[0], rating=5)
+        response = self.client.get("/api/movies/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        rated = next(m for m in response.json()["results"] if m["id"] == self.movies[0].id)
+        self.assertEqual((rated["average_rating"], rated["ratings_count"]), (5.0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movies[1].title = "Renamed"
+            self.movies[1].save()
+        response = self.client.get("/api/movies/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn("Renamed", [m["title"] for m in response.json()["results"]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movies[2].delete()
+        self.assertEqual(self.client.get("/api/movies/")["X-Cache"], "MISS")
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_MAX_RETRIES=0, TMDB_ENRICHMENT_ENABLED=False)
+class RecommenderTests(TestCase):
+    """
+    Rating columns over (alice, bob, carol): A=(5,4,0), B=(5,3,0), C=(0,1,5),
+    D=(0,0,5); E has no ratings. Cosines: A~B 0.991, C~D 0.981, A~C 0.123,
+    B~C 0.101, everything else 0.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.alice, bob, carol = (User.objects.create_user(name, password="x") for name in ("alice", "bob", "carol"))
+        cls.movies = {
+            name: Movie.objects.create(tmdb_id=tmdb_id, title=name, release_date=date(2000, 1, 1),
+                                       poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id, name in enumerate("ABCDE", start=1)
+        }
+        for user, ratings in ((cls.alice, {"A": 5, "B": 5}), (bob, {"A": 4, "B": 3, "C": 1}), (carol, {"C": 5, "D": 5})):
+            for name, rating in ratings.items():
+                MovieRating.objects.create(user=user, movie=cls.movies[name], rating=rating)
+
+    def setUp(self):
+        cache.clear()
+        tmdb.reset_session()
+        self.addCleanup(tmdb.reset_session)
+
+    def neighbours(self):
+        names = {movie.pk: name for name, movie in self.movies.items()}
+        return {(names[s.movie_id], names[s.neighbor_id]): round(s.score, 3) for s in MovieSimilarity.objects.all()}
+
+    def test_top_k_cosine_neighbours(self):
+        self.assertEqual(recommender.build_similarities(k=1), 4)
+        self.assertEqual(self.neighbours(), {("A", "B"): 0.991, ("B", "A"): 0.991, ("C", "D"): 0.981, ("D", "C"): 0.981})
+
+        # A larger k keeps every neighbour above MIN_SCORE, best first
+        recommender.build_similarities(k=20)
+        self.assertEqual(self.neighbours(), {
+            ("A", "B"): 0.991, ("A", "C"): 0.123, ("B", "A"): 0.991, ("B", "C"): 0.101,
+            ("C", "D"): 0.981, ("C", "A"): 0.123, ("C", "B"): 0.101, ("D", "C"): 0.981,
+        })
+        self.assertEqual([m["id"] for m in recommender.similar_movies(3)], [4, 1, 2])
+
+    def test_for_you_ranks_neighbours_then_falls_back_to_most_rated(self):
+        recommender.build_similarities()
+        candidates = recommender.compute_user_candidates(self.alice.id)
+        self.assertEqual([c["title"] for c in candidates], ["C", "D"])
+        self.assertAlmostEqual(candidates[0]["score"], 0.123 + 0.101, places=2)
+        self.assertEqual(candidates[1]["score"], 0.0)
+
+        # No history: most rated first, then best average; unrated movies never
+        newcomer = get_user_model().objects.create_user("dave", password="x")
+        self.assertEqual([c["title"] for c in recommender.compute_user_candidates(newcomer.id)],
+                         ["A", "B", "C", "D"])
+
+    def test_movies_without_neighbours_fall_back_to_tmdb(self):
+        recommender.build_similarities()
+        self.assertEqual(recommender.similar_movies(5), [])
+
+        server = StubTMDbServer()
+        with server, override_settings(TMDB_BASE_URL=server.url):
+            local = self.client.get("/api/movies/recommended/1/")
+            cold = self.client.get("/api/movies/recommended/5/")
+
+        self.assertEqual(local["X-Recommendation-Source"], "local")
+        self.assertEqual([m["id"] for m in local.json()], [2, 3])
+        self.assertEqual(cold["X-Recommendation-Source"], "tmdb")
+        self.assertEqual([m["id"] for m in cold.json()], [550])
+
+
+class PrefixIndexTests(SimpleTestCase):
+    @staticmethod
+    def movie(pk, title, ratings_count=0, status=Movie.ENRICHMENT_DONE):
+        return Movie(id=pk, tmdb_id=pk, title=title, ratings_count=ratings_count, enrichment_status=status)
+
+    def titles(self, index, query, limit=10):
+        return [row["title"] for row in index.search(query, limit)]
+
+    def test_any_word_matches_by_prefix_most_rated_first(self):
+        index = PrefixIndex([
+            self.movie(1, "The Dark Knight", 10), self.movie(2, "Knight and Day", 30),
+            self.movie(3, "Amélie", 5), self.movie(4, "A Knight's Tale", 30),
+        ])
+        self.assertEqual(self.titles(index, "kni"), ["A Knight's Tale", "Knight and Day", "The Dark Knight"])
+        self.assertEqual(self.titles(index, "KNIGHT", limit=1), ["A Knight's Tale"])
+        self.assertEqual(self.titles(index, "the dark k"), ["The Dark Knight"])
+        self.assertEqual(self.titles(index, "ame"), ["Amélie"])
+        self.assertEqual(self.titles(index, "  "), [])
+
+    def test_updates_and_removals_replace_memoized_prefixes(self):
+        index = PrefixIndex([self.movie(1, "Alien", 3), self.movie(2, "Aliens", 2)])
+        self.assertEqual(self.titles(index, "ali"), ["Alien", "Aliens"])  # memoized now
+
+        index.update(self.movie(1, "Alien: Covenant", 3))
+        index.update(self.movie(3, "Alita", 9))
+        index.remove(2)
+        self.assertEqual(self.titles(index, "ali"), ["Alita", "Alien: Covenant"])
+        self.assertEqual(self.titles(index, "cov"), ["Alien: Covenant"])
+        self.assertEqual((len(index), index.max_id), (2, 3))
+
+    def test_pending_movies_are_tracked_until_enriched(self):
+        index = PrefixIndex([self.movie(1, "", status=Movie.ENRICHMENT_PENDING), self.movie(2, "Heat"),
+                             self.movie(3, "", status=Movie.ENRICHMENT_PENDING)])
+        self.assertEqual(index.pending_ids(1), [3])
+
+        index.update(self.movie(3, "Ronin"))
+        self.assertEqual(index.pending_ids(10), [1])
+
+    def test_exact_matches_whole_normalized_titles(self):
+        index = PrefixIndex([self.movie(1, "The Matrix", 3), self.movie(2, "Matrix", 1),
+                             self.movie(3, "The Matrix", 8), self.movie(4, "The Matrix Reloaded", 9)])
+        self.assertEqual(index.exact("  the MATRIX! ")["id"], 3)
+        self.assertEqual(index.exact("matrix")["id"], 2)
+        self.assertIsNone(index.exact("the"))
+        self.assertIsNone(index.exact("?"))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class AutocompleteIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete_index.reset()
+        self.addCleanup(autocomplete_index.reset)
+        self.pending = Movie.objects.create(tmdb_id=550, title="")
+
+    def test_enriched_titles_are_indexed_at_once(self):
+        self.assertEqual(autocomplete_index.get().search("fight"), [])
+        with mock.patch.object(enrichment, "load_tmdb_movie_details",
+                               return_value={"title": "Fight Club", "release_date": date(1999, 10, 15),
+                                             "poster_url": None}):
+            enrichment.enrich_batch([550])
+        self.assertEqual([row["title"] for row in autocomplete_index.get().search("fight")], ["Fight Club"])
+
+    def test_refresh_picks_up_titles_enriched_by_other_processes(self):
+        index = AutocompleteIndex()
+        index.get()
+        # Another worker enriches the movie and creates a new one
+        Movie.objects.filter(pk=self.pending.pk).update(title="Fight Club", enrichment_status=Movie.ENRICHMENT_DONE)
+        Movie.objects.create(tmdb_id=551, title="Fight Club 2", release_date=date(2020, 1, 1),
+                             poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+
+        with mock.patch("movies.autocomplete.close_old_connections"):
+            index._refresh(rebuild=False)
+        self.assertEqual([row["title"] for row in index.get().search("fig")], ["Fight Club", "Fight Club 2"])
+        self.assertEqual(index.get().pending_ids(10), [])
+
+
+class SearchTMDbHandler(StubTMDbHandler):
+    """/search/movie: Fight Club for "fight club", no results for anything else."""
+
+    def do_GET(self):
+        self.server.requests += 1
+        query = parse_qs(urlparse(self.path).query)["query"][0]
+        body = json.dumps({"results": [FIGHT_CLUB] if query.lower() == "fight club" else []}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_MAX_RETRIES=0, TMDB_ENRICHMENT_ENABLED=False)
+class TitleResolutionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmdb.reset_session()
+        self.addCleanup(tmdb.reset_session)
+        autocomplete_index.reset()
+        self.addCleanup(autocomplete_index.reset)
+        Movie.objects.create(tmdb_id=603, title="The Matrix", release_date=date(1999, 3, 31),
+                             poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+        self.resolve = async_to_sync(services.aresolve_tmdb_id)
+
+    def test_local_titles_resolve_without_tmdb(self):
+        server = StubTMDbServer(SearchTMDbHandler)
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            self.assertEqual(self.resolve("the MATRIX!"), 603)
+        self.assertEqual(httpd.requests, 0)
+
+    def test_unknown_titles_fall_back_to_tmdb_once(self):
+        server = StubTMDbServer(SearchTMDbHandler)
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            self.assertEqual(self.resolve("Fight Club"), 550)
+            self.assertEqual(self.resolve(" fight  club "), 550)
+        self.assertEqual(httpd.requests, 1)
+
+    def test_misses_are_negative_cached(self):
+        server = StubTMDbServer(SearchTMDbHandler)
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            self.assertIsNone(self.resolve("No Such Movie"))
+            self.assertIsNone(self.resolve("no such movie"))
+        self.assertEqual(httpd.requests, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class MovieSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        titles = ["The Star Wars Holiday Special: Extended Edition", "Star Wars", "Star Trek",
+                  "Wars of the Roses", "Starship Troopers"]
+        for tmdb_id, title in enumerate(titles, start=1):
+            Movie.objects.create(tmdb_id=tmdb_id, title=title, release_date=date(2000, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+
+    def titles(self, query):
+        return [m["title"] for m in self.client.get(f"/api/movies/?{query}").json()["results"]]
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 ranking")
+    def test_every_term_matches_as_a_prefix_best_match_first(self):
+        self.assertEqual(self.titles("title=star+wars"),
+                         ["Star Wars", "The Star Wars Holiday Special: Extended Edition"])
+        self.assertEqual(self.titles("search=sta+WA"), self.titles("title=star+wars"))
+        self.assertEqual(self.titles("title=star&search=trek"), ["Star Trek"])
+        self.assertEqual(self.titles("title=star&ordering=title"),
+                         ["Star Trek", "Star Wars", "Starship Troopers",
+                          "The Star Wars Holiday Special: Extended Edition"])
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 ranking")
+    def test_renamed_titles_are_reindexed(self):
+        Movie.objects.filter(title="Star Trek").update(title="Star Trek: Generations")
+        self.assertEqual(self.titles("title=generations"), ["Star Trek: Generations"])
+        self.assertEqual(self.titles("title=trek"), ["Star Trek: Generations"])
+
+    def test_postgresql_matches_full_text_or_trigrams(self):
+        from django.db.backends.postgresql.base import DatabaseWrapper
+
+        postgres = DatabaseWrapper({**connection.settings_dict, "ENGINE": "django.db.backends.postgresql"})
+        with mock.patch.object(search, "connection", postgres):
+            queryset = search.search_movies(Movie.objects.all(), "Star wa!")
+        sql, params = queryset.query.get_compiler(connection=postgres).as_sql()
+
+        self.assertIn("search_vector @@ to_tsquery('simple', %s) OR title %% %s", sql)
+        self.assertIn("ts_rank(search_vector, to_tsquery('simple', %s)) + similarity(title, %s)", sql)
+        self.assertEqual(params, ("star:* & wa:*", "star wa") * 2)
+
+    def test_other_databases_fall_back_to_icontains(self):
+        with mock.patch.object(search, "connection", mock.Mock(vendor="mysql")):
+            queryset = search.search_movies(Movie.objects.all(), "wars star")
+        self.assertEqual(sorted(queryset.values_list("title", "search_rank")),
+                         [("Star Wars", 0.0), ("The Star Wars Holiday Special: Extended Edition", 0.0)])
+
+
+def query_plans(client, path, **extra):
+    """
+    Runs a GET and returns (sql, SQLite plan lines) for each SELECT it made,
+    leaving out the JWT user lookup.
+    """
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(path, **extra)
+    assert response.status_code == 200, (path, response.status_code)
+    plans = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query["sql"]
+            if not sql.startswith("SELECT") or 'FROM "users_user"' in sql:
+                continue
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+    return plans
+
+
+class QueryPlanAssertions:
+    """
+    TestCase mixin: every table is read through an index and no result is
+    sorted after the fact. SQLite only (EXPLAIN QUERY PLAN).
+    """
+
+    def assertPlansUseIndexes(self, path, **extra):
+        for sql, plan in query_plans(self.client, path, **extra):
+            for step in plan:
+                with self.subTest(path=path, sql=sql[:120], step=step):
+                    self.assertNotIn("TEMP B-TREE", step)
+                    if step.startswith(("SCAN", "SEARCH")):
+                        self.assertRegex(step, r"USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY")
+
+
+class MovieIndexDDLTests(SimpleTestCase):
+    """The plan tests run on SQLite; these check the DDL PostgreSQL gets, without a server."""
+
+    def create_sql(self, vendor_module):
+        wrapper = import_module(f"django.db.backends.{vendor_module}.base").DatabaseWrapper(
+            {**connection.settings_dict, "NAME": "movies"})
+        with mock.patch.object(wrapper, "connect", side_effect=AssertionError("no database access")):
+            editor = wrapper.schema_editor(collect_sql=True, atomic=False)
+            return {index.name: str(index.create_sql(Movie, editor)) for index in Movie._meta.indexes}
+
+    def test_postgresql_year_index_puts_nulls_last(self):
+        self.assertEqual(self.create_sql("postgresql")["movie_year_id_idx"],
+                         'CREATE INDEX "movie_year_id_idx" ON "movies_movie" ("year" DESC NULLS LAST, "id" ASC)')
+
+    def test_sqlite_year_index_is_a_plain_descending_index(self):
+        self.assertEqual(self.create_sql("sqlite3")["movie_year_id_idx"],
+                         'CREATE INDEX "movie_year_id_idx" ON "movies_movie" ("year" DESC, "id")')
+
+
+@skipUnless(connection.vendor == "sqlite", "plans are read with SQLite's EXPLAIN QUERY PLAN")
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class MovieQueryPlanTests(QueryPlanAssertions, TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice", password="x")
+        for tmdb_id in range(1, 31):
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(1990 + tmdb_id % 10, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+
+    def test_movie_lists_read_in_index_order(self):
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+        for path in ("/api/movies/", "/api/movies/?year=1994,1995", "/api/movies/?ordering=title",
+                     "/api/movies/?ordering=-ratings_count", "/api/movies/?pagination=cursor"):
+            self.assertPlansUseIndexes(path, **auth)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_MAX_RETRIES=0, TMDB_ERROR_CACHE_TIMEOUT=0,
+                   TMDB_ENRICHMENT_ENABLED=False)
+class ImportMoviesCommandTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit._local_bucket.reset()
+        tmdb.reset_session()
+        self.addCleanup(tmdb.reset_session)
+
+    def import_dump(self, *records):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / "dump.json"
+        path.write_text("\n".join(r if isinstance(r, str) else json.dumps(r) for r in records))
+        out = StringIO()
+        server = StubTMDbServer(DetailsTMDbHandler)
+        with server, override_settings(TMDB_BASE_URL=server.url):
+            call_command("import_movies", str(path), stdout=out)
+        return out.getvalue()
+
+    def test_reimport_keeps_enriched_movies_and_skips_bad_records(self):
+        fight_club = Movie.objects.create(tmdb_id=550, title="Fight Club", release_date=date(1999, 10, 15),
+                                          poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+        pending = Movie.objects.create(tmdb_id=600, title="")
+
+        out = self.import_dump(
+            {"id": 550},
+            {"id": 600, "title": "Memento"},
+            {"id": 601, "title": "New", "release_date": "2001-01-01", "poster_path": "/n.jpg"},
+            {"id": 404},
+            {"id": 503},
+            {"id": "abc"},
+            {"id": 603, "release_date": "2001-02-30"},
+            "{not json",
+        )
+
+        fight_club.refresh_from_db()
+        self.assertEqual((fight_club.title, fight_club.release_date, fight_club.enrichment_status),
+                         ("Fight Club", date(1999, 10, 15), Movie.ENRICHMENT_DONE))
+        self.assertEqual(fight_club.poster_url, "https://image.tmdb.org/t/p/w500/x.jpg")
+        pending.refresh_from_db()
+        self.assertEqual((pending.title, pending.enrichment_status), ("Memento", Movie.ENRICHMENT_PENDING))
+        self.assertEqual(Movie.objects.get(tmdb_id=601).enrichment_status, Movie.ENRICHMENT_DONE)
+        self.assertEqual(Movie.objects.get(tmdb_id=404).enrichment_status, Movie.ENRICHMENT_FAILED)
+        self.assertEqual(Movie.objects.get(tmdb_id=503).enrichment_status, Movie.ENRICHMENT_PENDING)
+        self.assertFalse(Movie.objects.filter(tmdb_id=603).exists())
+        self.assertIn("Skipped 3 malformed records.", out)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_MAX_RETRIES=0, TMDB_ERROR_CACHE_TIMEOUT=0,
+                   TMDB_ENRICHMENT_ENABLED=False)
+class EnrichmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit._local_bucket.reset()
+        tmdb.reset_session()
+        self.addCleanup(tmdb.reset_session)
+
+    def test_batch_enriches_fails_not_found_and_returns_transient_errors(self):
+        for tmdb_id in (550, 404, 503):
+            Movie.objects.create(tmdb_id=tmdb_id, title="")
+
+        server = StubTMDbServer(DetailsTMDbHandler)
+        with server, override_settings(TMDB_BASE_URL=server.url):
+            retry = enrichment.enrich_batch([550, 404, 503])
+
+        self.assertEqual(retry, [503])
+        fight_club = Movie.objects.get(tmdb_id=550)
+        self.assertEqual((fight_club.title, fight_club.year, fight_club.enrichment_status),
+                         ("Fight Club", 1999, Movie.ENRICHMENT_DONE))
+        self.assertEqual(Movie.objects.get(tmdb_id=404).enrichment_status, Movie.ENRICHMENT_FAILED)
+        self.assertEqual(Movie.objects.get(tmdb_id=503).enrichment_status, Movie.ENRICHMENT_PENDING)
+
+    def test_details_cached_without_a_title_are_not_reused(self):
+        cache.set("movie_details_550", {"release_date": date(1999, 10, 15), "poster_url": None})
+        server = StubTMDbServer(DetailsTMDbHandler)
+        with server as httpd, override_settings(TMDB_BASE_URL=server.url):
+            self.assertEqual(load_tmdb_movie_details(550)["title"], "Fight Club")
+            self.assertEqual(load_tmdb_movie_details(550)["title"], "Fight Club")
+        self.assertEqual(httpd.requests, 1)
+
+    @override_settings(TMDB_ENRICHMENT_WORKERS=1, TMDB_ENRICHMENT_MAX_ATTEMPTS=3, TMDB_ENRICHMENT_RETRY_DELAY=0)
+    def test_queue_dedupes_and_retries_until_max_attempts(self):
+        batches = []
+        gave_up = threading.Event()
+
+        def enrich_batch(tmdb_ids, rate_limiter=None):
+            batches.append(sorted(tmdb_ids))
+            return [tmdb_id for tmdb_id in tmdb_ids if tmdb_id == 2]
+
+        queue = enrichment.EnrichmentQueue()
+        with mock.patch.object(enrichment, "enrich_batch", side_effect=enrich_batch), \
+                mock.patch.object(enrichment, "close_old_connections"), \
+                mock.patch.object(enrichment.logger, "warning", side_effect=lambda *a: gave_up.set()) as warning:
+            with mock.patch.object(queue, "_ensure_workers"):  # start the worker once all are queued
+                for tmdb_id in (1, 2, 1):
+                    queue.enqueue(tmdb_id)
+            queue._ensure_workers()
+            self.assertTrue(gave_up.wait(5))
+
+        self.assertEqual(batches, [[1, 2], [2], [2]])
+        warning.assert_called_once_with("Giving up enriching movie %s after %s attempts", 2, 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("alice", password="x")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id:02}", release_date=date(2000 + tmdb_id % 3, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(1, 8)
+        ]
+
+    def walk(self, url):
+        """Follows `next` links from `url`; returns every row served."""
+        rows = []
+        while url:
+            page = self.client.get(url, **self.auth).json()
+            rows += page["results"]
+            url = page["next"]
+        return rows
+
+    def test_rows_within_one_millisecond_are_not_skipped(self):
+        instant = datetime(2025, 1, 1, 12, 0, 0, 123000, tzinfo=dt_timezone.utc)
+        for i, movie in enumerate(self.movies):
+            favorite = FavoriteMovie.objects.create(user=self.user, movie=movie)
+            stamp = instant + timedelta(microseconds=100 * i)
+            FavoriteMovie.objects.filter(pk=favorite.pk).update(updated_at=stamp)
+            FavoriteActivity.objects.create(user=self.user, movie=movie, action="added", timestamp=stamp)
+
+        favorites = self.walk("/api/favorites/?pagination=cursor&page_size=2")
+        self.assertEqual([row["movie"] for row in favorites], [m.pk for m in reversed(self.movies)])
+        activity = self.walk("/api/favorites/recently-added/?pagination=cursor&page_size=2")
+        self.assertEqual(len(activity), len(self.movies))
+
+    def test_cursor_pages_follow_the_requested_ordering(self):
+        rows = self.walk("/api/movies/?pagination=cursor&ordering=-title&page_size=3")
+        self.assertEqual([row["title"] for row in rows], sorted((m.title for m in self.movies), reverse=True))
+
+        rows = self.walk("/api/movies/?pagination=cursor&ordering=year&page_size=3")
+        self.assertEqual([(row["year"], row["id"]) for row in rows],
+                         sorted((m.year, m.pk) for m in self.movies))
+
+    def test_orderings_a_cursor_cannot_seek_on_are_rejected(self):
+        request = Request(APIRequestFactory().get("/", {"pagination": "cursor", "ordering": "movie__title"}))
+        queryset = FavoriteMovie.objects.filter(user=self.user).order_by("movie__title")
+        with self.assertRaises(ValidationError):
+            FavoriteMoviePagination().paginate_queryset(queryset, request)
@@ -0,0 +1,400 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+import weakref
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from . import ratelimit
+from .instrumentation import timed_tmdb_call
+
+logger = logging.getLogger(__name__)
+
+TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+
+class TMDBError(Exception):
+    """Raised for any failed TMDb call (network error, timeout or non-200)."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpenError(TMDBError):
+    """Raised without calling TMDb while the circuit breaker is open."""
+
+
+class RateLimitedError(TMDBError):
+    """Raised without calling TMDb when the shared request budget is exhausted."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message, status_code=429)
+        self.retry_after = retry_after
+
+
+def _build_session():
+    pool_size = settings.TMDB_POOL_SIZE
+    # Retries are made by _request(), with the same policy as _arequest()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept": "application/json"})
+    return session
+
+
+def get_session():
+    """
+    Returns the per-process pooled session.
+    The session is created lazily so each gunicorn worker gets its own pool
+    after fork, and is then reused for every request that worker serves.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def reset_session():
+    """Closes the pooled session, e.g. after changing TMDB_* settings."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+    _async_clients.clear()
+
+
+def get_async_client():
+    """
+    Returns the pooled httpx.AsyncClient of the running event loop.
+    Under ASGI there is one long-lived loop per worker, so connections are
+    reused across requests; under WSGI each async view runs in its own
+    short-lived loop and gets a fresh client, which the view closes with
+    aclose_async_client() before its loop ends.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool_size = settings.TMDB_POOL_SIZE
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.TMDB_READ_TIMEOUT, connect=settings.TMDB_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            headers={"Accept": "application/json"},
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    """Closes the running event loop's client, if it has one."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+# Circuit breaker -------------------------------------------------------------
+#
+# State lives in the Django cache (Redis), so every worker and process sees
+# the same circuit:
+#   closed:    calls go through; failures are counted, a success resets them.
+#   open:      CIRCUIT_OPEN_KEY exists; calls fail fast until it expires.
+#   half-open: cooldown over but CIRCUIT_TRIPPED_KEY still set; one worker
+#              (cache.add lock) probes TMDb, the others keep failing fast.
+# Only transient failures (network errors, timeouts, 429 and 5xx) count.
+
+CIRCUIT_FAILURES_KEY = "tmdb:circuit:failures"
+CIRCUIT_OPEN_KEY = "tmdb:circuit:open"
+CIRCUIT_TRIPPED_KEY = "tmdb:circuit:tripped"
+CIRCUIT_PROBE_KEY = "tmdb:circuit:probe"
+
+
+def _is_transient(error):
+    return error.status_code is None or error.status_code == 429 or error.status_code >= 500
+
+
+def _before_call(state):
+    """
+    Raises CircuitOpenError unless a call may go through, given the circuit
+    keys read from the cache. Returns True if this call is the half-open probe.
+    """
+    if CIRCUIT_OPEN_KEY in state:
+        raise CircuitOpenError("TMDb circuit breaker is open; failing fast")
+    if CIRCUIT_TRIPPED_KEY in state:
+        if not cache.add(CIRCUIT_PROBE_KEY, 1, settings.TMDB_READ_TIMEOUT * 2):
+            raise CircuitOpenError("TMDb circuit breaker is half-open; probe in progress")
+        return True
+    return False
+
+
+def _record_success(probe, state):
+    if probe:
+        cache.delete_many([CIRCUIT_TRIPPED_KEY, CIRCUIT_PROBE_KEY, CIRCUIT_FAILURES_KEY])
+        logger.warning("TMDb circuit breaker closed")
+    elif state.get(CIRCUIT_FAILURES_KEY):
+        cache.delete(CIRCUIT_FAILURES_KEY)
+
+
+def _record_failure(probe):
+    window = settings.TMDB_CIRCUIT_FAILURE_WINDOW
+    cache.add(CIRCUIT_FAILURES_KEY, 0, window)
+    try:
+        failures = cache.incr(CIRCUIT_FAILURES_KEY)
+    except ValueError:  # expired between add() and incr()
+        failures = 1
+    if probe or failures >= settings.TMDB_CIRCUIT_FAILURE_THRESHOLD:
+        _open_circuit(failures)
+    if probe:
+        cache.delete(CIRCUIT_PROBE_KEY)
+
+
+def _open_circuit(failures):
+    cooldown = settings.TMDB_CIRCUIT_COOLDOWN
+    now = time.time()
+    cache.set(CIRCUIT_OPEN_KEY, {"opened_at": now, "retry_at": now + cooldown}, cooldown)
+    cache.set(CIRCUIT_TRIPPED_KEY, {"opened_at": now, "failures": failures}, None)
+    logger.warning("TMDb circuit breaker opened after %s consecutive failures", failures)
+
+
+def circuit_state():
+    """Snapshot of the shared circuit breaker, for monitoring."""
+    state = cache.get_many([CIRCUIT_OPEN_KEY, CIRCUIT_TRIPPED_KEY, CIRCUIT_FAILURES_KEY])
+    tripped = state.get(CIRCUIT_TRIPPED_KEY) or {}
+    if CIRCUIT_OPEN_KEY in state:
+        name = "open"
+    elif tripped:
+        name = "half-open"
+    else:
+        name = "closed"
+    return {
+        "state": name,
+        "failures": state.get(CIRCUIT_FAILURES_KEY, 0),
+        "threshold": settings.TMDB_CIRCUIT_FAILURE_THRESHOLD,
+        "opened_at": tripped.get("opened_at"),
+        "retry_at": state.get(CIRCUIT_OPEN_KEY, {}).get("retry_at"),
+    }
+
+
+def reset_circuit():
+    cache.delete_many([CIRCUIT_OPEN_KEY, CIRCUIT_TRIPPED_KEY, CIRCUIT_PROBE_KEY, CIRCUIT_FAILURES_KEY])
+
+
+def _error_cache_key(path, params):
+    query = "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+    return f"tmdb:error:{hashlib.md5(f'{path}?{query}'.encode()).hexdigest()}"
+
+
+def _state_keys(error_key):
+    return [error_key, CIRCUIT_OPEN_KEY, CIRCUIT_TRIPPED_KEY, CIRCUIT_FAILURES_KEY]
+
+
+def _raise_cached_error(error_key, state):
+    if error_key in state:
+        cached_error = state[error_key]
+        raise TMDBError(cached_error["message"], status_code=cached_error["status_code"])
+
+
+def _record_error(error, error_key, probe, state):
+    """Feeds a failed call into the circuit breaker and the negative cache."""
+    if _is_transient(error):
+        _record_failure(probe)
+        timeout = settings.TMDB_ERROR_CACHE_TIMEOUT
+    else:
+        _record_success(probe, state)  # TMDb answered; the URL is the problem
+        timeout = settings.TMDB_NOT_FOUND_CACHE_TIMEOUT if error.status_code == 404 \
+            else settings.TMDB_ERROR_CACHE_TIMEOUT
+    cache.set(error_key, {"message": str(error), "status_code": error.status_code}, timeout)
+
+
+def _rate_limited(retry_after):
+    return RateLimitedError(f"TMDb request budget exhausted, retry in {retry_after:.1f}s", retry_after)
+
+
+def _query(params):
+    query = {"api_key": settings.TMDB_API_KEY}
+    if params:
+        query.update(params)
+    return query
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.headers.get("Retry-After", 1))
+    except ValueError:
+        return 1.0
+
+
+def _decode(resp):
+    if resp.status_code != 200:
+        raise TMDBError(f"TMDb returned status {resp.status_code}", status_code=resp.status_code)
+    try:
+        return resp.json()
+    except ValueError as e:
+        raise TMDBError("TMDb returned an invalid JSON body") from e
+
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+def _retry_delay(attempt, status_code=None):
+    """
+    Seconds to wait before retrying a failed attempt (numbered from 0), or
+    None if it should not be retried. status_code is None for network
+    errors and timeouts.
+    """
+    if attempt >= settings.TMDB_MAX_RETRIES:
+        return None
+    if status_code is not None and status_code not in RETRY_STATUSES:
+        return None
+    return settings.TMDB_BACKOFF_FACTOR * 2 ** attempt
+
+
+def _request(path, params):
+    url = f"{settings.TMDB_BASE_URL}{path}"
+    timeout = (settings.TMDB_CONNECT_TIMEOUT, settings.TMDB_READ_TIMEOUT)
+    attempt = 0
+    while True:
+        try:
+            with timed_tmdb_call():
+                resp = get_session().get(url, params=_query(params), timeout=timeout)
+        except requests.RequestException as e:
+            delay = _retry_delay(attempt)
+            if delay is None:
+                raise TMDBError(f"TMDb request failed: {e}") from e
+        else:
+            delay = _retry_delay(attempt, resp.status_code)
+            if delay is None:
+                break
+        time.sleep(delay)
+        attempt += 1
+
+    if resp.status_code == 429:
+        # Over TMDb's limit: stop every worker, not just this one
+        ratelimit.pause(_retry_after(resp))
+    return _decode(resp)
+
+
+async def _arequest(path, params):
+    """_request() over the event loop's httpx client."""
+    url = f"{settings.TMDB_BASE_URL}{path}"
+    attempt = 0
+    while True:
+        try:
+            with timed_tmdb_call():
+                resp = await get_async_client().get(url, params=_query(params))
+        except httpx.HTTPError as e:
+            delay = _retry_delay(attempt)
+            if delay is None:
+                raise TMDBError(f"TMDb request failed: {e}") from e
+        else:
+            delay = _retry_delay(attempt, resp.status_code)
+            if delay is None:
+                break
+        await asyncio.sleep(delay)
+        attempt += 1
+
+    if resp.status_code == 429:
+        await sync_to_async(ratelimit.pause)(_retry_after(resp))
+    return _decode(resp)
+
+
+def tmdb_get(path, params=None, priority=ratelimit.INTERACTIVE):
+    """
+    GET a TMDb API path (e.g. "/trending/movie/week") and return the decoded JSON.
+    Raises TMDBError on network errors, timeouts and non-200 responses.
+
+    Each call takes a token from the cluster-wide TMDb budget first
+    (movies.ratelimit); `priority` is ratelimit.INTERACTIVE for user-facing
+    requests or ratelimit.BACKGROUND for enrichment and imports. If no token
+    is available in time RateLimitedError is raised.
+
+    Failures are remembered per URL for a short time (404s longer) and
+    re-raised from the cache, and repeated transient failures open a shared
+    circuit breaker that fails fast with CircuitOpenError.
+    """
+    error_key = _error_cache_key(path, params)
+    # One round trip for the negative cache and the circuit state
+    state = cache.get_many(_state_keys(error_key))
+    _raise_cached_error(error_key, state)
+
+    probe = _before_call(state)
+    retry_after = ratelimit.acquire(priority)
+    if retry_after:
+        if probe:
+            cache.delete(CIRCUIT_PROBE_KEY)
+        raise _rate_limited(retry_after)
+
+    try:
+        data = _request(path, params)
+    except TMDBError as e:
+        _record_error(e, error_key, probe, state)
+        raise
+
+    _record_success(probe, state)
+    return data
+
+
+async def atmdb_get(path, params=None, priority=ratelimit.INTERACTIVE):
+    """
+    Async version of tmdb_get() for async views: httpx instead of requests,
+    the async cache API, and asyncio.sleep() while queueing for a token, so
+    a slow TMDb call never blocks the worker's event loop.
+    """
+    error_key = _error_cache_key(path, params)
+    state = await cache.aget_many(_state_keys(error_key))
+    _raise_cached_error(error_key, state)
+
+    # The circuit helpers are shared with tmdb_get(); they only write to the
+    # cache while the circuit is tripped or failures are counted, so the
+    # thread hop is skipped otherwise
+    probe = await sync_to_async(_before_call)(state) if CIRCUIT_TRIPPED_KEY in state else _before_call(state)
+    retry_after = await ratelimit.aacquire(priority)
+    if retry_after:
+        if probe:
+            await cache.adelete(CIRCUIT_PROBE_KEY)
+        raise _rate_limited(retry_after)
+
+    try:
+        data = await _arequest(path, params)
+    except TMDBError as e:
+        await sync_to_async(_record_error)(e, error_key, probe, state)
+        raise
+
+    if probe or state.get(CIRCUIT_FAILURES_KEY):
+        await sync_to_async(_record_success)(probe, state)
+    return data
+
+
+def poster_url(poster_path):
+    return f"{TMDB_IMAGE_BASE_URL}{poster_path}" if poster_path else None
+
+
+def poster_path(url):
+    """Inverse of poster_url(): recovers the TMDb poster_path from a stored URL."""
+    if url and url.startswith(TMDB_IMAGE_BASE_URL):
+        return url[len(TMDB_IMAGE_BASE_URL):]
+    return None
+
+
+async def asearch_movie(title):
+    """
+    Returns the TMDb ID of the best match for a title, or None if nothing matched.
+    """
+    results = (await atmdb_get("/search/movie", {"query": title})).get("results") or []
+    return results[0]["id"] if results else None
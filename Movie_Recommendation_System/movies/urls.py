@@ -2,6 +2,9 @@ from django.urls import path
 from .views import (TrendingMoviesView,
                     RecommendedMoviesView,
                     MovieListCreateView,
+                    ForYouMoviesView,
+                    MovieAutocompleteView,
+                    TMDbStatusView,
                     ClearCacheView)
 
 urlpatterns = [
@@ -9,5 +12,8 @@ urlpatterns = [
     path('trending/', TrendingMoviesView.as_view(), name='trending-movies'),
     path('recommended/', RecommendedMoviesView.as_view(), name="recommended_movies"),
     path('recommended/<int:movie_id>/', RecommendedMoviesView.as_view(), name='recommended-movie'),
+    path('autocomplete/', MovieAutocompleteView.as_view(), name='movie-autocomplete'),
+    path('for-you/', ForYouMoviesView.as_view(), name='for-you-movies'),
+    path('tmdb/status/', TMDbStatusView.as_view(), name='tmdb-status'),
     path('cache/clear/', ClearCacheView.as_view(), name='clear-cache'),
 ]
\ No newline at end of file
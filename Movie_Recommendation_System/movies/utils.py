@@ -1,41 +1,37 @@
-import requests
+from django.utils.dateparse import parse_date
 from django.core.cache import cache
-from django.conf import settings
+from .ratelimit import INTERACTIVE
+from .tmdb import TMDBError, tmdb_get, poster_url
 
-TMDB_API_KEY = settings.TMDB_API_KEY
-TMDB_API_BASE = "https://api.themoviedb.org/3"
 CACHE_TIMEOUT = 60 * 60
 
-class TMDBError(Exception):
-    pass
-
-def fetch_tmdb_movie_details(tmdbid):
+def load_tmdb_movie_details(tmdbid, priority=INTERACTIVE):
     """
     Fetches movie details from TMDb API by tmdb_id.
-    Returns a dict with 'release_date' and 'poster_url'.
+    Returns a dict with 'title', 'release_date' and 'poster_url'.
+    Raises TMDBError if TMDb could not be reached or does not know the movie.
+    `priority` is passed on to tmdb_get() (background jobs use BACKGROUND).
     """
     tmdb_id = int(tmdbid)
-    cache_key = f"movie_details_{tmdb_id}"
+    # v2 added "title"; entries cached before it lack the key
+    cache_key = f"movie_details_v2_{tmdb_id}"
     if cached := cache.get(cache_key):
         return cached
-    
-    headers = {
-        "Authorization": f"Bearer {TMDB_API_KEY}",
-        "Content-Type": "application/json;charset=utf-8"
+
+    data = tmdb_get(f"/movie/{tmdb_id}", priority=priority)
+    result = {
+        "title": data.get("title") or "",
+        "release_date": parse_date(data.get("release_date") or ""),
+        "poster_url": poster_url(data.get("poster_path")),
     }
-    
-    url = f"{TMDB_API_BASE}/movie/{tmdb_id}"
-    
+    cache.set(cache_key, result, CACHE_TIMEOUT)
+    return result
+
+def fetch_tmdb_movie_details(tmdbid, priority=INTERACTIVE):
+    """
+    Same as load_tmdb_movie_details(), but returns None instead of raising.
+    """
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            result = {
-                "release_date": data.get("release_date"),
-                "poster_url": f"https://image.tmdb.org/t/p/w500{data.get('poster_url')}" if data.get("poster_path") else None
-            }
-            cache.set(cache_key, result, CACHE_TIMEOUT)
-            return result
-    except Exception.TMDBError as e:
-        return (f"TMDb returned status {response.status_code} for movie {tmdb_id}: {e}")
-        # return None
\ No newline at end of file
+        return load_tmdb_movie_details(tmdbid, priority)
+    except TMDBError:
+        return None
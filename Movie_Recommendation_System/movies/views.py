@@ -1,68 +1,112 @@
-from django.shortcuts import render
-from django.db.models import Avg, Count
+from adrf.views import APIView as AsyncDRFAPIView
+from asgiref.sync import sync_to_async
 from django.core.cache import cache
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-import requests
-import os
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from rest_framework import permissions, status,generics, permissions
-from rest_framework.filters import SearchFilter, OrderingFilter
-from .filters import MovieFilter
+from .filters import MovieFilter, MovieSearchFilter, RankedOrderingFilter
 from .models import Movie
-from .services import fetch_trending_movies, fetch_recommendations, TMDBError
-from .pagination import LargeResultsSetPagination
+from .services import afetch_recommendation_list, afetch_trending_movies, aresolve_tmdb_id
+from .tmdb import CircuitOpenError, RateLimitedError, TMDBError, aclose_async_client, circuit_state
+from .caching import MOVIES_NAMESPACE, add_cache_headers, bump_namespace_on_commit, query_fingerprint, versioned_key
+from .recommender import similar_movies, user_recommendations
+from .autocomplete import autocomplete
+from .hydration import apply_favorite_state, hydrate_tmdb_results
+from .pagination import LargeResultsSetPagination, MoviePagination
 from .serializers import TMDbMovieSerializer, MovieSerializer
 
 CACHE_TIMEOUT = getattr(settings, "CACHE_TIMEOUT", 60 * 5)
-TMDB_BASE_URL = "https://api.themoviedb.org/3/search/movie"
-TMDB_API_KEY = os.getenv('TMDB_API_KEY')
+
+class AsyncAPIView(AsyncDRFAPIView):
+    """
+    adrf APIView for views with `async def` handlers. Django runs them on
+    the event loop under ASGI and through async_to_sync under WSGI. Under
+    WSGI the request's event loop ends with the request, so its TMDb client
+    is closed here rather than leaking one connection pool per call.
+    """
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().async_dispatch(request, *args, **kwargs)
+        finally:
+            if not isinstance(request, ASGIRequest):
+                await aclose_async_client()
+
+def tmdb_error_response(error):
+    """
+    502 for TMDb failures; 503 with Retry-After when we held the call back
+    ourselves (request budget exhausted or circuit breaker open).
+    """
+    if isinstance(error, RateLimitedError):
+        response = Response({"detail": str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response["Retry-After"] = str(max(1, round(error.retry_after)))
+        return response
+    if isinstance(error, CircuitOpenError):
+        return Response({"detail": str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response({"detail": str(error)}, status=status.HTTP_502_BAD_GATEWAY)
 
 class MovieListCreateView(generics.ListCreateAPIView):
     
     queryset = Movie.objects.all()
     serializer_class = MovieSerializer
-    pagination_class = LargeResultsSetPagination
+    pagination_class = MoviePagination
     permission_classes = [permissions.AllowAny]
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, MovieSearchFilter, RankedOrderingFilter]
     filterset_class = MovieFilter  # custom filter
     search_fields = ['title']
-    ordering_fields = ['year', 'title']
+    ordering_fields = ['year', 'title', 'average_rating', 'ratings_count']
+    # NULL years last, as movie_year_id_idx stores them
+    ordering = [F('year').desc(nulls_last=True), 'id']
 
     @swagger_auto_schema(
         operation_description="Get a list of movies or add a new one. Optionally filter by title, year, tmdb_id.",
         tags=["movies"],
         manual_parameters=[
             openapi.Parameter('year', openapi.IN_QUERY, description="Filter by release year", type=openapi.TYPE_INTEGER),
-            openapi.Parameter('title', openapi.IN_QUERY, description="Filter by title", type=openapi.TYPE_STRING),
-            openapi.Parameter('tmdb_id', openapi.IN_QUERY, description="Filter by TMDb ID", type=openapi.TYPE_INTEGER)
+            openapi.Parameter('title', openapi.IN_QUERY, description="Search titles (ranked by relevance unless ordering is given)", type=openapi.TYPE_STRING),
+            openapi.Parameter('tmdb_id', openapi.IN_QUERY, description="Filter by TMDb ID", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('pagination', openapi.IN_QUERY, description="Set to 'cursor' for keyset pagination ordered by (-year, id)", type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from a previous page's 'next' link", type=openapi.TYPE_STRING)
         ]
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
     
-    # def get_serializer_context(self):
-    #     context = super().get_serializer_context()
-    #     context['request'] = self.request  # Needed for is_favorite
-    #     return context
-    
-    def get_queryset(self):
-        cache_key = f"movie_list_{self.request.get_full_path()}"
-        cached_qs_ids = cache.get(cache_key)
-        if cached_qs_ids is not None:
-            return Movie.objects.filter(id__in=cached_qs_ids)
+    def list(self, request, *args, **kwargs):
+        """
+        Caches each page (results plus count) under a canonical form of the
+        filters, so equivalent queries share an entry and a hit runs no SQL.
+        Invalidated through the movies namespace when movies or ratings change.
+        The page is cached without user state; is_favorite is set afterwards
+        for the requesting user with one query.
+        """
+        cache_key = versioned_key(MOVIES_NAMESPACE, "list", query_fingerprint(
+            request.query_params, list_params=("year",), defaults={"page": "1"}
+        ))
+        data = cache.get(cache_key)
+        if data is not None:
+            apply_favorite_state(data["results"], request.user)
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
 
-        queryset = Movie.objects.all()
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(cache_key, response.data, CACHE_TIMEOUT)
+            apply_favorite_state(response.data["results"], request.user)
+            response["X-Cache"] = "MISS"
+        return response
 
-        # Search by title
-        title = self.request.query_params.get('title')
-        if title:
-            queryset = queryset.filter(title__icontains=title.strip())
+    def get_queryset(self):
+        queryset = Movie.objects.all()
 
         # Filter by tmdb_id (exact)
         tmdb_id = self.request.query_params.get('id')
@@ -72,59 +116,52 @@ class MovieListCreateView(generics.ListCreateAPIView):
             except ValueError:
                 return Movie.objects.none()
 
-        # Filter by year (supports comma-separated list)
-        year_param = self.request.query_params.get('year')
-        if year_param:
-            years = []
-            for part in year_param.split(','):
-                part = part.strip()
-                if part.isdigit():
-                    years.append(int(part))
-            if years:
-                if hasattr(Movie, "release_year"):  # if you added release_year field
-                    queryset = queryset.filter(release_year__in=years)
-                elif hasattr(Movie, "release_date"):  # if you store a DateField
-                    queryset = queryset.filter(release_date__year__in=years)
-
-        queryset = queryset.annotate(
-            average_rating=Avg('ratings__rating'),
-            ratings_count=Count('ratings')
-        )
-
-        # Store IDs in cache instead of queryset object
-        cache.set(cache_key, list(queryset.values_list('id', flat=True)), CACHE_TIMEOUT)
+        # ?year=2022,2023 is applied by MovieFilter as year__in on the indexed
+        # year column (release_date__year__in could not use an index)
         return queryset
     
+    @staticmethod
+    def invalidate_cache():
+        """
+        Invalidates every cached movie list page (one INCR, after commit).
+        """
+        bump_namespace_on_commit(MOVIES_NAMESPACE)
+
     def perform_create(self, serializer):
         tmdb_id = serializer.validated_data.get('tmdb_id')
         if Movie.objects.filter(tmdb_id=tmdb_id).exists():
             raise ValidationError({"tmdb_id": "A movie with this TMDb ID already exists."})       
-        # Will trigger the Movie model's save() to fetch TMDb details
+        # Missing TMDb details are filled in by the background enrichment queue
         serializer.save()
 
-class TrendingMoviesView(APIView):
+class TrendingMoviesView(AsyncAPIView):
     # serializer_class = TMDbMovieSerializer
     pagination_class = LargeResultsSetPagination
     permission_classes = [permissions.AllowAny]
     @swagger_auto_schema(
-        operation_description="Retrieve the current trending movies from TMDb (cached in Redis for performance).",
+        operation_description="Retrieve the current trending movies from TMDb (cached in Redis for performance), "
+                              "with our own ratings and, when logged in, the user's favorite/watchlist state.",
         responses={200: MovieSerializer(many=True)},
         tags=["Movies"]
     )
-    def get(self, request):
+    async def get(self, request):
         try:
-            movies = fetch_trending_movies()
+            result = await afetch_trending_movies()
         except TMDBError as e:
-            return Response({"detail": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+            return tmdb_error_response(e)
+        movies = await sync_to_async(hydrate_tmdb_results)(result.value, request.user)
         serializer = TMDbMovieSerializer(movies, many=True)
-        return Response(serializer.data)
+        return add_cache_headers(Response(serializer.data), result)
 
-class RecommendedMoviesView(APIView):
+class RecommendedMoviesView(AsyncAPIView):
     pagination_class = LargeResultsSetPagination
     permission_classes = [permissions.AllowAny]
+    default_limit = 20
+    max_limit = 100
 
     @swagger_auto_schema(
-        operation_description="Retrieve movie recommendations for a given TMDb movie ID (cached in Redis).",
+        operation_description="Retrieve movie recommendations for a given TMDb movie ID. Served from precomputed "
+                              "item-item neighbours when available, otherwise from TMDb (cached in Redis).",
         manual_parameters=[
             openapi.Parameter(
                 'movie_id',
@@ -132,14 +169,21 @@ class RecommendedMoviesView(APIView):
                 description="TMDb movie ID for which to fetch recommendations",
                 type=openapi.TYPE_INTEGER,
                 required=True
-            )
+            ),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Number of recommendations (max 100); "
+                              "TMDb pages are fetched concurrently", type=openapi.TYPE_INTEGER)
         ],
         responses={200: MovieSerializer(many=True)},
         tags=["Movies"]
     )
 
-    def get(self, request, movie_id=None):
+    async def get(self, request, movie_id=None):
         title = request.query_params.get("title")
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        limit = max(limit, 1)
 
         if not movie_id and not title:
             return Response(
@@ -147,27 +191,33 @@ class RecommendedMoviesView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # If title provided, look up TMDb ID first
-        if title and not movie_id:
-            search_url = f"{TMDB_BASE_URL}/search/movie"
-            params = {"api_key": TMDB_API_KEY, "query": title}
-            resp = requests.get(search_url, params=params, timeout=10)
-
-            if resp.status_code != 200 or not resp.json().get("results"):
-                return Response(
-                    {"detail": "Movie not found on TMDb."},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+        try:
+            # If title provided, look up TMDb ID first (cached, local table first)
+            if title and not movie_id:
+                movie_id = await aresolve_tmdb_id(title)
+                if not movie_id:
+                    return Response(
+                        {"detail": "Movie not found on TMDb."},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
 
-            movie_id = resp.json()["results"][0]["id"]
+            # Answer from our own item-item neighbours; TMDb only for cold starts
+            local = await sync_to_async(similar_movies)(movie_id, limit)
+            if local:
+                local = await sync_to_async(hydrate_tmdb_results)(local, request.user)
+                response = Response(TMDbMovieSerializer(local, many=True).data)
+                response["X-Recommendation-Source"] = "local"
+                return response
 
-        try:
-            movies = fetch_recommendations(movie_id)
+            result = await afetch_recommendation_list(movie_id, limit)
         except TMDBError as e:
-            return Response({"detail": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+            return tmdb_error_response(e)
 
+        movies = await sync_to_async(hydrate_tmdb_results)(result.value, request.user)
         serializer = TMDbMovieSerializer(movies, many=True)
-        return Response(serializer.data)
+        response = add_cache_headers(Response(serializer.data), result)
+        response["X-Recommendation-Source"] = "tmdb"
+        return response
 
         # try:
         #     movies = fetch_recommendations(movie_id)
@@ -176,6 +226,61 @@ class RecommendedMoviesView(APIView):
         # serializer = TMDbMovieSerializer(movies, many=True)
         # return Response(serializer.data)
 
+class ForYouMoviesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    default_limit = 20
+    max_limit = 100
+
+    @swagger_auto_schema(
+        operation_description="Personalised movie recommendations for the logged-in user, based on their "
+                              "favorites, watchlist and ratings. Movies the user already has are excluded.",
+        manual_parameters=[
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Number of movies (max 100)", type=openapi.TYPE_INTEGER)
+        ],
+        responses={200: MovieSerializer(many=True)},
+        tags=["Movies"]
+    )
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        return Response(user_recommendations(request.user.id)[:max(limit, 0)])
+
+class MovieAutocompleteView(APIView):
+    permission_classes = [permissions.AllowAny]
+    default_limit = 10
+    max_limit = 50
+
+    @swagger_auto_schema(
+        operation_description="Type-ahead title suggestions, most rated first. Matches any word of the title "
+                              "by prefix and is served from an in-memory index (no database query).",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Title prefix", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Number of suggestions (max 50)", type=openapi.TYPE_INTEGER)
+        ],
+        tags=["Movies"]
+    )
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get("limit", self.default_limit)), self.max_limit)
+        except ValueError:
+            limit = self.default_limit
+        return Response(autocomplete(request.query_params.get("q", ""), max(limit, 0)))
+
+class TMDbStatusView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="State of the shared TMDb circuit breaker (closed, open or half-open), for "
+                              "monitoring. Returns 503 while the circuit is open.",
+        tags=["Movies"]
+    )
+    def get(self, request):
+        state = circuit_state()
+        code = status.HTTP_503_SERVICE_UNAVAILABLE if state["state"] == "open" else status.HTTP_200_OK
+        return Response(state, status=code)
+
 class ClearCacheView(APIView):
     permission_classes = [permissions.IsAdminUser]
 
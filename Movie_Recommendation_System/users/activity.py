@@ -0,0 +1,103 @@
+"""
+Write-behind FavoriteActivity log: events are buffered after commit and
+bulk-inserted from a timer thread, each row keeping the time of its event.
+"""
+import atexit
+import logging
+import threading
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from movies.caching import bump_namespace
+from movies.models import Movie
+from .models import FavoriteActivity, User
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one bulk_create at a time
+        self._events = []
+        self._timer = None
+
+    def record(self, user_id, movie_id, action):
+        """Buffers an event once the current transaction commits (dropped on rollback)."""
+        timestamp = timezone.now()
+        transaction.on_commit(lambda: self._append((user_id, movie_id, action, timestamp)))
+
+    def _append(self, event):
+        # Runs in the on_commit callback of the request that made the change,
+        # so a full batch is handed to the timer thread rather than written here.
+        with self._lock:
+            self._events.append(event)
+            if len(self._events) == settings.FAVORITE_ACTIVITY_BATCH_SIZE:
+                self._schedule(0)
+            elif self._timer is None:
+                self._schedule(settings.FAVORITE_ACTIVITY_FLUSH_INTERVAL)
+
+    def _schedule(self, delay):
+        """Replaces any pending timer with one that flushes after `delay` seconds. Needs self._lock."""
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._flush_on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def flush(self):
+        """Writes every buffered event. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not events:
+                return 0
+            try:
+                return self._write(events)
+            except Exception:
+                logger.exception("Writing %d favorite activity events failed", len(events))
+                return 0
+
+    @staticmethod
+    def _write(events):
+        from .views import RecentlyAddedFavoritesView  # the views module records events too
+
+        rows = [
+            FavoriteActivity(user_id=user_id, movie_id=movie_id, action=action, timestamp=timestamp)
+            for user_id, movie_id, action, timestamp in events
+        ]
+        try:
+            with transaction.atomic():
+                FavoriteActivity.objects.bulk_create(rows)
+        except IntegrityError:
+            # A user or movie was deleted before its events were written
+            rows = _without_orphans(rows)
+            FavoriteActivity.objects.bulk_create(rows)
+
+        for user_id in {row.user_id for row in rows}:
+            bump_namespace(RecentlyAddedFavoritesView.user_namespace(user_id))
+        return len(rows)
+
+
+def _without_orphans(rows):
+    users = set(User.objects.filter(id__in={r.user_id for r in rows}).values_list("id", flat=True))
+    movies = set(Movie.objects.filter(id__in={r.movie_id for r in rows}).values_list("id", flat=True))
+    return [r for r in rows if r.user_id in users and r.movie_id in movies]
+
+
+activity_buffer = ActivityBuffer()
+# Covers graceful worker shutdown: gunicorn and uvicorn exit normally on
+# SIGTERM. A worker killed outright (SIGKILL, OOM) loses what is buffered,
+# at most FAVORITE_ACTIVITY_BATCH_SIZE events from the last
+# FAVORITE_ACTIVITY_FLUSH_INTERVAL seconds. The favorites themselves are
+# committed; only their activity rows are missing.
+atexit.register(activity_buffer.flush)
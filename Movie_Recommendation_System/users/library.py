@@ -0,0 +1,39 @@
+"""
+Bookkeeping after a user's favorites, watchlist or ratings change, shared by
+users.signals (one row at a time) and the bulk endpoints (a batch at once).
+"""
+from movies.caching import bump_namespace_on_commit
+from movies.models import Movie
+from movies.recommender import invalidate_user_recommendations
+from .activity import activity_buffer
+
+
+def favorites_changed(user_id, added=(), removed=()):
+    """Logs the added and removed movie ids and invalidates the user's cached favorites."""
+    from .views import FavoriteMovieListView  # the views module calls these helpers too
+
+    for movie_id in added:
+        activity_buffer.record(user_id, movie_id, 'added')
+    for movie_id in removed:
+        activity_buffer.record(user_id, movie_id, 'removed')
+    FavoriteMovieListView.invalidate_user_cache(user_id)
+    invalidate_user_recommendations(user_id)
+
+
+def watchlist_changed(user_id):
+    from .views import WatchlistView
+
+    bump_namespace_on_commit(WatchlistView.user_namespace(user_id))
+    invalidate_user_recommendations(user_id)
+
+
+def ratings_changed(user_id, deltas):
+    """
+    Shifts the movies' rating aggregates by `deltas` (movie_id -> (sum_delta,
+    count_delta)) in one UPDATE and invalidates the caches built on them.
+    """
+    from movies.views import MovieListCreateView
+
+    Movie.apply_rating_deltas({movie_id: delta for movie_id, delta in deltas.items() if delta != (0, 0)})
+    MovieListCreateView.invalidate_cache()
+    invalidate_user_recommendations(user_id)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from users.models import LibraryTombstone
+from users.sync import retention_horizon
+
+
+class Command(BaseCommand):
+    help = "Delete library tombstones older than LIBRARY_TOMBSTONE_RETENTION_DAYS (run daily)."
+
+    def handle(self, *args, **options):
+        deleted, _ = LibraryTombstone.objects.filter(deleted_at__lt=retention_horizon()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstones."))
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_enrichment_ratings_similarity_indexes'),
+        ('users', '0002_remove_favoritemovie_poster_path_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tmdb_id', models.IntegerField(null=True)),
+                ('kind', models.CharField(choices=[('favorite', 'Favorite'), ('watchlist', 'Watchlist entry'), ('rating', 'Rating')], max_length=10)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['deleted_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='favoriteactivity',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='favoriteactivity',
+            index=models.Index(fields=['user', 'action', '-timestamp', 'id'], name='activity_user_action_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favoritemovie',
+            index=models.Index(fields=['user', '-updated_at', 'id', 'movie'], name='favorite_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movierating',
+            index=models.Index(fields=['user', 'updated_at', 'movie'], name='rating_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchlist',
+            index=models.Index(fields=['user', 'added_at', 'movie'], name='watchlist_user_added_idx'),
+        ),
+        migrations.AddField(
+            model_name='librarytombstone',
+            name='movie',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='movies.movie'),
+        ),
+        migrations.AddField(
+            model_name='librarytombstone',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='librarytombstone',
+            index=models.Index(fields=['user', 'deleted_at', 'kind', 'tmdb_id'], name='tombstone_user_deleted_idx'),
+        ),
+    ]
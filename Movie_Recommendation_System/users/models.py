@@ -3,6 +3,7 @@ import uuid
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 from movies.models import Movie
 
@@ -29,6 +30,9 @@ class FavoriteMovie(models.Model):
     class Meta:
         unique_together = ('user', 'movie')
         ordering = ['-updated_at']
+        # Matches the list order and FavoriteMoviePagination's keyset
+        # (-updated_at, id); also serves delta sync, which movie makes covering
+        indexes = [models.Index(fields=['user', '-updated_at', 'id', 'movie'], name='favorite_user_updated_idx')]
 
     def __str__(self):
         return f"{self.user.username} - {self.movie.title}"
@@ -44,6 +48,24 @@ class MovieRating(models.Model):
     class Meta:
         unique_together = ('user', 'movie')
         ordering = ['-updated_at']
+        indexes = [models.Index(fields=['user', 'updated_at', 'movie'], name='rating_user_updated_idx')]
+
+    @classmethod
+    def lock_user(cls, user_id):
+        """
+        Serializes one user's rating writes until the transaction ends by
+        locking their User row. Locking rating rows cannot stop a concurrent
+        insert of a rating that does not exist yet, which would be counted
+        twice in the movie's aggregates.
+        """
+        list(User.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating so signals can apply the change as a delta
+        instance._loaded_rating = instance.rating if 'rating' in field_names else None
+        return instance
 
     def __str__(self):
         return f"{self.user.username} rated {self.movie.title} - {self.rating}★"
@@ -57,10 +79,14 @@ class FavoriteActivity(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     action = models.CharField(max_length=10, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens; rows are written later in batches (users.activity)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-timestamp']
+        # Recently added/removed lists: filtered by user and action, in
+        # FavoriteActivityPagination's keyset order (-timestamp, id)
+        indexes = [models.Index(fields=['user', 'action', '-timestamp', 'id'], name='activity_user_action_ts_idx')]
 
     def __str__(self):
         return f"{self.user} {self.action} {self.movie} at {self.timestamp}"
@@ -73,6 +99,38 @@ class Watchlist(models.Model):
     class Meta:
         unique_together = ('user', 'movie')
         ordering = ['-added_at']
+        indexes = [models.Index(fields=['user', 'added_at', 'movie'], name='watchlist_user_added_idx')]
 
     def __str__(self):
         return f"{self.user.username} - {self.movie.title}"
+
+class LibraryTombstone(models.Model):
+    """
+    Records that a favorite, watchlist entry or rating was deleted, so delta
+    sync (users.sync) can tell clients to drop it. Written by users.signals;
+    pruned by `manage.py prune_library_tombstones`.
+    """
+    FAVORITE = 'favorite'
+    WATCHLIST = 'watchlist'
+    RATING = 'rating'
+    KIND_CHOICES = [
+        (FAVORITE, 'Favorite'),
+        (WATCHLIST, 'Watchlist entry'),
+        (RATING, 'Rating'),
+    ]
+
+    # No database constraints: tombstones are also written while a user or
+    # movie is being deleted
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE, db_constraint=False)
+    movie = models.ForeignKey(Movie, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False)
+    # Copied from the movie, which sync cannot join once it is deleted too
+    tmdb_id = models.IntegerField(null=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [models.Index(fields=['user', 'deleted_at', 'kind', 'tmdb_id'], name='tombstone_user_deleted_idx')]
+
+    def __str__(self):
+        return f"{self.user_id} removed {self.kind} {self.movie_id} at {self.deleted_at}"
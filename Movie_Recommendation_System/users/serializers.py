@@ -160,4 +160,43 @@ class WatchlistSerializer(serializers.ModelSerializer):
         )
         # Create the watchlist entry
         watchlist, _ = Watchlist.objects.get_or_create(user=user, movie=movie)
-        return watchlist
\ No newline at end of file
+        return watchlist
+
+# Batch endpoints (offline sync) ---------------------------------------------
+
+class BulkLibraryItemSerializer(serializers.Serializer):
+    ACTIONS = ("add", "remove")
+
+    tmdb_id = serializers.IntegerField(min_value=1)
+    action = serializers.ChoiceField(choices=ACTIONS, default="add")
+
+
+class BulkRatingItemSerializer(serializers.Serializer):
+    tmdb_id = serializers.IntegerField(min_value=1)
+    rating = serializers.IntegerField(min_value=1, max_value=5, help_text="Rating from 1 to 5 stars")
+
+
+class BulkLibrarySerializer(serializers.Serializer):
+    items = BulkLibraryItemSerializer(many=True)
+
+    swagger_schema_fields = {
+        "example": {
+            "items": [
+                {"tmdb_id": 550, "action": "add"},
+                {"tmdb_id": 680, "action": "remove"},
+            ]
+        }
+    }
+
+
+class BulkRatingSerializer(serializers.Serializer):
+    items = BulkRatingItemSerializer(many=True)
+
+    swagger_schema_fields = {
+        "example": {
+            "items": [
+                {"tmdb_id": 550, "rating": 5},
+                {"tmdb_id": 680, "rating": 4},
+            ]
+        }
+    }
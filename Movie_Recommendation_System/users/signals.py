@@ -1,26 +1,59 @@
+from django.db.models import Subquery
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .views import FavoriteMovieListView
-from .models import FavoriteMovie, FavoriteActivity
+from movies.models import Movie
+from .library import favorites_changed, ratings_changed, watchlist_changed
+from .models import FavoriteMovie, LibraryTombstone, MovieRating, Watchlist
 
+# Bookkeeping shared with the bulk endpoints (see users.library). Activity
+# rows are written in batches after commit (see users.activity), which also
+# invalidates the cached activity pages once they exist
 @receiver(post_save, sender=FavoriteMovie)
+def favorite_saved(sender, instance, created, **kwargs):
+    favorites_changed(instance.user_id, added=[instance.movie_id] if created else ())
+
 @receiver(post_delete, sender=FavoriteMovie)
-def clear_favorites_cache(sender, instance, **kwargs):
-    FavoriteMovieListView.invalidate_user_cache(instance.user.id)
+def favorite_deleted(sender, instance, **kwargs):
+    favorites_changed(instance.user_id, removed=[instance.movie_id])
 
-@receiver(post_save, sender=FavoriteMovie)
-def log_favorite_added(sender, instance, created, **kwargs):
+@receiver(post_save, sender=Watchlist)
+@receiver(post_delete, sender=Watchlist)
+def watchlist_saved_or_deleted(sender, instance, **kwargs):
+    watchlist_changed(instance.user_id)
+
+@receiver(post_save, sender=MovieRating)
+def rating_saved(sender, instance, created, **kwargs):
     if created:
-        FavoriteActivity.objects.create(
-            user=instance.user,
-            movie=instance.movie,
-            action='added'
-        )
+        delta = (instance.rating, 1)
+    else:
+        previous = getattr(instance, '_loaded_rating', None)
+        if previous is None:
+            # Loaded without the rating column; nothing to diff against
+            from movies.ratings import reconcile_rating_aggregates
+            reconcile_rating_aggregates([instance.movie_id])
+            delta = (0, 0)
+        else:
+            delta = (instance.rating - previous, 0)
+    instance._loaded_rating = instance.rating
+    ratings_changed(instance.user_id, {instance.movie_id: delta})
+
+@receiver(post_delete, sender=MovieRating)
+def rating_deleted(sender, instance, **kwargs):
+    ratings_changed(instance.user_id, {instance.movie_id: (-instance.rating, -1)})
+
+TOMBSTONE_KINDS = {
+    FavoriteMovie: LibraryTombstone.FAVORITE,
+    Watchlist: LibraryTombstone.WATCHLIST,
+    MovieRating: LibraryTombstone.RATING,
+}
 
 @receiver(post_delete, sender=FavoriteMovie)
-def log_favorite_removed(sender, instance, **kwargs):
-    FavoriteActivity.objects.create(
-        user=instance.user,
-        movie=instance.movie,
-        action='removed'
-    )
\ No newline at end of file
+@receiver(post_delete, sender=Watchlist)
+@receiver(post_delete, sender=MovieRating)
+def record_library_tombstone(sender, instance, **kwargs):
+    # Delta sync (users.sync) reports these as removed
+    # The tmdb_id is read inside the INSERT, so no query per deleted row
+    LibraryTombstone.objects.create(
+        user_id=instance.user_id, movie_id=instance.movie_id, kind=TOMBSTONE_KINDS[sender],
+        tmdb_id=Subquery(Movie.objects.filter(pk=instance.movie_id).values('tmdb_id')[:1]),
+    )
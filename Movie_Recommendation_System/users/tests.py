@@ -1,3 +1,356 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from movies.caching import MOVIES_NAMESPACE, namespace_version
+from movies import ratings
+from movies.models import Movie
+from movies.tests import QueryPlanAssertions
+from .activity import activity_buffer
+from .models import FavoriteActivity, FavoriteMovie, LibraryTombstone, MovieRating, Watchlist
+from .sync import make_token
 
-# Create your tests here.
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False,
+                   FAVORITE_ACTIVITY_BATCH_SIZE=5, FAVORITE_ACTIVITY_FLUSH_INTERVAL=60)
+class FavoriteActivityWriteBehindTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice", password="x")
+        self.movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(2000, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(1, 13)
+        ]
+        self.addCleanup(activity_buffer.flush)
+
+    @staticmethod
+    def activity_inserts(queries):
+        table = FavoriteActivity._meta.db_table
+        return [q for q in queries if q["sql"].startswith(f'INSERT INTO "{table}"')]
+
+    def test_full_batch_is_written_by_the_timer_thread(self):
+        with mock.patch("users.activity.threading.Timer") as timer, CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                for movie in self.movies[:5]:
+                    FavoriteMovie.objects.create(user=self.user, movie=movie)
+
+        # The first event starts the interval timer; the fifth fills the batch
+        # and replaces it with an immediate one instead of writing in the request
+        self.assertEqual([call.args for call in timer.call_args_list],
+                         [(60, activity_buffer._flush_on_timer), (0, activity_buffer._flush_on_timer)])
+        timer.return_value.cancel.assert_called_once()
+        self.assertEqual(self.activity_inserts(queries), [])
+
+        flushed_at = timezone.now()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(activity_buffer.flush(), 5)
+        self.assertEqual(len(self.activity_inserts(queries)), 1)
+
+        # Rows carry the time of the event, not of the write
+        self.assertEqual(FavoriteActivity.objects.filter(action="added").count(), 5)
+        self.assertFalse(FavoriteActivity.objects.filter(timestamp__gte=flushed_at).exists())
+
+    def test_rolled_back_changes_log_nothing(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            FavoriteMovie.objects.create(user=self.user, movie=self.movies[0])
+            FavoriteMovie.objects.filter(user=self.user).delete()
+        self.assertTrue(callbacks)  # queued, but never run: the transaction did not commit
+
+        self.assertEqual(activity_buffer.flush(), 0)
+        self.assertFalse(FavoriteActivity.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class CachedUserListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = get_user_model().objects.create_user("alice", password="x")
+        cls.bob = get_user_model().objects.create_user("bob", password="x")
+        cls.movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(2000, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(1, 13)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(activity_buffer.flush)
+        FavoriteMovie.objects.create(user=self.alice, movie=self.movies[0])
+        FavoriteMovie.objects.create(user=self.bob, movie=self.movies[1])
+
+    def get(self, user, path, params=None):
+        return self.client.get(path, params or {}, HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def test_pages_are_cached_per_user(self):
+        self.assertEqual(self.get(self.alice, "/api/favorites/")["X-Cache"], "MISS")
+        hit = self.get(self.alice, "/api/favorites/")
+        self.assertEqual(hit["X-Cache"], "HIT")
+        self.assertEqual([f["movie"] for f in hit.json()["results"]], [self.movies[0].pk])
+
+        # Bob never gets Alice's cached page
+        bob = self.get(self.bob, "/api/favorites/")
+        self.assertEqual(bob["X-Cache"], "MISS")
+        self.assertEqual([f["movie"] for f in bob.json()["results"]], [self.movies[1].pk])
+
+    def test_page_is_part_of_the_key(self):
+        FavoriteActivity.objects.bulk_create(
+            FavoriteActivity(user=self.alice, movie=movie, action="added") for movie in self.movies
+        )
+        path = "/api/favorites/recently-added/"
+        self.assertEqual(len(self.get(self.alice, path).json()["results"]), 10)
+        second = self.get(self.alice, path, {"page": 2})
+        self.assertEqual((second["X-Cache"], len(second.json()["results"])), ("MISS", 2))
+        self.assertEqual(self.get(self.alice, path, {"page": 2})["X-Cache"], "HIT")
+
+    def test_writes_invalidate_only_the_writers_pages(self):
+        for path in ("/api/favorites/", "/api/watchlist/"):
+            self.get(self.alice, path)
+            self.get(self.bob, path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteMovie.objects.create(user=self.alice, movie=self.movies[2])
+            Watchlist.objects.create(user=self.alice, movie=self.movies[2])
+
+        favorites = self.get(self.alice, "/api/favorites/")
+        self.assertEqual(favorites["X-Cache"], "MISS")
+        self.assertEqual(len(favorites.json()["results"]), 2)
+        self.assertEqual(self.get(self.alice, "/api/watchlist/")["X-Cache"], "MISS")
+        for path in ("/api/favorites/", "/api/watchlist/"):
+            self.assertEqual(self.get(self.bob, path)["X-Cache"], "HIT")
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class BulkLibraryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice", password="x")
+        self.movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(2000, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(1, 41)
+        ]
+        self.addCleanup(activity_buffer.flush)
+
+    def post(self, path, items):
+        return self.client.post(path, {"items": items}, content_type="application/json",
+                                HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_bulk_favorites_report_a_result_per_item(self):
+        FavoriteMovie.objects.create(user=self.user, movie=self.movies[0])
+        response = self.post("/api/favorites/bulk/", [
+            {"tmdb_id": 1},
+            {"tmdb_id": 2, "action": "remove"},
+            {"tmdb_id": 2},
+            {"tmdb_id": 3, "action": "remove"},
+            {"tmdb_id": 9999},
+            {"tmdb_id": "abc"},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["status"] for r in response.json()["results"]],
+                         ["updated", "skipped", "created", "not_found", "created", "invalid"])
+        self.assertEqual(set(FavoriteMovie.objects.filter(user=self.user).values_list("movie__tmdb_id", flat=True)),
+                         {1, 2, 9999})
+        new_movie = Movie.objects.get(tmdb_id=9999)
+        self.assertEqual(new_movie.enrichment_status, Movie.ENRICHMENT_PENDING)
+
+    def test_bulk_ratings_cost_the_same_queries_for_any_batch_size(self):
+        def rate(movies, rating):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post("/api/movies/rate/bulk/",
+                                     [{"tmdb_id": m.tmdb_id, "rating": rating} for m in movies])
+            self.assertEqual(response.status_code, 200)
+            return response.json()["results"], len(queries)
+
+        _, few = rate(self.movies[:3], 4)
+        results, many = rate(self.movies[3:], 4)
+        self.assertEqual(few, many)
+        self.assertEqual({r["status"] for r in results}, {"created"})
+
+        # Re-rating updates the aggregates by the difference only
+        results, _ = rate(self.movies[:2], 2)
+        self.assertEqual([r["status"] for r in results], ["updated", "updated"])
+        self.assertEqual((results[0]["average_rating"], results[0]["ratings_count"]), (2.0, 1))
+        movie = Movie.objects.get(pk=self.movies[2].pk)
+        self.assertEqual((movie.ratings_sum, movie.ratings_count, movie.average_rating), (4, 1, 4.0))
+        self.assertEqual(MovieRating.objects.filter(user=self.user).count(), 40)
+
+    def test_caches_are_invalidated_once_the_batch_commits(self):
+        version = namespace_version(MOVIES_NAMESPACE)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.post("/api/movies/rate/bulk/", [{"tmdb_id": 1, "rating": 4}, {"tmdb_id": 9999, "rating": 2}])
+        # A reader during the transaction would still cache under the old version
+        self.assertEqual(namespace_version(MOVIES_NAMESPACE), version)
+
+        for callback in callbacks:
+            callback()
+        self.assertGreater(namespace_version(MOVIES_NAMESPACE), version)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user("alice", password="x")
+        self.bob = User.objects.create_user("bob", password="x")
+        self.movie = Movie.objects.create(tmdb_id=1, title="Movie 1", release_date=date(2000, 1, 1),
+                                          poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+
+    def aggregates(self, movie):
+        movie.refresh_from_db(fields=Movie.AGGREGATE_FIELDS)
+        return movie.ratings_sum, movie.ratings_count, movie.average_rating
+
+    def test_saving_a_stale_movie_keeps_newer_aggregates(self):
+        stale = Movie.objects.get(pk=self.movie.pk)
+        MovieRating.objects.create(user=self.alice, movie=self.movie, rating=4)
+
+        stale.title = "Renamed"
+        stale.save()
+
+        self.assertEqual(self.aggregates(stale), (4, 1, 4.0))
+        self.assertEqual(Movie.objects.get(pk=self.movie.pk).title, "Renamed")
+
+        # Also when the fields to write are given, by keyword or positionally
+        MovieRating.objects.create(user=self.bob, movie=self.movie, rating=2)
+        stale.save(update_fields=["title", "ratings_sum", "ratings_count", "average_rating"])
+        stale.save(False, False, None, ["title", "ratings_sum"])
+        self.assertEqual(self.aggregates(Movie.objects.get(pk=self.movie.pk)), (6, 2, 3.0))
+
+    def test_reconcile_corrects_drifted_rows_only(self):
+        other = Movie.objects.create(tmdb_id=2, title="Movie 2", release_date=date(2000, 1, 1),
+                                     poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+        MovieRating.objects.create(user=self.alice, movie=self.movie, rating=4)
+        MovieRating.objects.create(user=self.bob, movie=self.movie, rating=1)
+        Movie.objects.filter(pk=self.movie.pk).update(ratings_sum=99, ratings_count=7, average_rating=1.0)
+        Movie.objects.filter(pk=other.pk).update(ratings_sum=3, ratings_count=1, average_rating=3.0)
+
+        self.assertEqual(ratings.reconcile_rating_aggregates(), 2)
+        self.assertEqual(self.aggregates(self.movie), (5, 2, 2.5))
+        self.assertEqual(self.aggregates(other), (0, 0, None))
+        self.assertEqual(ratings.reconcile_rating_aggregates(), 0)
+
+    def test_reconcile_keeps_a_rating_saved_after_its_read(self):
+        MovieRating.objects.create(user=self.alice, movie=self.movie, rating=4)
+        Movie.objects.filter(pk=self.movie.pk).update(ratings_sum=0, ratings_count=0, average_rating=None)
+
+        def rate_meanwhile(aggregate):
+            # Bob's rating lands between the drift scan and the UPDATE
+            if not MovieRating.objects.filter(user=self.bob).exists():
+                MovieRating.objects.create(user=self.bob, movie=self.movie, rating=2)
+            return rating_aggregate(aggregate)
+
+        rating_aggregate = ratings.rating_aggregate
+        with mock.patch.object(ratings, "rating_aggregate", side_effect=rate_meanwhile):
+            self.assertEqual(ratings.reconcile_rating_aggregates([self.movie.pk]), 1)
+
+        self.assertEqual(self.aggregates(self.movie), (6, 2, 3.0))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False, LIBRARY_SYNC_OVERLAP=0)
+class LibraryChangesTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice", password="x")
+        self.movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(2000, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(1, 5)
+        ]
+        FavoriteMovie.objects.create(user=self.user, movie=self.movies[0])
+        Watchlist.objects.create(user=self.user, movie=self.movies[1])
+
+    def changes(self, since=None):
+        params = {"since": since} if since else {}
+        return self.client.get("/api/me/library/changes/", params,
+                               HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_delta_sync_returns_only_changes_and_tombstones(self):
+        full = self.changes().json()
+        self.assertTrue(full["full"])
+        self.assertEqual([r["tmdb_id"] for r in full["favorites"]["upserted"]], [1])
+        self.assertEqual([r["tmdb_id"] for r in full["watchlist"]["upserted"]], [2])
+
+        FavoriteMovie.objects.create(user=self.user, movie=self.movies[2])
+        MovieRating.objects.create(user=self.user, movie=self.movies[0], rating=5)
+        Watchlist.objects.filter(user=self.user).delete()
+
+        delta = self.changes(full["token"]).json()
+        self.assertFalse(delta["full"])
+        self.assertEqual([r["tmdb_id"] for r in delta["favorites"]["upserted"]], [3])
+        self.assertEqual(delta["watchlist"], {"upserted": [], "removed": [2]})
+        self.assertEqual([(r["tmdb_id"], r["rating"]) for r in delta["ratings"]["upserted"]], [(1, 5)])
+
+        # Nothing new: the JWT user lookup plus one indexed range scan per table
+        with self.assertNumQueries(5):
+            steady = self.changes(delta["token"]).json()
+        for key in ("favorites", "watchlist", "ratings"):
+            self.assertEqual(steady[key], {"upserted": [], "removed": []})
+
+    def test_removed_and_re_added_entries_are_upserts(self):
+        token = self.changes().json()["token"]
+        FavoriteMovie.objects.filter(user=self.user).delete()
+        FavoriteMovie.objects.create(user=self.user, movie=self.movies[0])
+
+        favorites = self.changes(token).json()["favorites"]
+        self.assertEqual(([r["tmdb_id"] for r in favorites["upserted"]], favorites["removed"]), ([1], []))
+
+    def test_entries_of_deleted_movies_are_reported_removed(self):
+        token = self.changes().json()["token"]
+        self.movies[0].delete()
+
+        favorites = self.changes(token).json()["favorites"]
+        self.assertEqual(favorites, {"upserted": [], "removed": [1]})
+
+    def test_tombstones_without_a_tmdb_id_are_skipped(self):
+        token = self.changes().json()["token"]
+        Watchlist.objects.filter(user=self.user).delete()
+        LibraryTombstone.objects.create(user=self.user, movie_id=999, kind=LibraryTombstone.WATCHLIST)
+
+        response = self.changes(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["watchlist"]["removed"], [2])
+
+    def test_bad_and_expired_tokens(self):
+        self.assertEqual(self.changes("not-a-token").status_code, 400)
+        other = get_user_model().objects.create_user("bob", password="x")
+        self.assertEqual(self.changes(make_token(other.id, timezone.now())).status_code, 400)
+        expired = make_token(self.user.id, timezone.now() - timedelta(days=365))
+        self.assertEqual(self.changes(expired).status_code, 410)
+
+
+@skipUnless(connection.vendor == "sqlite", "plans are read with SQLite's EXPLAIN QUERY PLAN")
+@override_settings(CACHES=LOCMEM_CACHES, TMDB_ENRICHMENT_ENABLED=False)
+class LibraryQueryPlanTests(QueryPlanAssertions, TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice", password="x")
+        movies = [
+            Movie.objects.create(tmdb_id=tmdb_id, title=f"Movie {tmdb_id}", release_date=date(2000, 1, 1),
+                                 poster_url="https://image.tmdb.org/t/p/w500/x.jpg")
+            for tmdb_id in range(1, 31)
+        ]
+        for movie in movies[:20]:
+            FavoriteMovie.objects.create(user=self.user, movie=movie)
+            Watchlist.objects.create(user=self.user, movie=movie)
+            FavoriteActivity.objects.create(user=self.user, movie=movie, action="added")
+            FavoriteActivity.objects.create(user=self.user, movie=movie, action="removed")
+
+    def test_library_lists_read_in_index_order(self):
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+        for path in ("/api/favorites/", "/api/favorites/?pagination=cursor", "/api/favorites/?tmdb_id=5",
+                     "/api/favorites/recently-added/", "/api/favorites/recently-removed/?pagination=cursor",
+                     "/api/watchlist/", "/api/me/library/changes/"):
+            self.assertPlansUseIndexes(path, **auth)
+
+    def test_activity_lists_run_no_repeated_queries(self):
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=1), \
+                self.assertLogs("movie_backend.middleware", "INFO") as logs:
+            for path in ("/api/favorites/recently-added/", "/api/favorites/recently-removed/"):
+                response = self.client.get(path, **auth)
+                self.assertEqual(len(response.json()["results"]), 10)
+        self.assertEqual([record.levelname for record in logs.records], ["INFO", "INFO"])
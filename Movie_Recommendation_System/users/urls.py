@@ -8,7 +8,11 @@ from .views import (RegisterView,
                     RecentlyAddedFavoritesView,
                     RecentlyRemovedFavoritesView,
                     WatchlistRemoveView,
-                    WatchlistView
+                    WatchlistView,
+                    BulkFavoritesView,
+                    BulkWatchlistView,
+                    BulkRateMoviesView,
+                    LibraryChangesView
                     )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
@@ -21,17 +25,23 @@ urlpatterns = [
 
     #movie rating
     path('movies/rate/', RateMovieView.as_view(), name='rate-movie'),
+    path('movies/rate/bulk/', BulkRateMoviesView.as_view(), name='rate-movie-bulk'),
 
     #watch list
     path('watchlist/', WatchlistView.as_view(), name='watchlist'),
     path('watchlist/create/', WatchlistView.as_view(), name='watchlist'),
     path('watchlist/<int:pk>', WatchlistRemoveView.as_view(), name='watchlist-remove'),
+    path('watchlist/bulk/', BulkWatchlistView.as_view(), name='watchlist-bulk'),
     
     # Favorites
     path('favorites/', FavoriteMovieListView.as_view(), name="favorite-movie-list"),
     path('favorites/create/', FavoriteMovieListCreateView.as_view(), name='favorite-list-create'),
     path('favorites/add/', AddFavoriteMovieView.as_view(), name="favorite-add"),
+    path('favorites/bulk/', BulkFavoritesView.as_view(), name="favorite-bulk"),
     path('favorites/<int:movie_id>', FavoriteMovieDeleteView.as_view(), name='favorite-delete'),
     path("favorites/recently-added/", RecentlyAddedFavoritesView.as_view(), name="recently-added-favorites"),
     path("favorites/recently-removed/", RecentlyRemovedFavoritesView.as_view(), name="recently-removed-favorites"),
+
+    # Delta sync
+    path('me/library/changes/', LibraryChangesView.as_view(), name='library-changes'),
 ]
\ No newline at end of file
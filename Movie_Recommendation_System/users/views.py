@@ -1,18 +1,20 @@
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
 from django.conf import settings
-from django.db.models import Avg, Count
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from movies.pagination import LargeResultsSetPagination,FavoriteActivityPagination
+from movies.caching import CachedUserListMixin, bump_namespace_on_commit
+from movies.pagination import FavoriteMoviePagination,FavoriteActivityPagination
 from rest_framework.views import APIView
 from rest_framework import generics, permissions, status, filters
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .filters import FavoriteMovieFilter
+from .library import favorites_changed, ratings_changed, watchlist_changed
+from .sync import SyncTokenError, SyncTokenExpired, library_changes, read_token
 from .models import (FavoriteMovie,MovieRating,
                      FavoriteActivity,Watchlist,Movie)
 
@@ -21,7 +23,11 @@ from .serializers import (RegisterSerializer,
                           FavoriteMovieSerializer,
                           MovieRatingSerializer,
                           FavoriteActivitySerializer,
-                          WatchlistSerializer)
+                          WatchlistSerializer,
+                          BulkLibraryItemSerializer,
+                          BulkLibrarySerializer,
+                          BulkRatingItemSerializer,
+                          BulkRatingSerializer)
 
 User = get_user_model()
 CACHE_TIMEOUT = getattr(settings, "CACHE_TIMEOUT", 60 * 5)
@@ -70,6 +76,7 @@ class FavoriteMovieListCreateView(generics.ListCreateAPIView):
     Requires JWT authentication.
     """
     serializer_class = FavoriteMovieSerializer
+    pagination_class = FavoriteMoviePagination
     permission_classes = [permissions.IsAuthenticated]
     @swagger_auto_schema(
         operation_description="Get a list of your favorite movies.",
@@ -105,13 +112,15 @@ class AddFavoriteMovieView(APIView):
         return Response(FavoriteMovieSerializer(favorite).data)
 
 
-class FavoriteMovieListView(generics.ListAPIView):
+class FavoriteMovieListView(CachedUserListMixin, generics.ListAPIView):
     """
     List a user's favorite movies with optional filtering.
     """
+    cache_namespace = "favorites"
+    cache_timeout = CACHE_TIMEOUT
     serializer_class = FavoriteMovieSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = LargeResultsSetPagination
+    pagination_class = FavoriteMoviePagination
 
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = FavoriteMovieFilter
@@ -120,19 +129,8 @@ class FavoriteMovieListView(generics.ListAPIView):
 
     def get_queryset(self):
         # Only return the authenticated user's favorites
-        cache_key = f"favorites_{self.request.user.id}_{self.request.get_full_path()}"
-        cached_qs = cache.get(cache_key)
-        if cached_qs is not None:
-            return cached_qs
-        queryset = FavoriteMovie.objects.filter(user=self.request.user).select_related('movie')
-
-        # Optional search filter on title
-        title = self.request.query_params.get('title')
-        if title:
-            queryset = queryset.filter(title__icontains=title)
-
-        cache.set(cache_key, queryset, CACHE_TIMEOUT)
-        return queryset
+        # (rendered pages are cached by CachedUserListMixin)
+        return FavoriteMovie.objects.filter(user=self.request.user).select_related('movie')
     @swagger_auto_schema(
         operation_description="Get favorite movies. Optional filtering by title or TMDB ID.",
         tags=["movies"],
@@ -143,14 +141,12 @@ class FavoriteMovieListView(generics.ListAPIView):
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
-    @staticmethod
-    def invalidate_user_cache(user_id):
+    @classmethod
+    def invalidate_user_cache(cls, user_id):
         """
-        Clears all cache entries for this user's favorites.
+        Invalidates all cached pages of this user's favorites (one INCR, after commit).
         """
-        # If you use a consistent prefix for all favorites cache keys,
-        # you can delete them by pattern if supported by your cache backend.
-        cache.delete_pattern(f"favorites_{user_id}_*")
+        bump_namespace_on_commit(cls.user_namespace(user_id))
 
 class FavoriteMovieDeleteView(APIView):
     """
@@ -211,26 +207,33 @@ class RateMovieView(generics.CreateAPIView):
 
         if not tmdb_id or not rating:
             return Response({"detail": "tmdb_id and rating are required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rating = int(rating)
+        except (TypeError, ValueError):
+            rating = None
+        if rating is None or not 1 <= rating <= 5:
+            return Response({"detail": "Rating must be between 1 and 5."}, status=status.HTTP_400_BAD_REQUEST)
 
         movie = get_object_or_404(Movie, tmdb_id=tmdb_id)
 
-        MovieRating.objects.update_or_create(
-            user=request.user,
-            movie=movie,
-            defaults={'rating': rating}
-        )
-
-        stars = MovieRating.objects.filter(movie=movie).aggregate(
-            average_rating=Avg('rating'),
-            ratings_count=Count('id')
-        )
+        # Movie's rating aggregates are kept up to date by users.signals
+        with transaction.atomic():
+            MovieRating.lock_user(request.user.id)
+            MovieRating.objects.update_or_create(
+                user=request.user,
+                movie=movie,
+                defaults={'rating': rating}
+            )
+        movie.refresh_from_db(fields=['average_rating', 'ratings_count'])
 
         return Response({
             "message": "Rating saved successfully",
-            "average_rating": round(stars['average_rating'], 2) if stars['average_rating'] else None,
-            "ratings_count": stars['ratings_count']
+            "average_rating": round(movie.average_rating, 2) if movie.average_rating is not None else None,
+            "ratings_count": movie.ratings_count
         }, status=status.HTTP_200_OK)
-class RecentlyAddedFavoritesView(generics.ListAPIView):
+class RecentlyAddedFavoritesView(CachedUserListMixin, generics.ListAPIView):
+    cache_namespace = "favorites"
+    cache_timeout = CACHE_TIMEOUT
     serializer_class = FavoriteActivitySerializer
     pagination_class = FavoriteActivityPagination
     permission_classes = [permissions.IsAuthenticated]
@@ -245,6 +248,12 @@ class RecentlyAddedFavoritesView(generics.ListAPIView):
             ),
             openapi.Parameter(
                 'page_size', openapi.IN_QUERY, description="Number of items per page (max 50)", type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                'pagination', openapi.IN_QUERY, description="Set to 'cursor' for keyset pagination", type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'cursor', openapi.IN_QUERY, description="Opaque cursor from a previous page's 'next' link", type=openapi.TYPE_STRING
             )
         ]
     )
@@ -254,9 +263,11 @@ class RecentlyAddedFavoritesView(generics.ListAPIView):
         return FavoriteActivity.objects.filter(
             user=self.request.user,
             action='added'
-        )[:10]  # latest 10
+        ).select_related('movie')
 
-class RecentlyRemovedFavoritesView(generics.ListAPIView):
+class RecentlyRemovedFavoritesView(CachedUserListMixin, generics.ListAPIView):
+    cache_namespace = "favorites"
+    cache_timeout = CACHE_TIMEOUT
     serializer_class = FavoriteActivitySerializer
     pagination_class = FavoriteActivityPagination
     permission_classes = [permissions.IsAuthenticated]
@@ -270,6 +281,12 @@ class RecentlyRemovedFavoritesView(generics.ListAPIView):
             ),
             openapi.Parameter(
                 'page_size', openapi.IN_QUERY, description="Number of items per page (max 50)", type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                'pagination', openapi.IN_QUERY, description="Set to 'cursor' for keyset pagination", type=openapi.TYPE_STRING
+            ),
+            openapi.Parameter(
+                'cursor', openapi.IN_QUERY, description="Opaque cursor from a previous page's 'next' link", type=openapi.TYPE_STRING
             )
         ]
     )
@@ -280,9 +297,11 @@ class RecentlyRemovedFavoritesView(generics.ListAPIView):
         return FavoriteActivity.objects.filter(
             user=self.request.user,
             action='removed'
-        )[:10]
+        ).select_related('movie')
     
-class WatchlistView(generics.ListCreateAPIView):
+class WatchlistView(CachedUserListMixin, generics.ListCreateAPIView):
+    cache_namespace = "watchlist"
+    cache_timeout = CACHE_TIMEOUT
     serializer_class = WatchlistSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -315,3 +334,199 @@ class WatchlistRemoveView(generics.DestroyAPIView):
         return super().delete(request, *args, **kwargs)
     def get_queryset(self):
         return Watchlist.objects.filter(user=self.request.user)
+
+
+class BulkLibraryView(APIView):
+    """
+    Base for the batch endpoints used by clients replaying an offline queue.
+
+    Each item is validated on its own, every movie is resolved with one IN
+    query (missing ones are created in bulk and enriched from TMDb in the
+    background) and the writes are batched by the subclass's
+    `apply(user, entries)`, which gets [(movie, validated item)] and returns
+    {tmdb_id: result dict}. The response has one result per item, in request
+    order. When the same movie appears more than once the last item wins and
+    the earlier ones are reported as skipped.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    item_serializer_class = None
+    max_items = 500
+
+    def post(self, request):
+        items = request.data.get("items") if isinstance(request.data, dict) else None
+        if not isinstance(items, list):
+            return Response({"detail": "Expected {\"items\": [...]}."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_items:
+            return Response({"detail": f"At most {self.max_items} items per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = [None] * len(items)
+        latest = {}  # tmdb_id -> (index, validated item)
+        for index, item in enumerate(items):
+            serializer = self.item_serializer_class(data=item)
+            if not serializer.is_valid():
+                tmdb_id = item.get("tmdb_id") if isinstance(item, dict) else None
+                results[index] = {"tmdb_id": tmdb_id, "status": "invalid", "errors": serializer.errors}
+                continue
+            tmdb_id = serializer.validated_data["tmdb_id"]
+            if tmdb_id in latest:
+                results[latest[tmdb_id][0]] = {"tmdb_id": tmdb_id, "status": "skipped",
+                                               "detail": "Superseded by a later item for the same movie."}
+            latest[tmdb_id] = (index, serializer.validated_data)
+
+        if latest:
+            with transaction.atomic():
+                movies = Movie.bulk_get_or_create(list(latest))
+                outcomes = self.apply(request.user, [(movies[t], data) for t, (_, data) in latest.items()])
+            for tmdb_id, (index, _) in latest.items():
+                results[index] = {"tmdb_id": tmdb_id, **outcomes[tmdb_id]}
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class BulkFavoritesView(BulkLibraryView):
+    item_serializer_class = BulkLibraryItemSerializer
+
+    @swagger_auto_schema(
+        operation_description="Add or remove many favorites at once (offline sync). Returns one result per "
+                              "item: created, updated, removed, not_found, skipped or invalid.",
+        request_body=BulkLibrarySerializer,
+        tags=["Favorites"]
+    )
+    def post(self, request):
+        return super().post(request)
+
+    def apply(self, user, entries):
+        existing = set(FavoriteMovie.objects.filter(user=user, movie_id__in=[m.id for m, _ in entries])
+                       .values_list("movie_id", flat=True))
+        add = [movie for movie, item in entries if item["action"] == "add"]
+        remove = [movie.id for movie, item in entries if item["action"] == "remove" and movie.id in existing]
+
+        FavoriteMovie.objects.bulk_create(
+            [FavoriteMovie(user=user, movie=movie) for movie in add],
+            update_conflicts=True, unique_fields=["user", "movie"], update_fields=["updated_at"],
+        )
+        if add:
+            favorites_changed(user.id, added=[movie.id for movie in add if movie.id not in existing])
+        if remove:
+            # Per-row post_delete signals do the same bookkeeping for removals
+            FavoriteMovie.objects.filter(user=user, movie_id__in=remove).delete()
+
+        outcomes = {}
+        for movie, item in entries:
+            if item["action"] == "add":
+                state = "updated" if movie.id in existing else "created"
+            else:
+                state = "removed" if movie.id in existing else "not_found"
+            outcomes[movie.tmdb_id] = {"status": state}
+        return outcomes
+
+
+class BulkWatchlistView(BulkLibraryView):
+    item_serializer_class = BulkLibraryItemSerializer
+
+    @swagger_auto_schema(
+        operation_description="Add or remove many watchlist entries at once (offline sync). Returns one result "
+                              "per item: created, unchanged, removed, not_found, skipped or invalid.",
+        request_body=BulkLibrarySerializer,
+        tags=["watchlist"]
+    )
+    def post(self, request):
+        return super().post(request)
+
+    def apply(self, user, entries):
+        existing = set(Watchlist.objects.filter(user=user, movie_id__in=[m.id for m, _ in entries])
+                       .values_list("movie_id", flat=True))
+        add = [movie for movie, item in entries if item["action"] == "add" and movie.id not in existing]
+        remove = [movie.id for movie, item in entries if item["action"] == "remove" and movie.id in existing]
+
+        # Nothing to update on an existing entry: keep its added_at
+        Watchlist.objects.bulk_create([Watchlist(user=user, movie=movie) for movie in add], ignore_conflicts=True)
+        if add:
+            watchlist_changed(user.id)
+        if remove:
+            # Per-row post_delete signals do the same bookkeeping for removals
+            Watchlist.objects.filter(user=user, movie_id__in=remove).delete()
+
+        outcomes = {}
+        for movie, item in entries:
+            if item["action"] == "add":
+                state = "unchanged" if movie.id in existing else "created"
+            else:
+                state = "removed" if movie.id in existing else "not_found"
+            outcomes[movie.tmdb_id] = {"status": state}
+        return outcomes
+
+
+class BulkRateMoviesView(BulkLibraryView):
+    item_serializer_class = BulkRatingItemSerializer
+
+    @swagger_auto_schema(
+        operation_description="Rate many movies at once (offline sync); existing ratings are updated. Returns "
+                              "one result per item with the movie's new average rating.",
+        request_body=BulkRatingSerializer,
+        tags=["Ratings"]
+    )
+    def post(self, request):
+        return super().post(request)
+
+    def apply(self, user, entries):
+        # Held until commit, so `existing` stays true for the upsert below
+        MovieRating.lock_user(user.id)
+        existing = dict(MovieRating.objects.filter(user=user, movie_id__in=[m.id for m, _ in entries])
+                        .values_list("movie_id", "rating"))
+        changed = [(movie, item["rating"]) for movie, item in entries
+                   if existing.get(movie.id) != item["rating"]]
+
+        MovieRating.objects.bulk_create(
+            [MovieRating(user=user, movie=movie, rating=rating) for movie, rating in changed],
+            update_conflicts=True, unique_fields=["user", "movie"], update_fields=["rating", "updated_at"],
+        )
+        if changed:
+            ratings_changed(user.id, {
+                movie.id: (rating - existing[movie.id], 0) if movie.id in existing else (rating, 1)
+                for movie, rating in changed
+            })
+
+        aggregates = Movie.objects.in_bulk([m.id for m, _ in entries])
+        outcomes = {}
+        for movie, item in entries:
+            if movie.id not in existing:
+                state = "created"
+            else:
+                state = "unchanged" if existing[movie.id] == item["rating"] else "updated"
+            average = aggregates[movie.id].average_rating
+            outcomes[movie.tmdb_id] = {
+                "status": state,
+                "rating": item["rating"],
+                "average_rating": round(average, 2) if average is not None else None,
+                "ratings_count": aggregates[movie.id].ratings_count,
+            }
+        return outcomes
+
+
+class LibraryChangesView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="Delta sync of your favorites, watchlist and ratings. Without `since` the whole "
+                              "library is returned; with the `token` of a previous response only what was "
+                              "added, changed (`upserted`) or deleted (`removed`, TMDb IDs) since then. "
+                              "410 means the token is too old: sync again without it.",
+        manual_parameters=[
+            openapi.Parameter('since', openapi.IN_QUERY, description="Sync token from the previous response",
+                              type=openapi.TYPE_STRING)
+        ],
+        tags=["Sync"]
+    )
+    def get(self, request):
+        since = None
+        token = request.query_params.get("since")
+        if token:
+            try:
+                since = read_token(request.user.id, token)
+            except SyncTokenExpired as e:
+                return Response({"detail": str(e)}, status=status.HTTP_410_GONE)
+            except SyncTokenError as e:
+                return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(library_changes(request.user, since))